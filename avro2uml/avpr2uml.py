@@ -13,8 +13,19 @@ Re-uses sample code and documentation from
 <http://users.soe.ucsc.edu/~karplus/bme205/f12/Scaffold.html>
 """
 
-import argparse, sys, os, itertools, re, json, textwrap
-import url_converter
+import argparse, sys, os, itertools, re, json, textwrap, hashlib
+import url_converter, edge_store, schema_catalog, schema_graph, detail_levels, schema_inputs
+
+# The Avro primitive types. Everything else is a user-defined type.
+PRIMITIVE_TYPES = ["int", "long", "string", "boolean", "float", "double",
+    "null", "bytes"]
+
+# The dot attributes of --summary edges of each kind, like the containment and
+# reference edges they stand for, but thinner.
+SUMMARY_EDGE_STYLES = {
+    "containment": "arrowtail=odiamond, arrowhead=none, style=solid, color=\"#C55A11\"",
+    "reference": "arrowtail=none, arrowhead=vee, style=dashed, color=\"darkgreen\"",
+}
 
 def parse_args(args):
     """
@@ -40,21 +51,66 @@ def parse_args(args):
     # Now add all the options to it
     # Note: avprs is now an optional argument. One of --avprs or --clusters must be specified, however.
     group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument("--avprs", type=argparse.FileType("r"), default=None, nargs='*',
-        help="the AVPR file(s) to read")
+    group.add_argument("--avprs", type=schema_inputs.input_path, default=None, nargs='*',
+        help="the AVPR file(s) to read, which can be compressed (.gz, .bz2) or archives of them (.tar.gz, .zip, ...)")
     group.add_argument("--clusters", type=str, default=None,
         help="List of original clusters/avdl files as a space-separated string, in imported order")
+    parser.add_argument("--members", type=str, nargs="+", default=["*.avpr"],
+        help="only read the files in --avprs archives whose names match one of these patterns")
+    parser.add_argument("--avpr_dir", type=str, default=None,
+        help="directory or archive to read the --clusters .avpr files from (default: ./schemas_avpr)")
     parser.add_argument("--dot", type=argparse.FileType("w"),
         help="GraphViz file to write a UML diagram to")
     parser.add_argument("--urls", type=argparse.FileType("r"),
         help="File with schema url's")
     parser.add_argument("--type_comments", type=argparse.FileType("r"),
         help="tab-delimited file with type names and type header comments")
-
-
-    return parser.parse_args(args)
-
-def type_to_string(parsed_type, namespace=None, strip_namespace=False):
+    parser.add_argument("--stream", action="store_true",
+        help="write each node as soon as it is parsed, and keep edges and clusters in a temporary SQLite file instead of in memory")
+    parser.add_argument("--store_dir", type=str, default=None,
+        help="directory for the temporary SQLite file used by --stream")
+    parser.add_argument("--catalog", type=str, default=None,
+        help="SQLite file to keep parsed schemas in between runs, so that only new or changed .avpr files are parsed again")
+    parser.add_argument("--parts", type=str, default=None,
+        help="directory to also write each unconnected part of the diagram to, as its own .dot file for render_uml.py --parts")
+    parser.add_argument("--layout_hints", action="store_true",
+        help="write clusters in --clusters order and types from containers down to what they contain, so dot has less to rearrange (for render_uml.py --profile)")
+    parser.add_argument("--detail", type=str, default="full", choices=detail_levels.DETAIL_LEVELS,
+        help="draw types as full tables, with only the fields that have edges, or as just a header")
+    parser.add_argument("--detail_file", type=argparse.FileType("r"),
+        help="tab-delimited file with .avdl file or type names and the --detail level for them")
+    parser.add_argument("--cycles", type=str, default=None, choices=schema_graph.CYCLE_MODES,
+        help="find types that contain or reference each other in a cycle, report them, and either break each cycle at one edge or draw it as a group, so dot doesn't have to untangle it")
+    parser.add_argument("--summary", type=int, default=None, metavar="K",
+        help="draw an overview with only the K most central types, and an \"N more types\" box per .avdl file for the rest")
+    parser.add_argument("--summary_per_cluster", action="store_true",
+        help="with --summary, keep the K most central types of each .avdl file instead of overall")
+    parser.add_argument("--centrality", type=str, default="degree", choices=schema_graph.CENTRALITY_MEASURES,
+        help="how --summary picks the most central types: by their number of edges, or by PageRank over containments and references")
+
+    options = parser.parse_args(args)
+    if options.stream and options.clusters is None:
+        parser.error("--stream needs --clusters")
+    if options.stream and options.catalog is not None:
+        parser.error("--stream and --catalog can't be used together")
+    if options.stream and options.parts is not None:
+        parser.error("--stream and --parts can't be used together")
+    if options.layout_hints and options.clusters is None:
+        parser.error("--layout_hints needs --clusters")
+    if options.stream and options.layout_hints:
+        parser.error("--stream and --layout_hints can't be used together")
+    if options.stream and (options.detail != "full" or options.detail_file is not None):
+        parser.error("--stream can only draw types in full")
+    if options.stream and options.cycles is not None:
+        parser.error("--stream and --cycles can't be used together")
+    if options.summary is not None and (options.stream or options.parts is not None):
+        parser.error("--summary can't be used with --stream or --parts")
+    if options.summary is not None and options.summary < 1:
+        parser.error("--summary has to keep at least 1 type")
+
+    return options
+
+def type_to_string(parsed_type, namespace=None, strip_namespace=False, symbols=None):
     """
     Given the JSON representation of a field type (a string naming an Avro
     primitive type, a string naming a qualified user-defiend type, a string
@@ -65,12 +121,15 @@ def type_to_string(parsed_type, namespace=None, strip_namespace=False):
 
     If strip_namespace is specified, namespace info will be stripped out.
 
+    If a symbol table from build_symbol_table() is given, user types are looked
+    up in it, so that partially qualified names come out right.
+
     """
 
     if isinstance(parsed_type, list):
         # It's a union. Recurse on each unioned element.
         return ("union<" + ",".join([type_to_string(x, namespace,
-            strip_namespace) for x in parsed_type]) + ">")
+            strip_namespace, symbols) for x in parsed_type]) + ">")
     elif isinstance(parsed_type, dict):
         # It's an array or map.
 
@@ -86,37 +145,38 @@ def type_to_string(parsed_type, namespace=None, strip_namespace=False):
                 parsed_type["type"]))
 
         return (parsed_type["type"] + "<" +
-            type_to_string(recurse_on, namespace, strip_namespace) + ">")
-    elif parsed_type in ["int", "long", "string", "boolean", "float", "double",
-        "null", "bytes"]:
+            type_to_string(recurse_on, namespace, strip_namespace, symbols) + ">")
+    elif parsed_type in PRIMITIVE_TYPES:
         # If it's a primitive type, return it.
         return parsed_type
-    elif "." in parsed_type:
-        # It has a dot, so assume it's fully qualified. TODO: Handle partially
-        # qualified types, where we have to check if this type actually exists.
-
-        parts = parsed_type.split(".")
+    else:
+        # It's a user type. If we can, find out which type it really is.
+        if symbols is not None:
+            resolved = resolve_type_name(parsed_type, namespace, symbols)
+            if resolved is not None:
+                parsed_type = resolved
 
-        parsed_namespace = ".".join(parts[:-1])
+        if "." in parsed_type:
+            # It has a dot, so it's (at least partially) qualified.
+            parts = parsed_type.split(".")
 
-        if strip_namespace or parsed_namespace == namespace:
-            # Pull out the namespace, sicne we don't want/don't need it
-            parsed_type = [-1]
+            parsed_namespace = ".".join(parts[:-1])
 
-        return parsed_type
-    else:
-        # Just interpret it in our namespace. Don't fully qualify it.
+            if strip_namespace or parsed_namespace == namespace:
+                # Pull out the namespace, sicne we don't want/don't need it
+                parsed_type = parts[-1]
 
         # Then give back the type name
         return parsed_type
 
-def find_user_types(parsed_type, namespace=None):
+def find_user_types(parsed_type):
     """
     Given the JSON representation of a field type (a string naming an Avro
     primitive type, a string naming a qualified user-defiend type, a string
     naming a non-qualified user-defined type, a list of types being unioned
     together, or a dict with a "type" of "array" or "map" and an "items"
-    defining a type), yield all of the user types it references.
+    defining a type), yield all of the user type names it references, as they
+    are written. Use resolve_type_name() to find out which types they are.
 
     """
 
@@ -124,7 +184,7 @@ def find_user_types(parsed_type, namespace=None):
         # It's a union.
         for option in parsed_type:
             # Recurse on each unioned element.
-            for found in find_user_types(option, namespace):
+            for found in find_user_types(option):
                 # And yield everything we find there.
                 yield found
     elif isinstance(parsed_type, dict):
@@ -141,26 +201,102 @@ def find_user_types(parsed_type, namespace=None):
             raise RuntimeError("Invalid template {}".format(
                 parsed_type["type"]))
 
-        for found in find_user_types(recurse_on, namespace):
+        for found in find_user_types(recurse_on):
             # Yield everything we find in there.
             yield found
-    elif parsed_type in ["int", "long", "string", "boolean", "float", "double",
-        "null", "bytes"]:
+    elif parsed_type in PRIMITIVE_TYPES:
         # If it's a primitive type, skip it.
         pass
-    elif "." in parsed_type:
-        # It has a dot, so assume it's fully qualified. TODO: Handle partially
-        # qualified types, where we have to check if this type actually exists.
-        yield parsed_type
     else:
-        # Just interpret it in our namespace.
+        yield parsed_type
 
-        if namespace is not None:
-            # First attach the namespace if applicable.
-            parsed_type = "{}.{}".format(namespace, parsed_type)
+def qualify_type_name(defined_type, protocol_namespace):
+    """
+    Given the JSON representation of a type definition from a protocol's
+    "types" and the namespace of the protocol, return the fully qualified name
+    of the type and the namespace its fields' types are relative to.
 
-        # Then give back the type name
-        yield parsed_type
+    """
+
+    type_name = defined_type["name"]
+
+    if "." in type_name:
+        # The name is already fully qualified, and brings its own namespace.
+        return type_name, ".".join(type_name.split(".")[:-1])
+
+    type_namespace = defined_type.get("namespace", protocol_namespace)
+
+    if type_namespace is not None:
+        type_name = "{}.{}".format(type_namespace, type_name)
+
+    return type_name, type_namespace
+
+def build_symbol_table(protocols):
+    """
+    Given a list of (cluster key, protocol) tuples from load_protocols(), return
+    a dict from every name a type can be referred to by (its fully qualified
+    name, its short name, and every partially qualified name in between) to the
+    fully qualified name of the type. Names which could mean more than one type
+    map to None.
+
+    """
+
+    # First find every type that actually exists.
+    full_names = set()
+    for cluster_key, protocol in protocols:
+        for defined_type in protocol.get("types", []):
+            full_names.add(qualify_type_name(defined_type,
+                protocol.get("namespace", None))[0])
+
+    return build_symbol_table_from_names(full_names)
+
+def build_symbol_table_from_names(full_names):
+    """
+    Like build_symbol_table(), but given the set of fully qualified names of
+    every type that exists.
+
+    """
+
+    symbols = {}
+    for full_name in full_names:
+        # A fully qualified name always means exactly that type.
+        symbols[full_name] = full_name
+
+    for full_name in full_names:
+        parts = full_name.split(".")
+        for i in range(1, len(parts)):
+            # Record each shorter name, e.g. models.Variant and Variant for
+            # org.ga4gh.models.Variant
+            partial_name = ".".join(parts[i:])
+            if partial_name in full_names:
+                # Some other type has exactly this fully qualified name.
+                continue
+            if partial_name in symbols and symbols[partial_name] != full_name:
+                # This name is ambiguous.
+                symbols[partial_name] = None
+            else:
+                symbols[partial_name] = full_name
+
+    return symbols
+
+def resolve_type_name(type_name, namespace, symbols):
+    """
+    Given a user type name as written in a field type, the namespace the field
+    is in, and a symbol table from build_symbol_table(), return the fully
+    qualified name of the type it refers to, or None if there is no such type
+    (or more than one).
+
+    """
+
+    if "." not in type_name and namespace is not None:
+        # Avro looks short names up in the enclosing namespace first.
+        qualified_name = "{}.{}".format(namespace, type_name)
+        if symbols.get(qualified_name, None) == qualified_name:
+            return qualified_name
+
+    # Otherwise it's either fully qualified, or we fall back on the only type
+    # that ends with this name.
+    return symbols.get(type_name, None)
 
 def type_to_node(type_name):
     """
@@ -195,7 +331,76 @@ def dot_escape(label_content):
     return (label_content.replace("&", "&amp;").replace("<", "&lt;")
         .replace(">", "&gt;").replace("\"", "&quot;"))
 
-def parse_avprs(avpr_files, cluster_order, url_file, type_comments_file):
+def iter_avpr_files(avpr_files, cluster_order, avpr_dir=None):
+    """
+    Yield (cluster key, AVPR file object) tuples for the protocols to draw, as
+    described for iter_protocols(). Files are only opened when it is their
+    turn.
+
+    """
+
+    if avpr_dir is None:
+        avpr_dir = os.path.join(os.getcwd(), 'schemas_avpr')
+
+    # Add types to clusters
+    make_clusters = (cluster_order is not None)
+    if make_clusters:
+        # avpr_dir can also be an archive, or have compressed .avpr files.
+        source = schema_inputs.SchemaSource(avpr_dir)
+        files_for_iteration = (source.open(cluster + ".avpr") for cluster in cluster_order.split())
+    else:
+        files_for_iteration = avpr_files
+
+    for avpr_file in files_for_iteration:
+        #Define cluster key if applicable
+        cluster_key = None
+        if make_clusters:
+            #e.g. path/to/common.avpr (or common.avpr.gz, or bundle.tar.gz!common.avpr) will become common.avdl
+            cluster_key = schema_inputs.strip_compression(schema_inputs.base_name(avpr_file.name))[:-5] + ".avdl"
+
+        yield cluster_key, avpr_file
+
+def iter_protocols(avpr_files, cluster_order, avpr_dir=None, protocol_cache=None):
+    """
+    Load the AVPR protocols to draw. If cluster_order (a space-separated string
+    of cluster/avdl names, in imported order) is given, the protocols are read
+    from <avpr_dir>/<name>.avpr (avpr_dir defaults to ./schemas_avpr, and can
+    also be an archive, see schema_inputs.SchemaSource), and otherwise from the
+    given iterator of AVPR file objects.
+
+    Yields (cluster key, protocol) tuples, where the cluster key is e.g.
+    reads.avdl, or None if we are not making clusters. Each file is only opened
+    and read when it is its turn.
+
+    If protocol_cache is a dict, parsed protocols are stored in it by file
+    contents, so that the same file is only parsed once when drawing many
+    diagrams.
+
+    """
+
+    for cluster_key, avpr_file in iter_avpr_files(avpr_files, cluster_order, avpr_dir):
+        # Load each protocol that we want to look at.
+        if protocol_cache is None:
+            protocol = json.load(avpr_file)
+        else:
+            avpr_text = avpr_file.read()
+            cache_key = hashlib.sha1(avpr_text.encode("utf-8") if not isinstance(avpr_text, bytes) else avpr_text).hexdigest()
+            if cache_key not in protocol_cache:
+                protocol_cache[cache_key] = json.loads(avpr_text)
+            protocol = protocol_cache[cache_key]
+
+        yield cluster_key, protocol
+
+def load_protocols(avpr_files, cluster_order, avpr_dir=None, protocol_cache=None):
+    """
+    Like iter_protocols(), but returns all the (cluster key, protocol) tuples
+    in a list.
+
+    """
+
+    return list(iter_protocols(avpr_files, cluster_order, avpr_dir, protocol_cache))
+
+def parse_avprs(avpr_files, cluster_order, url_file, type_comments_file, avpr_dir=None):
     """
     Given an iterator of AVPR file objects to read, return three things: a dict
     from fully qualified type names to lists of (field name, field type) tuples,
@@ -204,11 +409,160 @@ def parse_avprs(avpr_files, cluster_order, url_file, type_comments_file):
 
     """
 
+    return parse_protocols(load_protocols(avpr_files, cluster_order, avpr_dir), url_file,
+        type_comments_file)
+
+def read_urls(url_file):
+    """
+    Read the schema urls file, and return a dict from cluster key to full url.
+    The key corressponds to a key in clusters, e.g. Key: reads.avdl    Value: (the url)
+    The same unchanged file gives the same dict (see url_converter.cluster_urls()), which
+    shouldn't be changed.
+
+    """
+
+    if url_file is None:
+        return {}
+    return url_converter.cluster_urls(url_file)
+
+def read_type_comments(type_comments_file):
+    """
+    Read the tab-delimited type comments file, and return a dict from type name
+    to manually entered comment. e.g. Key: ExpressionUnits     Value: e.g. FPKM or TPM
+
+    """
+
+    type_comments = {}
+    if type_comments_file is not None:
+        for type_comment in type_comments_file:
+            type_comment_split = type_comment.split("\t")
+            type_comments[type_comment_split[0]] = type_comment_split[1].strip()
+    return type_comments
+
+def describe_fields(type_name, defined_type, type_namespace, symbols=None):
+    """
+    Given the fully qualified name of a type, its JSON definition and its
+    namespace, yield a (field name, field type, user types as written, ID
+    target, ID reference destination) tuple for each of its fields.
+
+    The ID target is the lower-case name that ID references to this type would
+    use, if this is the type's "id" field, and None otherwise. The ID reference
+    destination is the lower-case name of the type that a referenceeNameId(s)
+    field probably points to, or None if this isn't one of those.
+
+    """
+
+    if defined_type["type"] != "record":
+        # Only records have fields.
+        return
+
+    for field in defined_type["fields"]:
+        # Parse out each field's name and type
+        field_type = type_to_string(field["type"], type_namespace, symbols=symbols)
+        field_name = field["name"]
+
+        # Announce every field with its type
+#        print("\t{} {}".format(field_type, field_name))
+
+        id_target = None
+        destination = None
+
+        if (field_name.lower() == "id" and
+            u"string" in field_type):
+
+            # This is a possible ID target. Decide what we would
+            # expect to appear in an ID reference field name.
+            id_target = type_to_display(type_name).lower()
+
+#            print("\t\tFound ID target {}".format(id_target))
+
+        elif (field_name.lower().endswith("id") or
+            field_name.lower().endswith("ids")):
+            # This is probably an ID reference
+
+            if field_name.lower().endswith("id"):
+                # Chop off exactly these characters
+                destination = field_name.lower()[0:-2]
+            elif field_name.lower().endswith("ids"):
+                # Chop off these instead. TODO: this is super ugly
+                # and regexes are better.
+                destination = field_name.lower()[0:-3]
+
+            # Announce the reference
+#            print("\t\tFound ID reference to {}".format(
+#                destination))
+
+        yield field_name, field_type, list(find_user_types(field["type"])), id_target, destination
+
+def match_id_reference(to_target, id_targets):
+    """
+    Given the lower-case target name of an ID reference, and a dict from
+    lower-case short name to fully-qualified name (or None if ambiguous) for
+    everything with an "id" field, return the fully-qualified name of the type
+    the reference points to, or None if we can't tell.
+
+    """
+
+    if to_target in id_targets:
+        # We point to something, what is it? It's None if it's ambiguous.
+#        print("Matched reference to {} exactly".format(to_target))
+        return id_targets.get(to_target)
+
+    # None of these targets matches exactly
+#    print("WARNING: wanted target {} but it does not exist!".format(to_target))
+
+    # We will find partial matches, and save them as target, full name
+    # tuples.
+    partial_matches = []
+
+    for actual_target, to_name in id_targets.items():
+        # For each possible target, see if it is a partial match
+        if (actual_target in to_target or
+            to_target in actual_target):
+
+            partial_matches.append((actual_target, to_name))
+
+    if len(partial_matches) == 1:
+        # We found exactly one partial match. Unpack it!
+        actual_target, to_name = partial_matches[0]
+
+        # Announce the match
+#        print("WARNING: Matched reference to {} on partial "
+#            "match of {} and {}".format(to_name, to_target,
+#            actual_target))
+        return to_name
+
+    # Complain we got no matches, or too many
+#    print("WARNING: {} partial matches: {}".format(
+#        len(partial_matches),
+#        ", ".join([x[1] for x in partial_matches])))
+    return None
+
+def report_unresolved(referencer, field_name, used_as_written, symbols):
+    """
+    Print a warning about a field type that doesn't match exactly one type.
+
+    """
+
+    if symbols.get(used_as_written, None) is None and used_as_written in symbols:
+        problem = "is ambiguous"
+    else:
+        problem = "does not exist"
+    sys.stderr.write("WARNING: {}.{} uses type {}, which {}\n".format(
+        type_to_display(referencer), field_name, used_as_written, problem))
+
+def parse_protocols(protocols, url_file, type_comments_file):
+    """
+    Does the work of parse_avprs() on a list of already loaded (cluster key,
+    protocol) tuples from load_protocols().
+
+    """
+
     # Holds a dict from cluster key to full url. The key corressponds to a key in clusters, e.g. Key: reads.avdl    Value: (the url)
-    urls = {}
+    urls = read_urls(url_file)
 
     # Holds a dict from type name to manually entered comment. e.g. Key: ExpressionUnits     Value: e.g. FPKM or TPM
-    type_comments = {}
+    type_comments = read_type_comments(type_comments_file)
 
     # Holds the fields for each type, as lists of tuples of (name, type),
     # indexed by type. All types are fully qualified.
@@ -229,55 +583,21 @@ def parse_avprs(avpr_files, cluster_order, url_file, type_comments_file):
     # Key: cluster/file name     Value: tuple of field names
     clusters = {}
 
-    # Fill in the urls dictionary.
-    if url_file is not None:
-        for url in url_file:
-	    cooked_url = url_converter.get_cooked_url(url.strip())
-	    url_key = cooked_url.split("/")[-1]
-	    urls[url_key] = cooked_url
+    # Find every type in every protocol first, so that field types can be
+    # looked up no matter which protocol defines them.
+    symbols = build_symbol_table(protocols)
 
-    # Fill in the type_comments dictionary
-    if type_comments_file is not None:
-        for type_comment in type_comments_file:
-            type_comment_split = type_comment.split("\t")
-            type_comments[type_comment_split[0]] = type_comment_split[1].strip()
-
-    # Add types to clusters
-    make_clusters = (cluster_order is not None)
-    cluster_files = []
-    if make_clusters:
-	cluster_order_list = cluster_order.split()
-        for cluster in cluster_order_list:
-            current_cluster = open(os.path.join(os.getcwd(), 'schemas_avpr', cluster + ".avpr"), 'r')
-            cluster_files.append(current_cluster)
-
-    files_for_iteration = None
-    if make_clusters:
-        files_for_iteration = cluster_files
-    else:
-        files_for_iteration = avpr_files
-
-    # For avpr_file in avpr_files:
-    for avpr_file in files_for_iteration:
-        # Load each protocol that we want to look at.
-        protocol = json.load(avpr_file)
+    # Holds (referencer, field name, type name as written) tuples for field
+    # types that don't match exactly one type. These don't get edges.
+    unresolved = []
 
+    for cluster_key, protocol in protocols:
         # Grab the namespace if set
         protocol_namespace = protocol.get("namespace", None)
 
-        #Define cluster key if applicable
-        cluster_key = None
-        if make_clusters:
-            cluster_key = avpr_file.name.split("/")[-1][:-5] + ".avdl"  #e.g. path/to/common.avpr will become common.avdl
-
         for defined_type in protocol.get("types", []):
-            # Get the name of the type
-            type_name = defined_type["name"]
-
-            type_namespace = defined_type.get("namespace", protocol_namespace)
-
-            if type_namespace is not None:
-                type_name = "{}.{}".format(type_namespace, type_name)
+            # Get the fully qualified name of the type
+            type_name, type_namespace = qualify_type_name(defined_type, protocol_namespace)
 
             #If make_clusters is set to True, then due to the order of files in cluster_files, a field should not get recorded in the wrong cluster because it is only recorded the first time it is seen.
             if fields.has_key(type_name):
@@ -288,131 +608,70 @@ def parse_avprs(avpr_files, cluster_order, url_file, type_comments_file):
             fields[type_name] = []
 
             # Record the field in the correct cluster if applicable
-            if make_clusters:
+            if cluster_key is not None:
                 clusters.setdefault(cluster_key, []).append(type_name)
 
 #            print("Type {}".format(type_name))
 
-            if defined_type["type"] == "record":
-                # We can have fields.
-
-                for field in defined_type["fields"]:
-                    # Parse out each field's name and type
-                    field_type = type_to_string(field["type"], type_namespace)
-                    field_name = field["name"]
-
-                    # Announce every field with its type
-#                    print("\t{} {}".format(field_type, field_name))
-
-                    # Record the field for the UML.
-                    fields[type_name].append((field_name, field_type))
-
-                    for used in find_user_types(field["type"], type_namespace):
-                        # Announce all the user types it uses
-#                        print("\t\tContainment of {}".format(used))
+            for field_name, field_type, used_types, id_target, destination in describe_fields(
+                type_name, defined_type, type_namespace, symbols):
 
-                        # And record them
-                        containments.add((type_name, used, field_name))
+                # Record the field for the UML.
+                fields[type_name].append((field_name, field_type))
 
-                    if (field_name.lower() == "id" and
-                        u"string" in field_type):
+                for used_as_written in used_types:
+                    # Find the type that is actually meant
+                    used = resolve_type_name(used_as_written, type_namespace, symbols)
 
-                        # This is a possible ID target. Decide what we would
-                        # expect to appear in an ID reference field name.
-                        target_name = type_to_display(type_name).lower()
+                    if used is None:
+                        # Don't draw an edge to a node that doesn't exist.
+                        unresolved.append((type_name, field_name, used_as_written))
+                        continue
 
-                        if id_targets.has_key(target_name):
-                            # This target is ambiguous.
-                            id_targets[target_name] = None
-#                            print("WARNING: ID target {} exists twice!")
-                        else:
-                            # Say it points here
-                            id_targets[target_name] = type_name
+                    # Announce all the user types it uses
+#                    print("\t\tContainment of {}".format(used))
 
-#                        print("\t\tFound ID target {}".format(target_name))
+                    # And record them
+                    containments.add((type_name, used, field_name))
 
-                    elif (field_name.lower().endswith("id") or
-                        field_name.lower().endswith("ids")):
-                        # This is probably an ID reference
+                if id_target is not None:
+                    if id_targets.has_key(id_target):
+                        # This target is ambiguous.
+                        id_targets[id_target] = None
+#                        print("WARNING: ID target {} exists twice!")
+                    else:
+                        # Say it points here
+                        id_targets[id_target] = type_name
 
-                        if field_name.lower().endswith("id"):
-                            # Chop off exactly these characters
-                            destination = field_name.lower()[0:-2]
-                        elif field_name.lower().endswith("ids"):
-                            # Chop off these instead. TODO: this is super ugly
-                            # and regexes are better.
-                            destination = field_name.lower()[0:-3]
+                elif destination is not None:
+                    #Edit 2-23-16: id_references tuples now contains a third index to aid in constructing edges from specific cells in type_name
+                    id_references.add((type_name, destination, field_name))
 
-                        # Announce and save the reference
-#                        print("\t\tFound ID reference to {}".format(
-#                            destination))
-			#Edit 2-23-16: id_references tuples now contains a third index to aid in constructing edges from specific cells in type_name
-                        id_references.add((type_name, destination, field_name))
+    for referencer, field_name, used_as_written in unresolved:
+        report_unresolved(referencer, field_name, used_as_written, symbols)
 
     # Now we have to match ID references to targets. This holds the actual
     # referencing edges, as (from, to) fully qualified name tuples.
     references = set()
 
     for from_name, to_target, from_field_name in id_references:
-        # For each reference
-
-        if id_targets.has_key(to_target):
-            # We point to something, what is it?
-            to_name = id_targets[to_target]
-
-            if to_name is None:
-                # We point to something that's ambiguous
-#                print("WARNING: Ambiguous target {} used by {}!".format(
-#                    to_target, from_name))
-                pass
-            else:
-                # We point to a real thing. Add the edge.
-#                print("Matched reference from {} to {} exactly".format(
-#                    from_name, to_name))
-                references.add((from_name, to_name, from_field_name))
-
-        else:
-            # None of these targets matches exactly
-#            print("WARNING: {} wanted target {} but it does not exist!".format(
-#                from_name, to_target))
-
-            # We will find partial matches, and save them as target, full name
-            # tuples.
-            partial_matches = []
-
-            for actual_target, to_name in id_targets.iteritems():
-                # For each possible target, see if it is a partial match
-                if (actual_target in to_target or
-                    to_target in actual_target):
-
-                    partial_matches.append((actual_target, to_name))
-
-            if len(partial_matches) == 1:
-                # We found exactly one partial match. Unpack it!
-                actual_target, to_name = partial_matches[0]
-
-                # Announce and record the match
-#                print("WARNING: Matched reference from {} to {} on partial "
-#                    "match of {} and {}".format(from_name, to_name, to_target,
-#                    actual_target))
-                references.add((from_name, to_name, from_field_name))
-            elif len(partial_matches) > 1:
-                # Complain we got no matches, or too many
-#                print("WARNING: {} partial matches: {}".format(
-#                    len(partial_matches),
-#                    ", ".join([x[1] for x in partial_matches])))
-                pass
-
+        # For each reference, see if we point to a real thing.
+        to_name = match_id_reference(to_target, id_targets)
 
+        if to_name is not None:
+            # Add the edge.
+            references.add((from_name, to_name, from_field_name))
 
     return fields, containments, references, clusters, urls, type_comments
 
-def write_graph_ORIGINAL(dot_file, fields, containments, references):
+def write_graph_ORIGINAL(dot_file, fields, containments, references, detail=None, cycle_plan=None, summary=None):
     """
     Given a file object to write to, a dict from type names to lists of (name,
     type) field tuples, a set of (container, containee) containment edges, and a
     set of (referencer, referencee) ID reference edges, and write a GraphViz
-    UML.
+    UML. Edges always go between whole types here, so detail (see
+    write_graph_with_clusters()) only changes which fields are listed.
+    cycle_plan and summary work like they do there.
 
     See <http://www.ffnn.nl/pages/articles/media/uml-diagrams-using-graphviz-
     dot.php>
@@ -427,7 +686,14 @@ def write_graph_ORIGINAL(dot_file, fields, containments, references):
     dot_file.write("\tshape=record\n")
     dot_file.write("]\n")
 
-    for type_name, field_list in fields.iteritems():
+    if detail is not None:
+        fields = detail_levels.apply_detail(fields, detail,
+            [(edge[0], edge[2]) for edge in itertools.chain(containments, references)] +
+            [(reference[1], "id") for reference in references])[0]
+
+    # Everything is written in sorted order, so the same schema always gives
+    # exactly the same file.
+    for type_name, field_list in sorted(fields.iteritems()):
         # Put a node for each type.
         dot_file.write("{} [\n".format(type_to_node(type_name)))
 
@@ -445,6 +711,17 @@ def write_graph_ORIGINAL(dot_file, fields, containments, references):
         # And the node
         dot_file.write("]\n")
 
+    loose_edges = frozenset()
+    if cycle_plan is not None:
+        loose_edges = cycle_plan.loose_edges
+        # With no clusters, every cycle to group is under None.
+        for number, members in cycle_plan.groups.get(None, []):
+            write_cycle_group(dot_file, number, members)
+
+    if summary is not None:
+        for cluster_name, hidden_types in summary.hidden:
+            write_placeholder(dot_file, cluster_name, len(hidden_types))
+
     # Define edge properties for containments
     dot_file.write("edge [\n")
     dot_file.write("\tdir=both\n")
@@ -452,10 +729,10 @@ def write_graph_ORIGINAL(dot_file, fields, containments, references):
     dot_file.write("\tarrowhead=none\n")
     dot_file.write("]\n")
 
-    for container, containee, container_field_name in containments:
+    for container, containee, container_field_name in sorted(containments):
         # Now do the containment edges
-        dot_file.write("{} -> {}\n".format(type_to_node(container),
-            type_to_node(containee)))
+        dot_file.write("{} -> {}{}\n".format(type_to_node(container),
+            type_to_node(containee), " [constraint=false]" if (container, containee) in loose_edges else ""))
 
     # Define edge properties for references
     dot_file.write("edge [\n")
@@ -465,30 +742,84 @@ def write_graph_ORIGINAL(dot_file, fields, containments, references):
     dot_file.write("\tstyle=dashed\n")
     dot_file.write("]\n")
 
-    for referencer, referencee, local_referencee in references:
+    for referencer, referencee, local_referencee in sorted(references):
         # Now do the reference edges
-        dot_file.write("{} -> {}\n".format(type_to_node(referencer),
-            type_to_node(referencee)))
+        dot_file.write("{} -> {}{}\n".format(type_to_node(referencer),
+            type_to_node(referencee), " [constraint=false]" if (referencer, referencee) in loose_edges else ""))
+
+    if summary is not None:
+        write_summary_edges(dot_file, summary)
 
     # Close the digraph off.
     dot_file.write("}\n")
 
-def write_graph_with_clusters(dot_file, fields, containments, references, clusters, urls, type_comments):
+def break_up_comment(comment):
     """
-    Given a file object to write to, a dict from type names to lists of (name,
-    type) field tuples, a set of (container, containee) containment edges, and a
-    set of (referencer, referencee) ID reference edges, and write a GraphViz
-    UML.
+    Breaks up a comment string so no more than ~57 characters are on each line
 
-    See <http://www.ffnn.nl/pages/articles/media/uml-diagrams-using-graphviz-
-    dot.php>
+    """
+
+    wrapper = textwrap.TextWrapper(break_long_words = False, width = 57)
+    return "<BR/>".join(wrapper.wrap(comment))
+
+def type_to_label(type_name, field_list, type_comments, label_cache=None):
+    """
+    Return the GraphViz node statement that draws the given type as a table,
+    with its header comment (if any) under the name and its fields in two
+    columns. Each field cell has a port named after the field, so edges can be
+    drawn from it.
+
+    If label_cache is a dict, finished labels are kept in it, so that a type
+    which looks the same in many diagrams is only laid out as text once.
+
+    """
+
+    comment = type_comments.get(type_to_display(type_name), None)
+
+    if label_cache is not None:
+        cache_key = (type_name, tuple(field_list), comment)
+        if cache_key in label_cache:
+            return label_cache[cache_key]
+
+    lines = []
+    lines.append("{} [label=<\n".format(type_to_node(type_name)))#type_to_display(type_name)))
+    lines.append("<TABLE BORDER='0' CELLBORDER='1' CELLSPACING='0' CELLPADDING='4' bgcolor='#002060' color='#002060'>\n")
+    lines.append("\t<TR>\n")
+    lines.append("\t\t<TD COLSPAN='2' bgcolor='#79A6FF' border='3'><FONT POINT-SIZE='20' color='white'>{}</FONT>".format(type_to_display(type_name)))
+    # Add option to specify description for header:
+    if comment is not None:
+        lines.append("<BR/><FONT POINT-SIZE='15' color='white'>{}</FONT>".format(break_up_comment(comment)))
+    lines.append("</TD>\n")
+    lines.append("\t</TR>\n")
+
+
+    # Now draw the rows of fields for the type. A field_list of [a, b, c, d, e, f, g] will have [a, e] in row 1, [b, f] in row 2, [c, g] in row 3, and just [d] in row 4
+    num_fields = len(field_list)
+    for i in range(0, num_fields//2 + num_fields%2):
+        # Draw one row.
+        lines.append("\t<TR>\n")
+        # Port number and displayed text will be the i'th field's name
+        lines.append("\t\t<TD align='left' port='{}'><FONT color='white'>- {}</FONT></TD>\n".format(field_list[i][0], field_list[i][0]))
+        if (num_fields%2) == 1 and (i == num_fields//2 + num_fields%2 - 1):
+            # Don't draw the second cell in the row if you have an odd number of fields and it is the last row
+            pass
+        else:
+            lines.append("\t\t<TD align='left' port='{}'><FONT color='white'>- {}</FONT></TD>\n".format(field_list[num_fields//2 + num_fields%2 + i][0], field_list[num_fields//2 + num_fields%2 + i][0]))
+        lines.append("\t</TR>\n")
+
+    # Finish the table
+    lines.append("</TABLE>>];\n\n")
+
+    label = "".join(lines)
+    if label_cache is not None:
+        label_cache[cache_key] = label
+    return label
+
+def write_graph_start(dot_file):
+    """
+    Start a digraph of table-shaped nodes in the given file.
 
     """
-    
-    # Breaks up a comment string so no more than ~57 characters are on each line
-    def break_up_comment(comment):
-        wrapper = textwrap.TextWrapper(break_long_words = False, width = 57)
-        return "<BR/>".join(wrapper.wrap(comment))
 
     # Start a digraph
     dot_file.write("digraph UML {\n")
@@ -498,53 +829,112 @@ def write_graph_with_clusters(dot_file, fields, containments, references, cluste
     dot_file.write("\tshape=plaintext\n")
     dot_file.write("]\n\n")
 
-    # Draw each node/type/record as a table
-    for type_name, field_list in fields.iteritems():
+def write_cluster(dot_file, cluster_name, cluster_types, urls, groups=(), hidden_count=0):
+    """
+    Write one cluster/subgraph, holding the given types, and linking to the
+    cluster's schema file if it is in urls. groups is a list of (cycle number,
+    types) pairs from a schema_graph.CyclePlan, for cycles to draw as a box of
+    their own inside the cluster. If hidden_count isn't 0, the cluster also
+    holds a placeholder for that many types left out of a summary.
 
-        dot_file.write("{} [label=<\n".format(type_to_node(type_name)))#type_to_display(type_name)))
-        dot_file.write("<TABLE BORDER='0' CELLBORDER='1' CELLSPACING='0' CELLPADDING='4' bgcolor='#002060' color='#002060'>\n")
-        dot_file.write("\t<TR>\n")
-        dot_file.write("\t\t<TD COLSPAN='2' bgcolor='#79A6FF' border='3'><FONT POINT-SIZE='20' color='white'>{}</FONT>".format(type_to_display(type_name)))
-        # Add option to specify description for header:
-        if type_to_display(type_name) in type_comments:
-            dot_file.write("<BR/><FONT POINT-SIZE='15' color='white'>{}</FONT>".format(break_up_comment(type_comments[type_to_display(type_name)])))
-        dot_file.write("</TD>\n")
-        dot_file.write("\t</TR>\n")
-
-
-        # Now draw the rows of fields for the type. A field_list of [a, b, c, d, e, f, g] will have [a, e] in row 1, [b, f] in row 2, [c, g] in row 3, and just [d] in row 4
-        num_fields = len(field_list)
-        for i in range(0, num_fields//2 + num_fields%2):
-            # Draw one row.
-            dot_file.write("\t<TR>\n")
-			# Port number and displayed text will be the i'th field's name
-            dot_file.write("\t\t<TD align='left' port='{}'><FONT color='white'>- {}</FONT></TD>\n".format(field_list[i][0], field_list[i][0])) 
-            if (num_fields%2) == 1 and (i == num_fields//2 + num_fields%2 - 1):
-                # Don't draw the second cell in the row if you have an odd number of fields and it is the last row
-                pass
-            else:
-                dot_file.write("\t\t<TD align='left' port='{}'><FONT color='white'>- {}</FONT></TD>\n".format(field_list[num_fields//2 + num_fields%2 + i][0], field_list[num_fields//2 + num_fields%2 + i][0]))
-            dot_file.write("\t</TR>\n")
+    """
 
-        # Finish the table
-        dot_file.write("</TABLE>>];\n\n")
+    # Use type_to_node to replace . with _
+    dot_file.write("subgraph cluster_{} {{\n".format(type_to_node(cluster_name)))
+    dot_file.write("\tstyle=\"rounded, filled\";\n")
+    dot_file.write("\tcolor=lightgrey;\n")
+    dot_file.write("\tnode [style=filled,color=white];\n")
+    dot_file.write("\tlabel = \"{}\";\n".format(cluster_name))
+    if cluster_name in urls:
+        dot_file.write("\tURL=\"{}\";\n".format(urls[cluster_name]))
+    #After all the cluster formatting, define the cluster types
+    group_of = dict((type_name, group) for group in groups for type_name in group[1])
+    for cluster_type in cluster_types:
+        if cluster_type in group_of:
+            # The whole cycle goes where its first type would.
+            number, members = group_of[cluster_type]
+            if members[0] == cluster_type:
+                write_cycle_group(dot_file, number, members)
+            continue
+        dot_file.write("\t{};\n".format(type_to_node(cluster_type))) #cluster_type should match up with a type_name from fields
+    if hidden_count > 0:
+        write_placeholder(dot_file, cluster_name, hidden_count)
+    dot_file.write("}\n\n")
+
+def placeholder_node(cluster_name):
+    """
+    Return the dot node name of the placeholder for the types of the given
+    cluster (or of no cluster, if it is None) that a summary leaves out. It has
+    spaces in it, so it can't be the same as any type's node.
 
+    """
 
-    # Now define the clusters/subgraphs
-    for cluster_name, cluster_types in clusters.iteritems():
-        # Use type_to_node to replace . with _
-        dot_file.write("subgraph cluster_{} {{\n".format(type_to_node(cluster_name)))
-        dot_file.write("\tstyle=\"rounded, filled\";\n")
-        dot_file.write("\tcolor=lightgrey;\n")
-        dot_file.write("\tnode [style=filled,color=white];\n")
-        dot_file.write("\tlabel = \"{}\";\n".format(cluster_name))
-        if cluster_name in urls:
-            dot_file.write("\tURL=\"{}\";\n".format(urls[cluster_name]))
-        #After all the cluster formatting, define the cluster types
-        for cluster_type in cluster_types:
-            dot_file.write("\t{};\n".format(type_to_node(cluster_type))) #cluster_type should match up with a type_name from fields
-        dot_file.write("}\n\n")
+    if cluster_name is None:
+        return "\"more types\""
+    return "\"more types in {}\"".format(cluster_name)
+
+def write_placeholder(dot_file, cluster_name, hidden_count):
+    """
+    Write the placeholder node standing for the given number of types of a
+    cluster (or of no cluster) that a summary leaves out.
+
+    """
+
+    dot_file.write("\t{} [shape=box, style=\"rounded, dashed\", color=grey40, fontcolor=grey40, label=\"{} more type{}\"];\n".format(
+        placeholder_node(cluster_name), hidden_count, "" if hidden_count == 1 else "s"))
+
+def write_summary_edges(dot_file, summary):
+    """
+    Write the edges of a schema_graph.Summary: one edge for all the edges of
+    one kind between the same two ends, where at least one end is a
+    placeholder, labelled with how many edges it stands for if that is more
+    than one.
 
+    """
+
+    dot_file.write("\n// Define summary edges, to and from the types that aren't drawn\n")
+    dot_file.write("\nedge [\n")
+    dot_file.write("\tdir=both\n")
+    dot_file.write("\tpenwidth=1\n")
+    dot_file.write("\tconstraint=true\n")
+    dot_file.write("]\n\n")
+
+    def end_node(end):
+        if end[0] == "more":
+            return placeholder_node(summary.hidden[end[1]][0])
+        return type_to_node(end[1])
+
+    for from_end, to_end, kind, count in summary.edges:
+        attributes = [SUMMARY_EDGE_STYLES[kind]]
+        if count > 1:
+            attributes.append("label=\"{}\"".format(count))
+        dot_file.write("{} -> {} [{}]\n".format(end_node(from_end), end_node(to_end), ", ".join(attributes)))
+
+def write_cycle_group(dot_file, number, members):
+    """
+    Write a box around the given types, which contain or reference each other
+    in a cycle, inside the cluster being written.
+
+    """
+
+    dot_file.write("\tsubgraph cluster_cycle_{} {{\n".format(number))
+    dot_file.write("\t\tstyle=\"rounded, dashed\";\n")
+    dot_file.write("\t\tcolor=\"#C55A11\";\n")
+    dot_file.write("\t\tlabel = \"cycle {}\";\n".format(number))
+    for member in members:
+        dot_file.write("\t\t{};\n".format(type_to_node(member)))
+    dot_file.write("\t}\n")
+
+def write_containment_edges(dot_file, containments, shown_ports={}, loose_edges=frozenset()):
+    """
+    Write the edge style for containments, and then an edge from the field of
+    the container to the containee for each (container, containee, container
+    field name) tuple. Edges from fields that aren't drawn (see
+    detail_levels.apply_detail() for shown_ports) start at the container
+    itself. Edges between a (container, containee) pair in loose_edges (see
+    schema_graph.CyclePlan) aren't used for ranking.
+
+    """
 
     dot_file.write("\n// Define containment edges\n")
     # Define edge properties for containments
@@ -558,8 +948,20 @@ def write_graph_with_clusters(dot_file, fields, containments, references, cluste
 
     for container, containee, container_field_name in containments:
         # Now do the containment edges
-        dot_file.write("{}:{}:w -> {}\n".format(type_to_node(container),
-                                                container_field_name, type_to_node(containee)))
+        dot_file.write("{} -> {}{}\n".format(detail_levels.edge_end(type_to_node(container),
+            container_field_name, shown_ports.get(container)), type_to_node(containee),
+            " [constraint=false]" if (container, containee) in loose_edges else ""))
+
+def write_reference_edges(dot_file, references, constraint=True, shown_ports={}, loose_edges=frozenset()):
+    """
+    Write the edge style for ID references, and then an edge from the field of
+    the referencer to the id of the referencee for each (referencer, referencee,
+    referencer field name) tuple. If constraint is False, dot doesn't use these
+    edges to decide which types go above which. Ends at fields that aren't
+    drawn (see shown_ports in write_containment_edges()) go to the type itself,
+    and loose_edges works like it does there.
+
+    """
 
     dot_file.write("\n// Define references edges\n")
     # Define edge properties for references
@@ -570,12 +972,94 @@ def write_graph_with_clusters(dot_file, fields, containments, references, cluste
     dot_file.write("\tstyle=dashed\n")
     dot_file.write("\tcolor=\"darkgreen\"\n")
     dot_file.write("\tpenwidth=2\n")
+    if not constraint:
+        dot_file.write("\tconstraint=false\n")
     dot_file.write("]\n\n")
 
     for referencer, referencee, local_referencee in references:
         # Now do the reference edges
-        dot_file.write("{}:{}:w -> {}:id:w\n".format(type_to_node(referencer), local_referencee,
-            type_to_node(referencee)))
+        dot_file.write("{} -> {}{}\n".format(
+            detail_levels.edge_end(type_to_node(referencer), local_referencee, shown_ports.get(referencer)),
+            detail_levels.edge_end(type_to_node(referencee), "id", shown_ports.get(referencee)),
+            " [constraint=false]" if (referencer, referencee) in loose_edges else ""))
+
+def write_graph_with_clusters(dot_file, fields, containments, references, clusters, urls, type_comments, label_cache=None,
+    layout_hints=None, detail=None, cycle_plan=None, summary=None):
+    """
+    Given a file object to write to, a dict from type names to lists of (name,
+    type) field tuples, a set of (container, containee) containment edges, and a
+    set of (referencer, referencee) ID reference edges, and write a GraphViz
+    UML.
+
+    If layout_hints (a schema_graph.LayoutHints) is given, clusters and types
+    are written in its order instead of by name, and only containments decide
+    which types go above which. If detail (a dict from type name to level of
+    detail, see detail_levels.py) is given, types in it are drawn with fewer
+    fields. If cycle_plan (a schema_graph.CyclePlan) is given, its loose edges
+    aren't used for ranking, and its groups are drawn as boxes. If summary (a
+    schema_graph.Summary, with only its kept types in fields, containments,
+    references and clusters) is given, its placeholders and edges are drawn
+    too.
+
+    See <http://www.ffnn.nl/pages/articles/media/uml-diagrams-using-graphviz-
+    dot.php>
+
+    """
+
+    write_graph_start(dot_file)
+
+    shown_ports = {}
+    if detail is not None:
+        # Keep the fields that edges start or end at, for types drawn at the
+        # "edges" level.
+        fields, shown_ports = detail_levels.apply_detail(fields, detail,
+            [(edge[0], edge[2]) for edge in itertools.chain(containments, references)] +
+            [(reference[1], "id") for reference in references])
+
+    # Everything is written in sorted order (or in the order of the layout
+    # hints, which are worked out the same way every time), so the same schema
+    # always gives exactly the same file (and render_uml.py can find it in its
+    # cache).
+    if layout_hints is None:
+        type_names = sorted(fields)
+        cluster_names = sorted(clusters)
+    else:
+        type_names = schema_graph.hinted_order(layout_hints.type_order, fields)
+        cluster_names = schema_graph.hinted_order(layout_hints.cluster_order, clusters)
+
+    # Draw each node/type/record as a table
+    for type_name in type_names:
+        dot_file.write(type_to_label(type_name, fields[type_name], type_comments, label_cache))
+
+
+    loose_edges = frozenset()
+    groups = {}
+    if cycle_plan is not None:
+        loose_edges = cycle_plan.loose_edges
+        groups = cycle_plan.groups
+
+    hidden_counts = {}
+    if summary is not None:
+        hidden_counts = dict((cluster_name, len(hidden_types)) for cluster_name, hidden_types in summary.hidden)
+        if None in hidden_counts:
+            write_placeholder(dot_file, None, hidden_counts[None])
+
+    # Now define the clusters/subgraphs
+    for cluster_name in cluster_names:
+        cluster_types = clusters[cluster_name]
+        if layout_hints is not None:
+            cluster_types = schema_graph.hinted_order(layout_hints.type_order, cluster_types)
+        write_cluster(dot_file, cluster_name, cluster_types, urls, groups.get(cluster_name, ()),
+            hidden_counts.get(cluster_name, 0))
+
+
+    write_containment_edges(dot_file, sorted(containments), shown_ports, loose_edges)
+
+    write_reference_edges(dot_file, sorted(references), constraint=(layout_hints is None), shown_ports=shown_ports,
+        loose_edges=loose_edges)
+
+    if summary is not None:
+        write_summary_edges(dot_file, summary)
 
 
 
@@ -583,6 +1067,330 @@ def write_graph_with_clusters(dot_file, fields, containments, references, cluste
     # Close the digraph off.
     dot_file.write("}\n")
 
+def write_graph_parts(parts_dir, fields, containments, references, clusters, urls, type_comments, label_cache=None,
+    layout_hints=None, detail=None, cycle_plan=None):
+    """
+    Split the diagram into the parts that aren't connected by edges or
+    clusters, and write each part to its own .dot file in parts_dir, the same
+    way write_graph_with_clusters() (or write_graph_ORIGINAL(), if there are no
+    clusters) would write the whole diagram, with the same layout_hints,
+    detail and cycle_plan.
+    Returns the list of paths written.
+
+    """
+
+    components = schema_graph.connected_components(fields,
+        [(edge[0], edge[1]) for edge in itertools.chain(containments, references)],
+        clusters.itervalues())
+
+    # Sort everything into its part once, instead of looking through
+    # everything for each part.
+    part_of = {}
+    for index, component in enumerate(components):
+        for type_name in component:
+            part_of[type_name] = index
+    part_fields = [{} for component in components]
+    part_containments = [set() for component in components]
+    part_references = [set() for component in components]
+    part_clusters = [{} for component in components]
+    for type_name, field_list in fields.iteritems():
+        part_fields[part_of[type_name]][type_name] = field_list
+    for containment in containments:
+        part_containments[part_of[containment[0]]].add(containment)
+    for reference in references:
+        part_references[part_of[reference[0]]].add(reference)
+    for cluster_name, cluster_types in clusters.iteritems():
+        if len(cluster_types) > 0:
+            part_clusters[part_of[cluster_types[0]]][cluster_name] = cluster_types
+
+    def write_part(component, dot_file):
+        index = part_of[component[0]]
+        part_plan = schema_graph.part_cycle_plan(cycle_plan, part_fields[index])
+        if bool(clusters):
+            write_graph_with_clusters(dot_file, part_fields[index], part_containments[index], part_references[index],
+                part_clusters[index], urls, type_comments, label_cache, layout_hints, detail, part_plan)
+        else:
+            write_graph_ORIGINAL(dot_file, part_fields[index], part_containments[index], part_references[index], detail, part_plan)
+
+    return schema_graph.write_parts(parts_dir, components, write_part)
+
+def stream_avprs(avpr_files, cluster_order, url_file, type_comments_file, dot_file, avpr_dir=None, store_dir=None):
+    """
+    Like parse_avprs() followed by write_graph_with_clusters(), but with about
+    the same memory use however many types there are. Only one protocol is
+    loaded at a time. The fields, cluster membership, the symbol table, and the
+    edges all go into a temporary SQLite file (in store_dir, or the system
+    temporary directory), since field types and edges can only be resolved once
+    every type has been seen. The nodes, clusters and edges are written from
+    there at the end, one at a time.
+
+    """
+
+    # These are small, hand-made files, so we keep them in memory.
+    urls = read_urls(url_file)
+    type_comments = read_type_comments(type_comments_file)
+
+    store = edge_store.EdgeStore(store_dir)
+    try:
+        write_graph_start(dot_file)
+
+        for cluster_key, protocol in iter_protocols(avpr_files, cluster_order, avpr_dir):
+            # Grab the namespace if set
+            protocol_namespace = protocol.get("namespace", None)
+
+            for defined_type in protocol.get("types", []):
+                # Get the fully qualified name of the type
+                type_name, type_namespace = qualify_type_name(defined_type, protocol_namespace)
+
+                # Every name this type can be referred to by goes in the symbol
+                # table, like build_symbol_table() does.
+                parts = type_name.split(".")
+                store.add_symbol(type_name, type_name, True)
+                for i in range(1, len(parts)):
+                    store.add_symbol(".".join(parts[i:]), type_name, False)
+
+                if not store.add_type(type_name):
+                    # Already saw this one.
+                    continue
+
+                # Record the field in the correct cluster if applicable
+                if cluster_key is not None:
+                    store.add_member(cluster_key, type_name)
+
+                for field_name, field_type, used_types, id_target, destination in describe_fields(
+                    type_name, defined_type, type_namespace):
+
+                    for used_as_written in used_types:
+                        # These get resolved once all the types are known.
+                        store.execute("INSERT INTO containments (container, field, used, namespace) VALUES (?, ?, ?, ?)",
+                            (type_name, field_name, used_as_written, type_namespace))
+
+                    if id_target is not None:
+                        # If this target already exists, it is ambiguous.
+                        store.execute("INSERT OR IGNORE INTO id_targets (target, type_name) VALUES (?, ?)",
+                            (id_target, type_name))
+                        store.execute("UPDATE id_targets SET type_name = NULL WHERE target = ? AND type_name IS NOT ?",
+                            (id_target, type_name))
+                    elif destination is not None:
+                        store.execute("INSERT INTO id_references (referencer, destination, field) VALUES (?, ?, ?)",
+                            (type_name, destination, field_name))
+
+                if defined_type["type"] == "record":
+                    # The field types are written out once every type they could
+                    # mean is known, like parse_protocols() does.
+                    for field in defined_type["fields"]:
+                        store.execute("INSERT INTO fields (type_name, field, type, namespace) VALUES (?, ?, ?, ?)",
+                            (type_name, field["name"], json.dumps(field["type"]), type_namespace))
+
+        symbols = store.table("symbols", "name", "full_name")
+
+        # Draw each node/type/record as a table
+        for type_name in store.types():
+            field_list = [(field_name, type_to_string(json.loads(field_type), namespace, symbols=symbols))
+                for field_name, field_type, namespace in store.query(
+                    "SELECT field, type, namespace FROM fields WHERE type_name = ? ORDER BY seq", (type_name,))]
+            dot_file.write(type_to_label(type_name, field_list, type_comments))
+
+        # Now define the clusters/subgraphs
+        for cluster_name, cluster_types in store.clusters():
+            write_cluster(dot_file, cluster_name, cluster_types, urls)
+
+        def resolved_containments():
+            for container, field_name, used_as_written, namespace in store.query(
+                "SELECT DISTINCT container, field, used, namespace FROM containments ORDER BY container, field, used"):
+
+                used = resolve_type_name(used_as_written, namespace, symbols)
+                if used is None:
+                    # Don't draw an edge to a node that doesn't exist.
+                    report_unresolved(container, field_name, used_as_written, symbols)
+                else:
+                    yield container, used, field_name
+        write_containment_edges(dot_file, resolved_containments())
+
+        id_targets = store.table("id_targets", "target", "type_name")
+        def matched_references():
+            for from_name, to_target, from_field_name in store.query(
+                "SELECT DISTINCT referencer, destination, field FROM id_references ORDER BY referencer, destination, field"):
+
+                to_name = match_id_reference(to_target, id_targets)
+                if to_name is not None:
+                    yield from_name, to_name, from_field_name
+        write_reference_edges(dot_file, matched_references())
+
+        # Close the digraph off.
+        dot_file.write("}\n")
+    finally:
+        store.close()
+
+def protocol_to_rows(protocol):
+    """
+    Given a loaded protocol, return what was found in it as a dict from
+    schema_catalog table name to a list of rows. Field types are kept as their
+    JSON, since which types they name can only be worked out once every
+    protocol is known.
+
+    """
+
+    rows = {"types": [], "fields": [], "containments": [], "id_targets": [], "id_references": []}
+    type_names = set()
+
+    # Grab the namespace if set
+    protocol_namespace = protocol.get("namespace", None)
+
+    for defined_type in protocol.get("types", []):
+        # Get the fully qualified name of the type
+        type_name, type_namespace = qualify_type_name(defined_type, protocol_namespace)
+
+        if type_name in type_names:
+            # Already saw this one.
+            continue
+        type_names.add(type_name)
+        rows["types"].append((len(rows["types"]), type_name, type_namespace))
+
+        # describe_fields() gives one tuple per entry in the type's "fields".
+        described_fields = describe_fields(type_name, defined_type, type_namespace)
+        for seq, (field, (field_name, field_type, used_types, id_target, destination)) in enumerate(
+            zip(defined_type.get("fields", []), described_fields)):
+
+            rows["fields"].append((type_name, seq, field_name, json.dumps(field["type"])))
+
+            for used_as_written in used_types:
+                # These get resolved when the diagram is drawn.
+                rows["containments"].append((type_name, field_name, used_as_written, type_namespace))
+
+            if id_target is not None:
+                rows["id_targets"].append((id_target, type_name))
+            elif destination is not None:
+                rows["id_references"].append((type_name, destination, field_name))
+
+    return rows
+
+def catalog_avprs(catalog, avpr_files, cluster_order, url_file, type_comments_file, avpr_dir=None):
+    """
+    Bring a schema_catalog.SchemaCatalog up to date with the given AVPR files
+    (see iter_protocols()), urls file and type comments file. Only files whose
+    contents aren't in the catalog yet get parsed.
+
+    """
+
+    sources = []
+    for cluster_key, avpr_file in iter_avpr_files(avpr_files, cluster_order, avpr_dir):
+        avpr_text = avpr_file.read()
+        file_hash = schema_catalog.content_hash(avpr_text)
+        if not catalog.has_contents(file_hash):
+            catalog.add_contents(file_hash, protocol_to_rows(json.loads(avpr_text)))
+        sources.append((os.path.abspath(avpr_file.name), file_hash, cluster_key))
+
+    catalog.set_sources(sources)
+    catalog.remove_unused_contents()
+
+    catalog.set_side_file("urls", url_file.read() if url_file is not None else None,
+        lambda data: read_urls(data.splitlines()).items())
+    catalog.set_side_file("type_comments", type_comments_file.read() if type_comments_file is not None else None,
+        lambda data: read_type_comments(data.splitlines()).items())
+
+    catalog.commit()
+
+def resolve_catalog_rows(catalog, file_hash, symbols):
+    """
+    Work out the field type strings and the containment targets of the types in
+    one file's contents in a schema_catalog.SchemaCatalog, using the given
+    symbol table. Returns a dict of rows for SchemaCatalog.set_resolved(). A
+    containment whose type doesn't match exactly one type gets a used type of
+    None.
+
+    """
+
+    namespaces = dict(catalog.rows_for(file_hash, "types", ["type_name", "namespace"]))
+
+    resolved_fields = []
+    for type_name, seq, field_name, field_type in catalog.rows_for(file_hash, "fields",
+        ["type_name", "seq", "field_name", "field_type"]):
+        resolved_fields.append((type_name, seq, field_name, type_to_string(json.loads(field_type),
+            namespaces[type_name], symbols=symbols)))
+
+    resolved_containments = []
+    for container, field_name, used_as_written, type_namespace in catalog.rows_for(file_hash, "containments",
+        ["container", "field", "used", "namespace"]):
+        resolved_containments.append((container, field_name, used_as_written,
+            resolve_type_name(used_as_written, type_namespace, symbols)))
+
+    return {"resolved_fields": resolved_fields, "resolved_containments": resolved_containments}
+
+def query_catalog(catalog):
+    """
+    Return the same things as parse_avprs(), but worked out from what is stored
+    in a schema_catalog.SchemaCatalog instead of from the files.
+
+    """
+
+    urls = catalog.side_values("urls")
+    type_comments = catalog.side_values("type_comments")
+
+    # Like in parse_protocols(), the first protocol to define a type wins. This
+    # holds the (file hash, type name) of each type that won, so that fields and
+    # edges are only taken from there.
+    fields = {}
+    clusters = {}
+    winners = set()
+    full_names = set()
+    for file_hash, cluster_key, type_name, type_namespace in catalog.types():
+        full_names.add(type_name)
+        if type_name in fields:
+            # Already saw this one.
+            continue
+        fields[type_name] = []
+        winners.add((file_hash, type_name))
+        if cluster_key is not None:
+            clusters.setdefault(cluster_key, []).append(type_name)
+
+    symbols = build_symbol_table_from_names(full_names)
+
+    # Which type a name refers to only changes when the set of types does, so
+    # files only have to be resolved again when they are new or a type was
+    # added, removed or renamed somewhere.
+    symbols_key = schema_catalog.content_hash("\n".join(sorted(full_names)))
+    for file_hash in catalog.used_contents():
+        if catalog.resolved_with(file_hash) != symbols_key:
+            catalog.set_resolved(file_hash, symbols_key, resolve_catalog_rows(catalog, file_hash, symbols))
+    catalog.commit()
+
+    for file_hash, type_name, field_name, field_type in catalog.rows("resolved_fields",
+        ["type_name", "field_name", "field_type"]):
+        if (file_hash, type_name) in winners:
+            fields[type_name].append((field_name, field_type))
+
+    containments = set()
+    for file_hash, container, field_name, used_as_written, used in catalog.rows("resolved_containments",
+        ["container", "field", "used_as_written", "used"]):
+        if (file_hash, container) not in winners:
+            continue
+        if used is None:
+            # Don't draw an edge to a node that doesn't exist.
+            report_unresolved(container, field_name, used_as_written, symbols)
+        else:
+            containments.add((container, used, field_name))
+
+    id_targets = {}
+    for file_hash, id_target, type_name in catalog.rows("id_targets", ["target", "type_name"]):
+        if (file_hash, type_name) not in winners:
+            continue
+        if id_target in id_targets:
+            # This target is ambiguous.
+            id_targets[id_target] = None
+        else:
+            id_targets[id_target] = type_name
+
+    references = set()
+    for file_hash, from_name, to_target, from_field_name in catalog.rows("id_references",
+        ["referencer", "destination", "field"]):
+        if (file_hash, from_name) not in winners:
+            continue
+        to_name = match_id_reference(to_target, id_targets)
+        if to_name is not None:
+            references.add((from_name, to_name, from_field_name))
+
+    return fields, containments, references, clusters, urls, type_comments
 
 def main(args):
     """
@@ -593,17 +1401,99 @@ def main(args):
 
     options = parse_args(args) # This holds the nicely-parsed options object
 
+    avpr_files = None
+    if options.avprs is not None:
+        # Open the files (or archive members) one at a time, as they are read.
+        avpr_files = schema_inputs.iter_inputs(options.avprs, options.members)
+
+    if options.stream:
+        # Parse and write at the same time, with about constant memory use.
+        if options.dot is not None:
+            stream_avprs(avpr_files, options.clusters, options.urls, options.type_comments, options.dot,
+                options.avpr_dir, options.store_dir)
+        return
+
     # Parse the AVPR files and get a dict of (field name, field type) tuple
     # lists for each user-defined type, a set of (container, containee)
     # containment relationships, an a similar set of reference relationships.
-    fields, containments, references, clusters, urls, type_comments = parse_avprs(options.avprs, options.clusters, options.urls, options.type_comments)
+    if options.catalog is not None:
+        # Only parse what changed since the last run, and get the rest from the catalog.
+        catalog = schema_catalog.SchemaCatalog(options.catalog)
+        try:
+            catalog_avprs(catalog, avpr_files, options.clusters, options.urls, options.type_comments, options.avpr_dir)
+            fields, containments, references, clusters, urls, type_comments = query_catalog(catalog)
+        finally:
+            catalog.close()
+        sys.stderr.write(catalog.report() + "\n")
+    else:
+        fields, containments, references, clusters, urls, type_comments = parse_avprs(avpr_files, options.clusters, options.urls, options.type_comments,
+            options.avpr_dir)
+
+    summary = None
+    if options.summary is not None:
+        # Only keep the most central types, and stand in for the rest with a
+        # placeholder per file.
+        summary = schema_graph.summarize(fields,
+            [(containment[0], containment[1], "containment") for containment in containments] +
+            [(reference[0], reference[1], "reference") for reference in references],
+            clusters, options.summary, options.centrality, options.summary_per_cluster)
+        fields = dict((type_name, field_list) for type_name, field_list in fields.iteritems() if type_name in summary.kept)
+        containments = set(containment for containment in containments
+            if containment[0] in summary.kept and containment[1] in summary.kept)
+        references = set(reference for reference in references
+            if reference[0] in summary.kept and reference[1] in summary.kept)
+        clusters = dict((cluster_name, [type_name for type_name in cluster_types if type_name in summary.kept])
+            for cluster_name, cluster_types in clusters.iteritems())
+        sys.stderr.write("Summary: drew the {} most central types by {}, with placeholders for the other {}\n".format(
+            len(summary.kept), options.centrality, sum(len(hidden_types) for cluster_name, hidden_types in summary.hidden)))
+
+    # Table labels are built once, even when they are written to both the
+    # whole diagram and its parts.
+    label_cache = {}
+
+    layout_hints = None
+    if options.layout_hints and bool(clusters):
+        # Start dot off with the files in the order they import each other,
+        # and the containers above what they contain.
+        layout_hints = schema_graph.layout_hints(fields, clusters,
+            [(containment[0], containment[1]) for containment in containments],
+            [cluster + ".avdl" for cluster in options.clusters.split()] if options.clusters is not None else None)
+
+    detail = None
+    if options.detail != "full" or options.detail_file is not None:
+        # Work out how much of each type to draw, by type name or .avdl file.
+        try:
+            levels = detail_levels.read_detail_file(options.detail_file)
+        except ValueError as error:
+            sys.stderr.write("{}\n".format(error))
+            return 1
+        detail = detail_levels.type_detail_levels(fields, clusters, options.detail, levels,
+            dict((type_name, type_to_display(type_name)) for type_name in fields))
+
+    cycle_plan = None
+    if options.cycles is not None:
+        # Find the cycles among the edges dot ranks by (with layout hints, that
+        # is only the containments), and say what they are.
+        ranked_edges = [(containment[0], containment[1]) for containment in containments]
+        if layout_hints is None:
+            ranked_edges += [(reference[0], reference[1]) for reference in references]
+        cycle_plan = schema_graph.plan_cycles(fields, ranked_edges, clusters, options.cycles)
+        for line in schema_graph.describe_cycles(cycle_plan):
+            sys.stderr.write(line + "\n")
 
     if options.dot is not None:
         # Now we do the output to GraphViz format.
         if bool(clusters): #check if the clusters dictionary is empty...if it isn't, draw the clusters
-            write_graph_with_clusters(options.dot, fields, containments, references, clusters, urls, type_comments)
+            write_graph_with_clusters(options.dot, fields, containments, references, clusters, urls, type_comments, label_cache,
+                layout_hints, detail, cycle_plan, summary)
         else:
-            write_graph_ORIGINAL(options.dot, fields, containments, references)
+            write_graph_ORIGINAL(options.dot, fields, containments, references, detail, cycle_plan, summary)
+
+    if options.parts is not None:
+        # Also write the unconnected parts separately, so render_uml.py can lay them out at the same time.
+        part_paths = write_graph_parts(options.parts, fields, containments, references, clusters, urls, type_comments, label_cache,
+            layout_hints, detail, cycle_plan)
+        sys.stderr.write("Wrote {} parts to {}\n".format(len(part_paths), options.parts))
 
 
 if __name__ == "__main__" :
@@ -0,0 +1,371 @@
+#!/usr/bin/env python2.7
+"""
+batch_uml.py: draw many UML diagrams (e.g. one per release, and one per
+sub-area like g2p, rna or metadata) in one run, instead of one make_uml.sh run
+per diagram.
+
+The manifest is a tab-delimited file with one line per diagram:
+
+name    schema_urls file    type_header_comments file (or -)    output .svg
+
+e.g.
+
+g2p	g2p/schema_urls	g2p/type_header_comments	out/g2p.svg
+rna	rna/schema_urls	-	out/rna.svg
+
+Paths are relative to the manifest. Blank lines and lines starting with # are
+skipped. The .dot file is written next to each .svg.
+
+All diagrams are drawn in the same run, so each url is downloaded only once, no
+matter how many diagrams use it. Diagrams are drawn in parallel, with separate
+limits for the number of dot processes (--dot_jobs) and for avro-tools
+conversions and parsing (--parse_jobs). Parsing and writing the .dot files is
+done by --parse_jobs worker processes, so it isn't held back by python's global
+interpreter lock, and each worker only parses each .avpr file and builds each
+table label once, for all the diagrams it gets.
+Drawings are kept in a render cache (see render_uml.py), so diagrams which
+have not changed since the last run are not laid out again.
+
+With --git_repo, the files are read from a local clone of the schema
+repository instead of being downloaded, at the revision in each url (see
+git_source.py). So a manifest with one schema_urls file per release draws every
+release with no network access and nothing checked out.
+"""
+
+import argparse, sys, os, re, io, errno, shutil, subprocess, threading, time, multiprocessing
+from multiprocessing.pool import ThreadPool
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+import url_converter, git_source, avpr2uml, svg_minify, render_uml
+
+# Matches the imports in an .avdl file, e.g. import idl "common.avdl";
+AVDL_IMPORT_RE = re.compile(r'import\s+idl\s+"([^"]+)\.avdl"\s*;')
+
+def parse_args(args):
+    """
+    Takes in the command-line arguments list (args), and returns a nice argparse
+    result with fields for all the options.
+    """
+
+    # The command line arguments start with the program name, which we don't
+    # want to treat as an argument for argparse. So we remove it.
+    args = args[1:]
+
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--manifest", type=argparse.FileType("r"), required=True,
+        help="tab-delimited file listing the diagrams to draw")
+    parser.add_argument("--work_dir", type=str, default="batch_work",
+        help="directory for the downloaded .avdl and converted .avpr files of each diagram")
+    parser.add_argument("--avro_tools", type=str, default="avro-tools.jar",
+        help="path to avro-tools.jar (make_uml.sh downloads it)")
+    parser.add_argument("--dot_jobs", type=int, default=2,
+        help="how many dot processes may run at once")
+    parser.add_argument("--parse_jobs", type=int, default=2,
+        help="how many diagrams may be converted and parsed at once, and how many worker processes parse them")
+    parser.add_argument("--render_cache_dir", type=str, default=render_uml.default_cache_dir(),
+        help="directory to keep drawings in, so that diagrams which haven't changed don't have to be laid out again")
+    parser.add_argument("--render_cache_size", type=float, default=200,
+        help="how many megabytes of drawings to keep")
+    parser.add_argument("--no_render_cache", action="store_true",
+        help="always run dot, and don't keep the drawings")
+    parser.add_argument("--git_repo", type=str, default=None,
+        help="local clone of the schema repository to read the files at the urls from, instead of downloading them")
+    parser.add_argument("--minify", action="store_true",
+        help="run each .svg through svg_minify.py and also write a .svgz")
+    parser.add_argument("--also", type=str, nargs="+", default=[],
+        help="also write each diagram in these formats (e.g. png pdf), next to the .svg and from the same layout")
+
+    return parser.parse_args(args)
+
+class SharedCache(object):
+    """
+    A dict of values which are each computed only once, even when many threads
+    ask for the same key at the same time.
+
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.key_locks = {}
+        self.lock = threading.Lock()
+        # How many times a value was asked for, and how many times it had to be
+        # computed.
+        self.requests = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """
+        Return the value for key, calling compute() to make it if nobody has yet.
+
+        """
+
+        with self.lock:
+            self.requests += 1
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self.values:
+                self.values[key] = compute()
+                with self.lock:
+                    self.misses += 1
+            return self.values[key]
+
+def read_manifest(manifest_file):
+    """
+    Read the manifest, and return a list of (name, schema_urls path,
+    type_header_comments path or None, output .svg path) tuples. Paths are made
+    relative to the directory the manifest is in. Every diagram needs its own
+    name and output, since each name gets its own work folder.
+
+    """
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_file.name))
+
+    def resolve(path):
+        return os.path.normpath(os.path.join(base_dir, path))
+
+    diagrams = []
+    names = set()
+    svg_paths = set()
+    for line in manifest_file:
+        if line.strip() == "" or line.startswith("#"):
+            continue
+        columns = line.rstrip("\r\n").split("\t")
+        if len(columns) != 4:
+            raise RuntimeError("Manifest line should have 4 tab-separated columns: {}".format(line.strip()))
+        name, urls_path, comments_path, svg_path = columns
+        if comments_path in ["", "-"]:
+            comments_path = None
+        else:
+            comments_path = resolve(comments_path)
+        svg_path = resolve(svg_path)
+        if name in names:
+            raise RuntimeError("Manifest has more than one diagram named {}".format(name))
+        if svg_path in svg_paths:
+            raise RuntimeError("Manifest has more than one diagram writing {}".format(svg_path))
+        names.add(name)
+        svg_paths.add(svg_path)
+        diagrams.append((name, resolve(urls_path), comments_path, svg_path))
+
+    return diagrams
+
+def download(raw_url):
+    """
+    Return the contents of the file at the given url, as bytes.
+
+    """
+
+    response = urlopen(raw_url)
+    try:
+        return response.read()
+    finally:
+        response.close()
+
+def read_avdl_imports(avdl_dir):
+    """
+    Return a dict from the name (without .avdl) of each .avdl file in avdl_dir
+    to the list of names of the files it imports.
+
+    """
+
+    imports = {}
+    for avdl_name in sorted(os.listdir(avdl_dir)):
+        if avdl_name.endswith(".avdl"):
+            with io.open(os.path.join(avdl_dir, avdl_name), "r", encoding="utf-8") as avdl_file:
+                imports[avdl_name[:-5]] = [os.path.basename(imported)
+                    for imported in AVDL_IMPORT_RE.findall(avdl_file.read())]
+    return imports
+
+def avdl_import_order(avdl_dir):
+    """
+    Sort the .avdl files in avdl_dir so that every file comes after the files it
+    imports, and return their names (without .avdl) as a space-separated string,
+    like make_uml.sh does with tsort. This is the cluster order for avpr2uml.py.
+
+    """
+
+    imports = read_avdl_imports(avdl_dir)
+
+    order = []
+    visited = set()
+    def visit(name):
+        if name in visited or name not in imports:
+            return
+        visited.add(name)
+        for imported in imports[name]:
+            visit(imported)
+        order.append(name)
+
+    for name in sorted(imports):
+        visit(name)
+
+    return " ".join(order)
+
+# The parsed .avpr files and table labels kept by a parse worker process, for
+# all the diagrams it parses.
+worker_protocol_cache = {}
+worker_label_cache = {}
+
+def parse_diagram(avpr_dir, cluster_order, urls_path, comments_path, dot_path):
+    """
+    Parse the .avpr files in avpr_dir, clustered in the given order, and write
+    the diagram to dot_path. This is run in a parse worker process. Returns the
+    worker's process ID, and how many parsed .avpr files and labels it has
+    kept.
+
+    """
+
+    protocols = avpr2uml.load_protocols(None, cluster_order, avpr_dir, worker_protocol_cache)
+    with open(urls_path, "r") as url_file:
+        comments_file = open(comments_path, "r") if comments_path is not None else None
+        try:
+            fields, containments, references, clusters, urls, type_comments = avpr2uml.parse_protocols(
+                protocols, url_file, comments_file)
+        finally:
+            if comments_file is not None:
+                comments_file.close()
+
+    with open(dot_path, "w") as dot_file:
+        if bool(clusters):
+            avpr2uml.write_graph_with_clusters(dot_file, fields, containments, references, clusters, urls, type_comments,
+                worker_label_cache)
+        else:
+            avpr2uml.write_graph_ORIGINAL(dot_file, fields, containments, references)
+
+    return os.getpid(), len(worker_protocol_cache), len(worker_label_cache)
+
+def draw_diagram(diagram, options, downloads, parse_pool, convert_slots, dot_slots, render_cache, git_reader=None):
+    """
+    Download, convert, parse and draw one diagram from the manifest. The parsing
+    is done in parse_pool, a multiprocessing.Pool. Returns the number of seconds
+    it took, whether the drawing came from the render cache, and what
+    parse_diagram() returned. If git_reader is a git_source.GitBlobReader, the
+    files are read with it instead of being downloaded.
+
+    """
+
+    start_time = time.time()
+    name, urls_path, comments_path, svg_path = diagram
+
+    # Every diagram gets its own folders, since avro-tools needs the imported
+    # .avdl files next to the file being converted.
+    avdl_dir = os.path.join(options.work_dir, name, "schemas_avdl")
+    avpr_dir = os.path.join(options.work_dir, name, "schemas_avpr")
+    for folder in [avdl_dir, avpr_dir]:
+        # First clean-up old files from previous runs
+        if os.path.isdir(folder):
+            shutil.rmtree(folder)
+        os.makedirs(folder)
+
+    # Download the avdl files, or read them from the local clone. Urls shared with other diagrams are only fetched once.
+    with open(urls_path, "r") as url_file:
+        raw_urls = list(url_converter.get_raw_urls(url_file))
+    for raw_url in raw_urls:
+        if git_reader is not None:
+            contents = downloads.get(raw_url, lambda: git_source.read_url(git_reader, raw_url))
+        else:
+            contents = downloads.get(raw_url, lambda: download(raw_url))
+        with open(os.path.join(avdl_dir, raw_url.split("/")[-1]), "wb") as avdl_file:
+            avdl_file.write(contents)
+
+    with convert_slots:
+        # Make each AVDL file into a JSON AVPR file.
+        for avdl_name in sorted(os.listdir(avdl_dir)):
+            if avdl_name.endswith(".avdl"):
+                subprocess.check_call(["java", "-jar", options.avro_tools, "idl",
+                    os.path.join(avdl_dir, avdl_name),
+                    os.path.join(avpr_dir, avdl_name[:-5] + ".avpr")])
+
+    # Write the DOT file next to the svg. Other diagrams may be making the same folder.
+    if os.path.dirname(svg_path) != "":
+        try:
+            os.makedirs(os.path.dirname(svg_path))
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+    dot_path = os.path.splitext(svg_path)[0] + ".dot"
+
+    # Parse the AVPR files in order of imports, to form the clusters, in a worker process.
+    worker_stats = parse_pool.apply(parse_diagram, (avpr_dir, avdl_import_order(avdl_dir), urls_path, comments_path,
+        dot_path))
+
+    with dot_slots:
+        # Every format is written from one layout.
+        outputs = render_uml.output_list([svg_path] + [os.path.splitext(svg_path)[0] + "." + extra for extra in options.also])
+        cached = render_uml.render_outputs(dot_path, outputs, cache=render_cache) == len(outputs)
+
+    if options.minify:
+        with io.open(svg_path, "r", encoding="utf-8") as svg_file:
+            minified = svg_minify.minify_svg(svg_file.read())
+        with io.open(svg_path, "w", encoding="utf-8") as svg_file:
+            svg_file.write(minified)
+        svg_minify.write_svgz(minified, os.path.splitext(svg_path)[0] + ".svgz")
+
+    return time.time() - start_time, cached, worker_stats
+
+def main(args):
+    """
+    Parses command line arguments, and does the work of the program.
+    "args" specifies the program arguments, with args[0] being the executable
+    name. The return value should be used as the program's exit code.
+    """
+
+    options = parse_args(args)
+
+    if not os.path.isfile(options.avro_tools):
+        sys.stderr.write("Can't find {}. Run make_uml.sh once to download it, or pass --avro_tools\n".format(options.avro_tools))
+        return 1
+
+    diagrams = read_manifest(options.manifest)
+
+    # Start the parse workers first, before there are any threads for them to inherit.
+    parse_pool = multiprocessing.Pool(options.parse_jobs)
+
+    # These are shared by all the diagrams.
+    downloads = SharedCache()
+    convert_slots = threading.BoundedSemaphore(options.parse_jobs)
+    dot_slots = threading.BoundedSemaphore(options.dot_jobs)
+    render_cache = None
+    if not options.no_render_cache:
+        render_cache = render_uml.RenderCache(options.render_cache_dir, int(options.render_cache_size * 1024 * 1024))
+
+    # One git cat-file process reads the files of every revision for every diagram.
+    git_reader = None
+    if options.git_repo is not None:
+        git_reader = git_source.GitBlobReader(options.git_repo)
+
+    # Enough threads that every conversion, parse and dot slot can be busy at once.
+    pool = ThreadPool(options.parse_jobs + options.dot_jobs)
+    results = [(diagram, pool.apply_async(draw_diagram, (diagram, options, downloads,
+        parse_pool, convert_slots, dot_slots, render_cache, git_reader))) for diagram in diagrams]
+    pool.close()
+
+    failures = 0
+    # How many parsed .avpr files and labels each parse worker kept, by process ID.
+    worker_kept = {}
+    for diagram, result in results:
+        try:
+            seconds, cached, (worker_id, protocols_kept, labels_kept) = result.get()
+            worker_kept[worker_id] = max(worker_kept.get(worker_id, (0, 0)), (protocols_kept, labels_kept))
+            sys.stderr.write("{}: wrote {} in {:.2f}s{}\n".format(diagram[0], diagram[3], seconds,
+                " (drawing from the render cache)" if cached else ""))
+        except Exception as error:
+            failures += 1
+            sys.stderr.write("{}: FAILED: {}\n".format(diagram[0], error))
+    pool.join()
+    parse_pool.close()
+    parse_pool.join()
+    if git_reader is not None:
+        git_reader.close()
+
+    sys.stderr.write("{} diagrams, {} failed. {} {} files for {} urls. {} parse workers kept {} parsed .avpr files and {} labels\n".format(
+        len(diagrams), failures, "Downloaded" if git_reader is None else "Read", downloads.misses, downloads.requests,
+        len(worker_kept), sum(kept[0] for kept in worker_kept.values()), sum(kept[1] for kept in worker_kept.values())))
+
+    return 1 if failures > 0 else 0
+
+if __name__ == "__main__" :
+    sys.exit(main(sys.argv))
@@ -0,0 +1,174 @@
+#!/usr/bin/env python2.7
+"""
+build_cache.py: convert every .avdl file in schemas_avdl into an .avpr file in
+schemas_avpr with avro-tools, for make_uml.sh. Only files that changed are
+actually converted:
+
+python build_cache.py --avdl_dir schemas_avdl --avpr_dir schemas_avpr
+
+Every .avpr file is kept in a cache directory (by default
+~/.cache/schema-uml-build), under a hash of its .avdl file, of every file it
+imports (directly or not), and of avro-tools.jar itself. avro-tools copies the
+imported types into each .avpr, so a change to any of those gives a different
+.avpr. If the same inputs were converted before, the .avpr is copied from the
+cache instead of starting java. The other files are converted --jobs at a time.
+
+The cache is kept under --cache_size megabytes by deleting the files that were
+least recently used, just like render_uml.py's cache of drawings.
+"""
+
+import argparse, sys, os, hashlib, subprocess, multiprocessing
+from multiprocessing.pool import ThreadPool
+import batch_uml, render_uml
+
+def parse_args(args):
+    """
+    Takes in the command-line arguments list (args), and returns a nice argparse
+    result with fields for all the options.
+    """
+
+    # The command line arguments start with the program name, which we don't
+    # want to treat as an argument for argparse. So we remove it.
+    args = args[1:]
+
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--avdl_dir", type=str, default="schemas_avdl",
+        help="directory of .avdl files to convert")
+    parser.add_argument("--avpr_dir", type=str, default="schemas_avpr",
+        help="directory to write the .avpr files to")
+    parser.add_argument("--avro_tools", type=str, default="avro-tools.jar",
+        help="path to avro-tools.jar")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(),
+        help="how many avro-tools conversions may run at once")
+    parser.add_argument("--cache_dir", type=str, default=default_cache_dir(),
+        help="directory to keep converted files in")
+    parser.add_argument("--cache_size", type=float, default=200,
+        help="how many megabytes of converted files to keep")
+    parser.add_argument("--no_cache", action="store_true",
+        help="always run avro-tools, and don't keep the converted files")
+
+    return parser.parse_args(args)
+
+def default_cache_dir():
+    """
+    Return the directory converted files are kept in by default, e.g.
+    ~/.cache/schema-uml-build (next to render_uml.py's drawings).
+
+    """
+
+    return os.path.join(os.path.dirname(render_uml.default_cache_dir()), "schema-uml-build")
+
+def file_hash(path):
+    """
+    Return the SHA-1 hex digest of the contents of the file at path.
+
+    """
+
+    hasher = hashlib.sha1()
+    with open(path, "rb") as hashed_file:
+        for block in iter(lambda: hashed_file.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def import_closure(name, imports):
+    """
+    Given a name and a dict from each name to the list of names it imports,
+    return the set of the name and every name it imports, directly or not.
+
+    """
+
+    closure = set()
+    to_visit = [name]
+    while to_visit:
+        visiting = to_visit.pop()
+        if visiting not in closure:
+            closure.add(visiting)
+            to_visit.extend(imports.get(visiting, []))
+    return closure
+
+def conversion_key(name, imports, content_hashes, tool_id):
+    """
+    Return the cache key for converting the .avdl file with the given name: a
+    hash of the tool_id, and of the name and contents hash of the file and of
+    everything it imports. content_hashes is a dict from name to contents hash,
+    without the names of missing files.
+
+    """
+
+    hasher = hashlib.sha1(tool_id.encode("utf-8"))
+    for closure_name in sorted(import_closure(name, imports)):
+        hasher.update(u"\0{}\0{}".format(closure_name, content_hashes.get(closure_name, "missing")).encode("utf-8"))
+    return hasher.hexdigest()
+
+def convert_avdls(avdl_dir, avpr_dir, avro_tools, cache=None, jobs=None):
+    """
+    Convert every .avdl file in avdl_dir to an .avpr file of the same name in
+    avpr_dir, jobs at a time (by default, one per CPU). If cache is a
+    render_uml.RenderCache, files are copied from it when their inputs haven't
+    changed, and new conversions are kept in it. Files that fail to convert have
+    the avro-tools output printed.
+
+    Returns (number of files, number copied from the cache, list of names that
+    failed).
+
+    """
+
+    if not os.path.isdir(avpr_dir):
+        os.makedirs(avpr_dir)
+
+    imports = batch_uml.read_avdl_imports(avdl_dir)
+    names = sorted(imports)
+    content_hashes = dict((name, file_hash(os.path.join(avdl_dir, name + ".avdl"))) for name in names)
+    # A different avro-tools might write a different .avpr for the same input.
+    tool_id = "avro-tools " + file_hash(avro_tools)
+
+    # Converts one file, and returns "cached", "converted" or "failed".
+    def convert(name):
+        avpr_path = os.path.join(avpr_dir, name + ".avpr")
+        key = conversion_key(name, imports, content_hashes, tool_id)
+        if cache is not None and cache.fetch(key, "avpr", avpr_path):
+            return "cached"
+
+        process = subprocess.Popen(["java", "-jar", avro_tools, "idl", os.path.join(avdl_dir, name + ".avdl"), avpr_path],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        if process.returncode != 0:
+            # Print it all at once, so it doesn't get mixed up with the other conversions.
+            sys.stderr.write("avro-tools could not convert {}.avdl:\n{}\n".format(name, output.decode("utf-8", "replace")))
+            return "failed"
+
+        if cache is not None:
+            cache.store(key, "avpr", avpr_path)
+        return "converted"
+
+    pool = ThreadPool(jobs or multiprocessing.cpu_count())
+    try:
+        results = pool.map(convert, names)
+    finally:
+        pool.close()
+
+    failed = [name for name, result in zip(names, results) if result == "failed"]
+    return len(names), results.count("cached"), failed
+
+def main(args):
+    """
+    Parses command line arguments, and does the work of the program.
+    "args" specifies the program arguments, with args[0] being the executable
+    name. The return value should be used as the program's exit code.
+    """
+
+    options = parse_args(args)
+
+    cache = None
+    if not options.no_cache:
+        cache = render_uml.RenderCache(options.cache_dir, int(options.cache_size * 1024 * 1024))
+
+    total, cached, failed = convert_avdls(options.avdl_dir, options.avpr_dir, options.avro_tools, cache, options.jobs)
+    sys.stderr.write("Converted {} .avdl files ({} from the build cache, {} failed)\n".format(total, cached, len(failed)))
+
+    return 1 if failed else 0
+
+if __name__ == "__main__" :
+    sys.exit(main(sys.argv))
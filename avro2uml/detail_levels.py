@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Level of detail for the UML generators' --detail and --detail_file options.
+
+Every type is normally drawn as a full table with a cell (and a port, for edges
+to start or end at) for each field. Big tables are slow for Graphviz to size and
+route edges around, so a type can instead be drawn at a lower level of detail:
+
+full: the whole table, as usual
+edges: only the fields that edges start or end at
+header: just the name (and header comment)
+
+The detail file is tab-delimited, like the type header comments file, with a
+schema file name (e.g. reads.avdl or reads.proto) or a type name on each line,
+and then a level. A type's own line wins over its file's line, which wins over
+--detail. Edges to fields that aren't drawn start or end at the side of the
+type instead.
+"""
+
+# The levels of detail, from the most to the least.
+DETAIL_LEVELS = ["full", "edges", "header"]
+
+def read_detail_file(detail_file):
+    """
+    Return a dict from schema file or type name to level of detail, read from
+    the given tab-delimited file object (or an empty dict if it is None).
+    Blank lines and lines starting with # are skipped. Raises ValueError for a
+    level that isn't in DETAIL_LEVELS.
+
+    """
+
+    levels = {}
+    if detail_file is None:
+        return levels
+    for line_number, line in enumerate(detail_file, 1):
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        parts = line.split("\t")
+        if len(parts) != 2 or parts[1].strip() not in DETAIL_LEVELS:
+            raise ValueError("Line {} of {} should be a name, a tab, and one of {}: {!r}".format(line_number,
+                getattr(detail_file, "name", "the detail file"), ", ".join(DETAIL_LEVELS), line))
+        levels[parts[0].strip()] = parts[1].strip()
+    return levels
+
+def type_detail_levels(type_names, clusters, default="full", levels=None, display_names=None):
+    """
+    Return a dict from each of the given type names to the level of detail to
+    draw it at. clusters is a dict from schema file name to list of type names,
+    levels is a dict from read_detail_file(), and display_names is an optional
+    dict from type name to the shorter name the type is drawn with, which the
+    detail file can also use.
+
+    """
+
+    levels = levels or {}
+    display_names = display_names or {}
+
+    cluster_levels = {}
+    for cluster_name, cluster_types in clusters.items():
+        if cluster_name in levels:
+            for type_name in cluster_types:
+                cluster_levels[type_name] = levels[cluster_name]
+
+    type_levels = {}
+    for type_name in type_names:
+        if type_name in levels:
+            type_levels[type_name] = levels[type_name]
+        elif display_names.get(type_name) in levels:
+            type_levels[type_name] = levels[display_names[type_name]]
+        else:
+            type_levels[type_name] = cluster_levels.get(type_name, default)
+    return type_levels
+
+def apply_detail(fields, detail, edge_ports):
+    """
+    Given a dict from type name to list of (field name, field type) tuples, a
+    dict from type name to level of detail (types not in it are drawn in
+    full), and an iterable of (type name, port) pairs for both ends of every
+    edge, return (fields, shown_ports). fields has only the fields to draw for
+    each type, and shown_ports is a dict from the name of each type not drawn in
+    full to the set of ports it still has, for edge_end().
+
+    """
+
+    used_ports = {}
+    for type_name, port in edge_ports:
+        used_ports.setdefault(type_name, set()).add(port)
+
+    shown_fields = {}
+    shown_ports = {}
+    for type_name, field_list in fields.items():
+        level = detail.get(type_name, "full")
+        if level == "full":
+            shown_fields[type_name] = field_list
+            continue
+        if level == "edges":
+            field_list = [field for field in field_list if field[0] in used_ports.get(type_name, ())]
+        else:
+            field_list = []
+        shown_fields[type_name] = field_list
+        shown_ports[type_name] = set(field[0] for field in field_list)
+    return shown_fields, shown_ports
+
+def edge_end(node, port, shown=None):
+    """
+    Return where an edge should start or end for the given port of the given
+    node, in dot syntax: "node:port:w", or just "node" if shown (the set of
+    ports the node still has, from apply_detail()) doesn't have the port. If
+    shown is None, the node is drawn in full and has every port.
+
+    """
+
+    if shown is not None and port not in shown:
+        return node
+    return "{}:{}:w".format(node, port)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+Reads schema files straight out of a local clone of the schema repository, at
+any revision, instead of downloading them or checking anything out, e.g.:
+
+python git_source.py --repo ../schemas --urls schema_urls --out_dir schemas_avdl
+
+The github urls in the --urls file are mapped to paths in the clone, at the
+revision in each url (or at --revision). Files can also be given as --paths in
+the repository (a directory means all the files in it ending in --suffix).
+
+With more than one --revision, the files of each revision are written to their
+own folder in --out_dir, e.g. for drawing every release of the schema:
+
+python git_source.py --repo ../schemas --paths src/main/resources/avro --suffix .avdl --revision v0.5.1 v0.6.0a1 master --out_dir snapshots
+
+Every file is read through one git cat-file --batch process, which stays
+running for as long as it is needed, so reading many files from many
+revisions doesn't start a git process for each.
+"""
+
+import argparse, sys, os, subprocess, threading
+import url_converter
+
+def parse_args(args):
+    """
+    Takes in the command-line arguments list (args), and returns a nice argparse
+    result with fields for all the options.
+    """
+
+    # The command line arguments start with the program name, which we don't
+    # want to treat as an argument for argparse. So we remove it.
+    args = args[1:]
+
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--repo", type=str, required=True,
+        help="local clone of the schema repository")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--urls", type=argparse.FileType("r"),
+        help="file of github urls of the schema files")
+    group.add_argument("--paths", type=str, nargs="+",
+        help="paths of schema files, or of directories of them, in the repository")
+    parser.add_argument("--revision", type=str, nargs="+", default=None,
+        help="revision(s) to read, instead of the one in each url (for --paths, the default is HEAD)")
+    parser.add_argument("--suffix", type=str, default="",
+        help="only read files ending in this from directories in --paths, e.g. .avdl")
+    parser.add_argument("--out_dir", type=str, required=True,
+        help="directory to write the files to")
+
+    return parser.parse_args(args)
+
+class GitBlobReader(object):
+    """
+    Reads objects out of a git repository through one long-running git cat-file
+    --batch process. Many threads can use the same reader.
+
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.process = subprocess.Popen(["git", "-C", repository, "cat-file", "--batch"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        # Only one request can be written and answered at a time.
+        self.lock = threading.Lock()
+        # How many objects were read.
+        self.requests = 0
+        # How many bytes long object ids are (20 for SHA-1). Worked out from
+        # the first tree that is read, for list_directory().
+        self.id_bytes = 20
+
+    def read_object(self, name):
+        """
+        Return (type, contents) for the object with the given name, e.g.
+        "v0.6.0:src/main/resources/avro/reads.avdl", where type is e.g. "blob"
+        or "tree" and contents is bytes. Returns None if there is no such
+        object.
+
+        """
+
+        if "\n" in name:
+            raise ValueError("Object names can't contain newlines: {!r}".format(name))
+
+        with self.lock:
+            self.requests += 1
+            self.process.stdin.write((name + "\n").encode("utf-8"))
+            self.process.stdin.flush()
+
+            # The answer is "<id> <type> <size>" and then the contents and a
+            # newline, or "<name> missing".
+            header = self.process.stdout.readline().decode("utf-8", "replace").rstrip("\n")
+            if header == "":
+                raise RuntimeError("git cat-file stopped running in {}".format(self.repository))
+            header_parts = header.split(" ")
+            if header_parts[-1] in ["missing", "ambiguous"]:
+                return None
+            object_id, object_type, size = header_parts
+            contents = self.process.stdout.read(int(size))
+            self.process.stdout.read(1)
+
+        if object_type == "tree":
+            self.id_bytes = len(object_id) // 2
+        return object_type, contents
+
+    def read(self, revision, path):
+        """
+        Return the contents of the file at path in the given revision, as
+        bytes. Raises IOError if there is no such file.
+
+        """
+
+        found = self.read_object("{}:{}".format(revision, path))
+        if found is None or found[0] != "blob":
+            raise IOError("{} has no file {} in revision {}".format(self.repository, path, revision))
+        return found[1]
+
+    def list_directory(self, revision, directory):
+        """
+        Return the sorted names of the files in the given directory of the given
+        revision, or None if it isn't a directory.
+
+        """
+
+        found = self.read_object("{}:{}".format(revision, directory.rstrip("/")))
+        if found is None or found[0] != "tree":
+            return None
+
+        # A tree is a list of "<mode> <name>\0" followed by the binary object
+        # id. Directories have mode 40000, and submodules 160000.
+        names = []
+        tree = found[1]
+        offset = 0
+        while offset < len(tree):
+            name_end = tree.index(b"\0", offset)
+            mode, name = tree[offset:name_end].split(b" ", 1)
+            offset = name_end + 1 + self.id_bytes
+            if mode not in [b"40000", b"160000"]:
+                names.append(name.decode("utf-8"))
+        return sorted(names)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+def read_url(reader, url, revision=None):
+    """
+    Return the contents of the file at the given github url from the clone that
+    reader reads, at the revision in the url, or at revision if given.
+
+    """
+
+    url_revision, path = url_converter.get_revision_and_path(url)
+    return reader.read(revision or url_revision, path)
+
+def write_files(files, out_dir):
+    """
+    Write each (name, contents) pair to a file called name in out_dir, which is
+    made if needed.
+
+    """
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    for name, contents in files:
+        with open(os.path.join(out_dir, name), "wb") as out_file:
+            out_file.write(contents)
+
+def read_paths(reader, revision, paths, suffix=""):
+    """
+    Return a list of (file name, contents) pairs for the given paths in the
+    given revision. Directories stand for all the files in them ending in suffix.
+
+    """
+
+    files = []
+    for path in paths:
+        names = reader.list_directory(revision, path)
+        if names is None:
+            files.append((os.path.basename(path), reader.read(revision, path)))
+        else:
+            for name in names:
+                if name.endswith(suffix):
+                    files.append((name, reader.read(revision, path.rstrip("/") + "/" + name)))
+    return files
+
+def main(args):
+    """
+    Parses command line arguments, and does the work of the program.
+    "args" specifies the program arguments, with args[0] being the executable
+    name. The return value should be used as the program's exit code.
+    """
+
+    options = parse_args(args)
+
+    urls = None
+    if options.urls is not None:
+        urls = [url.strip() for url in options.urls if url.strip() != ""]
+    revisions = options.revision or [None]
+
+    reader = GitBlobReader(options.repo)
+    try:
+        for revision in revisions:
+            if urls is not None:
+                files = [(url.split("/")[-1], read_url(reader, url, revision)) for url in urls]
+            else:
+                files = read_paths(reader, revision or "HEAD", options.paths, options.suffix)
+
+            out_dir = options.out_dir
+            if len(revisions) > 1:
+                # Each revision gets its own folder. Branch names can have slashes.
+                out_dir = os.path.join(out_dir, revision.replace("/", "_"))
+            write_files(files, out_dir)
+            sys.stderr.write("Wrote {} files{} to {}\n".format(len(files),
+                " from " + revision if revision is not None else "", out_dir))
+    except (IOError, ValueError) as error:
+        # ValueError is a url that no url rule can map to a revision and path.
+        sys.stderr.write("{}\n".format(error))
+        return 1
+    finally:
+        reader.close()
+
+    return 0
+
+if __name__ == "__main__" :
+    sys.exit(main(sys.argv))
@@ -6,13 +6,24 @@
 # First clean-up old files from previous runs
 rm -rf schemas_avdl/*
 rm -rf schemas_avpr/*
-# Obtain the raw github url's if not raw already:
-raw_schema_urls=$(python url_converter.py --getrawfromfile schema_urls)
-# Note: This wget command will overwrite old versions of files upon re-download, but it will not delete old unwanted files.
-for raw_url in ${raw_schema_urls};
-do
-    wget --timestamping --directory-prefix ./schemas_avdl ${raw_url};
-done
+if [ -n "${SCHEMA_REPO}" ]
+then
+    # Read the files in schema_urls straight out of a local clone of the schema repository instead of downloading them,
+    # at the revision in each url, or at ${SCHEMA_REVISION} if it is set. Nothing is checked out.
+    python git_source.py --repo "${SCHEMA_REPO}" --urls schema_urls --out_dir schemas_avdl ${SCHEMA_REVISION:+--revision "${SCHEMA_REVISION}"} || exit 1
+else
+    # Obtain the raw github url's if not raw already (and those of other hosts in ${SCHEMA_URL_RULES}, if it is set):
+    raw_schema_urls=$(python url_converter.py --getrawfromfile schema_urls)
+    # Note: This wget command will overwrite old versions of files upon re-download, but it will not delete old unwanted files.
+    for raw_url in ${raw_schema_urls};
+    do
+        case "${raw_url}" in
+            # wget can't read file:// urls, e.g. from a checked-out mirror (see url_converter.py --rules)
+            file://*) cp "${raw_url#file://}" ./schemas_avdl/ ;;
+            *) wget --timestamping --directory-prefix ./schemas_avdl ${raw_url} ;;
+        esac
+    done
+fi
 
 ######################################
 
@@ -23,23 +34,10 @@ then
     curl -o avro-tools.jar  http://www.us.apache.org/dist/avro/avro-1.7.7/java/avro-tools-1.7.7.jar
 fi
 
-# Make a directory for all the .avpr files
-mkdir -p schemas_avpr
-
-for AVDL_FILE in ./schemas_avdl/*.avdl
-do
-    # Make each AVDL file into a JSON AVPR file.
-
-    # Get the name of the AVDL file without its extension or path
-    SCHEMA_NAME=$(basename "$AVDL_FILE" .avdl)
-
-    # Decide what AVPR file it will become.
-    AVPR_FILE="./schemas_avpr/${SCHEMA_NAME}.avpr"
-
-    # Compile the AVDL to the AVPR
-    java -jar avro-tools.jar idl "${AVDL_FILE}" "${AVPR_FILE}"
-
-done
+# Make each AVDL file into a JSON AVPR file in schemas_avpr.
+# build_cache.py only runs avro-tools for files that changed (or whose imports changed) since they were last converted,
+# and copies the rest from its cache. Conversions run in parallel.
+python build_cache.py --avdl_dir schemas_avdl --avpr_dir schemas_avpr --avro_tools avro-tools.jar
 
 ######################################
 
@@ -60,7 +58,34 @@ done | tsort | tac | awk -vORS=" " '{ print $1 }' | sed 's/ $//'
 # Note: You now need to declare --avprs because it is no longer a positional argument
 # ./avpr2uml.py --avprs `ls ./schemas_avpr/* | grep -v method` --dot uml.dot
 
-# Or make the DOT file using clusters, urls, colors, and header comments
-./avpr2uml.py --clusters "${avpr_import_order}" --dot uml.dot --urls schema_urls --type_comments type_header_comments
+# Or make the DOT file using clusters, urls, colors, and header comments.
+# Each part of the diagram that isn't connected to the rest is also written to its own file in uml_parts.
+# If ${LAYOUT_PROFILE} is set (draft, balanced or publication), the types are written in an order that is easier for dot to lay out.
+# If ${UML_DETAIL} is set (edges or header), types are drawn with fewer fields, which is quicker to lay out.
+# If ${UML_CYCLES} is set (break or collapse), types that contain or reference each other in a cycle are reported and untangled.
+./avpr2uml.py --clusters "${avpr_import_order}" --dot uml.dot --urls schema_urls --type_comments type_header_comments --parts uml_parts ${LAYOUT_PROFILE:+--layout_hints} ${UML_DETAIL:+--detail "${UML_DETAIL}"} ${UML_CYCLES:+--cycles "${UML_CYCLES}"}
+
+# Draw the UML diagram. render_uml.py lays out the parts at the same time, with one dot process each, and packs them together.
+# Parts which were drawn before are taken from its cache. ${LAYOUT_PROFILE} trades drawing quality for layout time, e.g. LAYOUT_PROFILE=draft.
+# Files in ${UML_EXTRA_OUTPUTS} (e.g. "uml.png uml.pdf") are written from the same layout, without laying it out again.
+python render_uml.py --parts uml_parts/*.dot --out uml.svg ${UML_EXTRA_OUTPUTS} ${LAYOUT_PROFILE:+--profile "${LAYOUT_PROFILE}"}
+
+# Strip the redundant attributes and comments dot writes, and also write a compressed uml.svgz
+python svg_minify.py --svg uml.svg --svgz
+
+# If ${UML_SUMMARY} is set (e.g. 25), also draw uml_summary.svg: an overview with only that many of the most central types,
+# and a box per file for the rest, which takes about as long to lay out however big the schema is.
+# ${UML_CENTRALITY} (degree or pagerank) says how central types are.
+if [ -n "${UML_SUMMARY}" ]
+then
+    ./avpr2uml.py --clusters "${avpr_import_order}" --dot uml_summary.dot --urls schema_urls --type_comments type_header_comments --summary "${UML_SUMMARY}" ${UML_CENTRALITY:+--centrality "${UML_CENTRALITY}"}
+    python render_uml.py --dot uml_summary.dot --out uml_summary.svg ${LAYOUT_PROFILE:+--profile "${LAYOUT_PROFILE}"}
+    python svg_minify.py --svg uml_summary.svg
+fi
 
-dot uml.dot -T svg -o uml.svg
+# With --watch, keep redrawing the diagram every time a file in schemas_avdl is saved (press Ctrl-C to stop)
+# It draws and minifies it the same way as above, with the same ${LAYOUT_PROFILE}, ${UML_DETAIL} and ${UML_CYCLES}.
+if [ "$1" == "--watch" ]
+then
+    python watch_uml.py --urls schema_urls --type_comments type_header_comments --parts uml_parts --minify ${LAYOUT_PROFILE:+--profile "${LAYOUT_PROFILE}"} ${UML_DETAIL:+--detail "${UML_DETAIL}"} ${UML_CYCLES:+--cycles "${UML_CYCLES}"}
+fi
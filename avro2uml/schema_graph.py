@@ -0,0 +1,533 @@
+#!/usr/bin/env python
+"""
+Splits a UML diagram into the parts that aren't connected to each other, so
+that render_uml.py can lay the parts out at the same time with one dot process
+each, and then pack them into one drawing.
+
+Two types are in the same part if there is an edge between them, or if they are
+in the same cluster (so that each schema file is still drawn as one box, with
+its link). Big schemas often have many such parts: enums nobody uses, and files
+that don't import each other.
+
+Also works out layout hints (see layout_hints()): an order for clusters and
+types that dot can start from, so that it needs fewer rounds of moving nodes
+around to get edges to cross less.
+
+And finds the cycles in the diagram (see plan_cycles()): types that contain or
+reference each other, round and round. dot has to turn edges around to rank a
+cycle, which is slow and tangles big diagrams, so the generators' --cycles
+option either breaks each cycle at a fixed edge, or draws it as one group.
+
+And picks the most central types for an overview of a huge schema (see
+summarize()): the generators' --summary option draws only those, and one "N
+more types" box per cluster for the rest, so the overview costs about the same
+to lay out however big the schema gets.
+"""
+
+import os, collections
+
+# The order the UML generators write clusters and types in, with their
+# --layout_hints option. Both are lists of names.
+LayoutHints = collections.namedtuple("LayoutHints", ["cluster_order", "type_order"])
+
+# How the UML generators draw the cycles in a diagram, with their --cycles
+# option. components is the sorted list of cycles, each a sorted list of type
+# names (a type that contains itself is a cycle of one). loose_edges is a set of
+# (from, to) pairs for edges that dot shouldn't use for ranking. groups is a
+# dict from cluster name (or None, for types in no cluster) to a list of
+# (cycle number, types) pairs for cycles to draw as a box inside the cluster.
+CyclePlan = collections.namedtuple("CyclePlan", ["mode", "components", "loose_edges", "groups"])
+
+# The values of the generators' --cycles option.
+CYCLE_MODES = ["break", "collapse"]
+
+# What the UML generators draw with their --summary option. kept is the set of
+# types drawn as usual. hidden is a list of (cluster name, or None for types in
+# no cluster, sorted list of types) pairs, one for each "N more types"
+# placeholder. edges is a sorted list of (from, to, kind, count) tuples for the
+# edges to or from hidden types, collapsed into one edge per pair of ends and
+# kind, where each end is ("type", type name) for a kept type or ("more",
+# index in hidden) for a placeholder.
+Summary = collections.namedtuple("Summary", ["kept", "hidden", "edges"])
+
+# The values of the generators' --centrality option.
+CENTRALITY_MEASURES = ["degree", "pagerank"]
+
+def connected_components(nodes, edges, groups=()):
+    """
+    Given an iterable of node names, an iterable of (from, to) edges, and an
+    iterable of lists of nodes that must stay together, return the connected
+    components as sorted lists of node names. Nodes only named in edges or
+    groups are included too. The biggest component comes first, and components
+    of the same size are in order of their first node, so the result is always
+    the same for the same graph.
+
+    """
+
+    # Union-find, with each node pointing towards the representative of its
+    # component.
+    parents = {}
+
+    def find(node):
+        parents.setdefault(node, node)
+        while parents[node] != node:
+            # Point past the parent while we're here, to keep paths short.
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    def union(first, second):
+        first_root = find(first)
+        second_root = find(second)
+        if first_root != second_root:
+            parents[max(first_root, second_root)] = min(first_root, second_root)
+
+    for node in nodes:
+        find(node)
+    for from_node, to_node in edges:
+        union(from_node, to_node)
+    for group in groups:
+        group = list(group)
+        for node in group[1:]:
+            union(group[0], node)
+
+    components = {}
+    for node in list(parents):
+        components.setdefault(find(node), []).append(node)
+
+    return sorted((sorted(component) for component in components.values()),
+        key=lambda component: (-len(component), component[0]))
+
+def write_parts(parts_dir, components, write_part):
+    """
+    Write each component (from connected_components()) to its own .dot file in
+    parts_dir, called part_000.dot, part_001.dot and so on, by calling
+    write_part(component, dot_file). Parts left over from an earlier run are
+    deleted first. Returns the list of paths written.
+
+    """
+
+    if not os.path.isdir(parts_dir):
+        os.makedirs(parts_dir)
+    for name in os.listdir(parts_dir):
+        if name.startswith("part_") and name.endswith(".dot"):
+            os.remove(os.path.join(parts_dir, name))
+
+    paths = []
+    for index, component in enumerate(components):
+        path = os.path.join(parts_dir, "part_{:03d}.dot".format(index))
+        with open(path, "w") as dot_file:
+            write_part(component, dot_file)
+        paths.append(path)
+    return paths
+
+def containment_depths(nodes, edges):
+    """
+    Given an iterable of node names and an iterable of (container, containee)
+    edges, return a dict from each node to how many containments down it is
+    from a node that nothing contains. Nodes that are only contained as part of
+    a cycle count from the first of them by name.
+
+    """
+
+    children = {}
+    contained = set()
+    for container, containee in edges:
+        if container != containee:
+            children.setdefault(container, []).append(containee)
+            contained.add(containee)
+
+    depths = {}
+    def visit_from(queue):
+        # Breadth-first, so each node gets the depth of its shortest path.
+        while queue:
+            node = queue.popleft()
+            for child in children.get(node, []):
+                if child not in depths:
+                    depths[child] = depths[node] + 1
+                    queue.append(child)
+
+    all_nodes = sorted(set(nodes) | set(children) | contained)
+    roots = [node for node in all_nodes if node not in contained]
+    for root in roots:
+        depths[root] = 0
+    visit_from(collections.deque(roots))
+    for node in all_nodes:
+        if node not in depths:
+            depths[node] = 0
+            visit_from(collections.deque([node]))
+    return depths
+
+def cluster_order_from_edges(clusters, edges):
+    """
+    Given a dict from cluster name to list of type names, and an iterable of
+    (container, containee) edges, return the cluster names in an order where
+    each cluster comes after the clusters with types its own types contain
+    (like files come after the files they import). Ties, and clusters that
+    contain each other, go by name.
+
+    """
+
+    cluster_of = {}
+    for cluster_name, cluster_types in clusters.items():
+        for type_name in cluster_types:
+            cluster_of[type_name] = cluster_name
+
+    # Which clusters each cluster has to come after.
+    before = dict((cluster_name, set()) for cluster_name in clusters)
+    for container, containee in edges:
+        if container in cluster_of and containee in cluster_of and cluster_of[container] != cluster_of[containee]:
+            before[cluster_of[container]].add(cluster_of[containee])
+
+    order = []
+    placed = set()
+    while len(order) < len(before):
+        ready = [cluster_name for cluster_name in sorted(before)
+            if cluster_name not in placed and before[cluster_name] <= placed]
+        if not ready:
+            # Clusters that contain each other. Go on with the first one.
+            ready = [min(cluster_name for cluster_name in before if cluster_name not in placed)]
+        for cluster_name in ready:
+            order.append(cluster_name)
+            placed.add(cluster_name)
+    return order
+
+def layout_hints(fields, clusters, edges, cluster_order=None):
+    """
+    Return LayoutHints for drawing the types in fields (a dict by type name),
+    grouped into the given clusters, with the given (container, containee)
+    containment edges. Clusters go in cluster_order (e.g. the import order of
+    the files), followed by any others in cluster_order_from_edges() order.
+    Types go cluster by cluster, and in each cluster from the containers down
+    to what they contain. Types in no cluster come last.
+
+    dot places nodes in the order they first appear in the file, before it
+    starts moving them around, and containers end up above what they contain.
+    So this order already has few crossings.
+
+    """
+
+    edges = list(edges)
+    derived_order = cluster_order_from_edges(clusters, edges)
+    if cluster_order is None:
+        cluster_order = derived_order
+    else:
+        cluster_order = [cluster_name for cluster_name in cluster_order if cluster_name in clusters]
+        listed = set(cluster_order)
+        cluster_order += [cluster_name for cluster_name in derived_order if cluster_name not in listed]
+
+    depths = containment_depths(fields, edges)
+    def by_depth(type_names):
+        return sorted(type_names, key=lambda type_name: (depths.get(type_name, 0), type_name))
+
+    type_order = []
+    placed = set()
+    for cluster_name in cluster_order:
+        for type_name in by_depth(type_name for type_name in clusters[cluster_name] if type_name in fields):
+            if type_name not in placed:
+                type_order.append(type_name)
+                placed.add(type_name)
+    type_order += by_depth(type_name for type_name in fields if type_name not in placed)
+
+    return LayoutHints(cluster_order, type_order)
+
+def hinted_order(order, names):
+    """
+    Return the given names in the given order (a list, e.g. from LayoutHints),
+    followed by any names that aren't in it, sorted.
+
+    """
+
+    names = set(names)
+    ordered = [name for name in order if name in names]
+    return ordered + sorted(names.difference(ordered))
+
+def successor_lists(nodes, edges):
+    """
+    Return a dict from every node (in nodes, or named in the (from, to) edges)
+    to the sorted list of nodes it has edges to.
+
+    """
+
+    successors = dict((node, set()) for node in nodes)
+    for from_node, to_node in edges:
+        successors.setdefault(from_node, set()).add(to_node)
+        successors.setdefault(to_node, set())
+    return dict((node, sorted(to_nodes)) for node, to_nodes in successors.items())
+
+def strongly_connected_components(nodes, edges):
+    """
+    Return the strongly connected components of the graph with the given nodes
+    and (from, to) edges: the groups of nodes that can all reach each other. Each
+    is a sorted list, and they are sorted by their first node. Uses Tarjan's
+    algorithm, with a stack instead of recursion, so long chains of types don't
+    run out of Python stack.
+
+    """
+
+    successors = successor_lists(nodes, edges)
+
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    def visit(node):
+        index[node] = lowlink[node] = len(index)
+        stack.append(node)
+        on_stack.add(node)
+        return (node, iter(successors[node]))
+
+    for root in sorted(successors):
+        if root in index:
+            continue
+        work = [visit(root)]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    # Go down to the child, and come back to the rest of the
+                    # children afterwards.
+                    work.append(visit(child))
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    # node is the first of its component to be visited, and the
+                    # rest are above it on the stack.
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+
+    return sorted(components)
+
+def back_edges(nodes, edges):
+    """
+    Return the set of (from, to) edges that go back up a depth-first search of
+    the graph, which visits nodes and their children in name order. Without
+    them, the graph has no cycles (apart from edges from a node to itself, which
+    aren't included). The same graph always gives the same edges.
+
+    """
+
+    successors = successor_lists(nodes, edges)
+
+    # Nodes still being visited are 1, and finished ones are 2.
+    state = {}
+    found = set()
+    for root in sorted(successors):
+        if root in state:
+            continue
+        state[root] = 1
+        work = [(root, iter(successors[root]))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child == node:
+                    continue
+                if state.get(child) == 1:
+                    found.add((node, child))
+                elif child not in state:
+                    state[child] = 1
+                    work.append((child, iter(successors[child])))
+                    break
+            else:
+                state[node] = 2
+                work.pop()
+    return found
+
+def plan_cycles(nodes, edges, clusters, mode):
+    """
+    Find the cycles in the graph with the given nodes and (from, to) edges, and
+    return a CyclePlan for drawing them in the given mode (one of
+    CYCLE_MODES). clusters is a dict from cluster name to list of nodes.
+
+    "break" leaves out the back_edges() from ranking, so dot doesn't have to
+    turn any edges around. "collapse" leaves out every edge inside a cycle from
+    ranking, and draws each cycle as a box of its own in its cluster, if all its
+    types are in the same one.
+
+    """
+
+    edges = set(edges)
+    components = [component for component in strongly_connected_components(nodes, edges)
+        if len(component) > 1 or (component[0], component[0]) in edges]
+
+    loose_edges = set()
+    groups = {}
+    if mode == "break":
+        loose_edges = back_edges(nodes, edges)
+    else:
+        cluster_of = {}
+        for cluster_name, cluster_types in clusters.items():
+            for type_name in cluster_types:
+                cluster_of[type_name] = cluster_name
+        for number, component in enumerate(components):
+            if len(component) == 1:
+                # A type that contains itself is just a loop, which dot can
+                # draw without turning anything around.
+                continue
+            members = set(component)
+            loose_edges.update(edge for edge in edges if edge[0] in members and edge[1] in members)
+            component_clusters = set(cluster_of.get(type_name) for type_name in component)
+            if len(component_clusters) == 1:
+                groups.setdefault(component_clusters.pop(), []).append((number, component))
+
+    return CyclePlan(mode, components, loose_edges, groups)
+
+def describe_cycles(plan):
+    """
+    Return a list of lines reporting the cycles in a CyclePlan, and what was
+    done with them.
+
+    """
+
+    if not plan.components:
+        return ["No cycles found"]
+
+    grouped = set(number for cluster_groups in plan.groups.values() for number, component in cluster_groups)
+    lines = ["Found {} cycles, with {} types in them:".format(len(plan.components),
+        sum(len(component) for component in plan.components))]
+    for number, component in enumerate(plan.components):
+        note = ""
+        if plan.mode == "collapse" and len(component) > 1 and number not in grouped:
+            note = " (in more than one file, so not drawn as a group)"
+        lines.append("  cycle {}: {}{}".format(number, ", ".join(component), note))
+    if plan.mode == "break":
+        lines.append("Broke them at {} edges, which dot doesn't rank by:".format(len(plan.loose_edges)))
+        lines += ["  {} -> {}".format(from_node, to_node) for from_node, to_node in sorted(plan.loose_edges)]
+    return lines
+
+def part_cycle_plan(plan, part_nodes):
+    """
+    Return the CyclePlan for drawing just the part of the graph with the given
+    nodes: the same plan, but only with the groups whose types are all in
+    part_nodes, so one part's file doesn't draw another part's cycles.
+
+    """
+
+    if plan is None:
+        return None
+    groups = {}
+    for cluster_name, cluster_groups in plan.groups.items():
+        part_groups = [(number, component) for number, component in cluster_groups
+            if all(type_name in part_nodes for type_name in component)]
+        if part_groups:
+            groups[cluster_name] = part_groups
+    return plan._replace(groups=groups)
+
+def centrality(nodes, edges, measure="degree"):
+    """
+    Return a dict from every node (in nodes, or named in the (from, to) edges)
+    to how central it is, by the given measure (one of CENTRALITY_MEASURES).
+
+    "degree" counts the edges to and from each node. "pagerank" is the share of
+    time a walk along the edges spends at each node, if it jumps to any node at
+    random 15% of the time, so types that are contained or referenced by many
+    important types score highest. Edges from a node to itself don't count for
+    either. Both give the same scores for the same graph every time.
+
+    """
+
+    scores = dict((node, 0.0) for node in nodes)
+    for from_node, to_node in edges:
+        scores.setdefault(from_node, 0.0)
+        scores.setdefault(to_node, 0.0)
+    edges = sorted(edge for edge in edges if edge[0] != edge[1])
+    if measure == "degree":
+        for from_node, to_node in edges:
+            scores[from_node] += 1
+            scores[to_node] += 1
+        return scores
+
+    if not scores:
+        return scores
+    # Work with node numbers and lists, since this goes over every edge up to
+    # 100 times.
+    damping = 0.85
+    ordered = sorted(scores)
+    number = dict((node, index) for index, node in enumerate(ordered))
+    pairs = [(number[from_node], number[to_node]) for from_node, to_node in edges]
+    out_degree = [0] * len(ordered)
+    for from_index, to_index in pairs:
+        out_degree[from_index] += 1
+    dangling_nodes = [index for index in range(len(ordered)) if out_degree[index] == 0]
+    rank = [1.0 / len(ordered)] * len(ordered)
+    for iteration in range(100):
+        # Nodes with no edges out of them share their rank with every node.
+        dangling = sum(rank[index] for index in dangling_nodes)
+        share = [damping * rank[index] / out_degree[index] if out_degree[index] else 0.0 for index in range(len(ordered))]
+        new_rank = [(1 - damping + damping * dangling) / len(ordered)] * len(ordered)
+        for from_index, to_index in pairs:
+            new_rank[to_index] += share[from_index]
+        change = sum(abs(new - old) for new, old in zip(new_rank, rank))
+        rank = new_rank
+        if change < 1e-10:
+            break
+    return dict(zip(ordered, rank))
+
+def summarize(nodes, edges, clusters, top, measure="degree", per_cluster=False):
+    """
+    Return a Summary keeping the top most central of the given nodes (by
+    centrality() with the given measure over the (from, to) pairs of the (from,
+    to, kind) edges), or the top most central in each cluster if per_cluster is
+    True. clusters is a dict from cluster name to list of nodes. Ties go to the
+    node whose name sorts first, so the same schema always gives the same
+    summary.
+
+    """
+
+    scores = centrality(nodes, [(edge[0], edge[1]) for edge in edges], measure)
+    ranked = sorted(nodes, key=lambda node: (-scores[node], node))
+
+    cluster_of = {}
+    for cluster_name, cluster_types in clusters.items():
+        for type_name in cluster_types:
+            cluster_of[type_name] = cluster_name
+
+    if per_cluster:
+        kept = set()
+        taken = {}
+        for node in ranked:
+            cluster_name = cluster_of.get(node)
+            if taken.get(cluster_name, 0) < top:
+                kept.add(node)
+                taken[cluster_name] = taken.get(cluster_name, 0) + 1
+    else:
+        kept = set(ranked[:top])
+
+    hidden_in = {}
+    for node in nodes:
+        if node not in kept:
+            hidden_in.setdefault(cluster_of.get(node), []).append(node)
+    # Types in no cluster come first.
+    hidden = sorted(((cluster_name, sorted(hidden_types)) for cluster_name, hidden_types in hidden_in.items()),
+        key=lambda pair: (pair[0] is not None, pair[0]))
+    placeholder_of = {}
+    for index, (cluster_name, hidden_types) in enumerate(hidden):
+        for node in hidden_types:
+            placeholder_of[node] = ("more", index)
+
+    counts = {}
+    for from_node, to_node, kind in edges:
+        if from_node in kept and to_node in kept:
+            continue
+        from_end = placeholder_of.get(from_node, ("type", from_node))
+        to_end = placeholder_of.get(to_node, ("type", to_node))
+        if from_end == to_end and from_end[0] == "more":
+            # Edges between the hidden types of one placeholder aren't drawn.
+            continue
+        counts[(from_end, to_end, kind)] = counts.get((from_end, to_end, kind), 0) + 1
+
+    return Summary(kept, hidden, sorted(key + (count,) for key, count in counts.items()))
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+Shrinks the .svg files that Graphviz's dot program writes, e.g.:
+
+python svg_minify.py --svg uml.svg --out uml.svg --svgz
+
+Graphviz repeats the same font and color attributes on every cell of every
+table, and adds comments, a DOCTYPE and auto-generated element ids that nothing
+refers to. This stage removes the comments, DOCTYPE, unused ids and the
+whitespace between tags, trims trailing zeros from coordinates, and hoists every
+combination of presentation attributes that appears more than once into a CSS
+class. Links (e.g. the clickable clusters) are left untouched. The size
+reduction is reported on stderr.
+"""
+
+import argparse, sys, os, re, io, gzip
+
+# Presentation attributes which can be moved into a CSS class. They have the
+# same name as the corresponding CSS property.
+STYLE_ATTRIBUTES = ["fill", "fill-opacity", "stroke", "stroke-width",
+    "stroke-dasharray", "stroke-opacity", "font-family", "font-size",
+    "font-weight", "font-style", "text-anchor"]
+
+# CSS properties which need a unit when the attribute value is a bare number.
+LENGTH_ATTRIBUTES = ["font-size", "stroke-width"]
+
+# Attributes which only hold numbers, so trailing zeros can be dropped.
+NUMERIC_ATTRIBUTES = ["x", "y", "cx", "cy", "rx", "ry", "x1", "y1", "x2", "y2",
+    "width", "height", "points", "d", "viewBox", "transform", "font-size",
+    "stroke-width"]
+
+# Matches one start tag (or empty-element tag). Graphviz always double-quotes
+# attribute values.
+TAG_RE = re.compile(r'<([a-zA-Z][\w:.-]*)((?:\s+[\w:.-]+="[^"]*")*)\s*(/?)>')
+ATTRIBUTE_RE = re.compile(r'([\w:.-]+)="([^"]*)"')
+COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+DOCTYPE_RE = re.compile(r'<!DOCTYPE[^>]*>')
+TITLE_RE = re.compile(r'<title>[^<]*</title>')
+# Ids which Graphviz generates by itself, e.g. graph0, node12, edge3, clust1, a_node12
+GENERATED_ID_RE = re.compile(r'^(a_)?(graph|node|edge|clust)\d+$')
+ID_REFERENCE_RE = re.compile(r'(?:url\(#|href="#)([^)"]+)')
+# e.g. 14.00 -> 14, 3045.50 -> 3045.5
+TRAILING_ZEROS_RE = re.compile(r'(\d)\.(\d*?)0+(?![\d])')
+BETWEEN_TAGS_RE = re.compile(r'>\s+<')
+
+def parse_args(args):
+    """
+    Takes in the command-line arguments list (args), and returns a nice argparse
+    result with fields for all the options.
+    """
+
+    # The command line arguments start with the program name, which we don't
+    # want to treat as an argument for argparse. So we remove it.
+    args = args[1:]
+
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--svg", type=str, required=True,
+        help="the .svg file written by dot")
+    parser.add_argument("--out", type=str, default=None,
+        help="where to write the minified .svg (defaults to overwriting --svg)")
+    parser.add_argument("--svgz", action="store_true",
+        help="also write a gzip-compressed copy next to --out, e.g. uml.svgz")
+    parser.add_argument("--strip_titles", action="store_true",
+        help="remove the <title> of every node and edge (they show up as hover tooltips)")
+
+    return parser.parse_args(args)
+
+def trim_number(value):
+    """
+    Drop trailing zeros (and a then-trailing decimal point) from every number in
+    the given attribute value.
+
+    """
+
+    value = TRAILING_ZEROS_RE.sub(lambda match: match.group(1) +
+        ("." + match.group(2) if match.group(2) else ""), value)
+    return value
+
+def split_attributes(attributes):
+    """
+    Given the attribute text of a start tag, return a list of (name, value)
+    tuples in their original order.
+
+    """
+
+    return ATTRIBUTE_RE.findall(attributes)
+
+def style_key(attribute_list):
+    """
+    Return the tuple of (name, value) presentation attributes of a tag which
+    could be hoisted into a CSS class, in a canonical order. Returns an empty
+    tuple if there are none.
+
+    """
+
+    return tuple(sorted((name, value) for name, value in attribute_list
+        if name in STYLE_ATTRIBUTES))
+
+def style_to_css(key):
+    """
+    Turn a style key from style_key() into the body of a CSS rule.
+
+    """
+
+    declarations = []
+    for name, value in key:
+        if name in LENGTH_ATTRIBUTES and re.match(r'^[\d.]+$', value):
+            value = trim_number(value) + "px"
+        declarations.append("{}:{}".format(name, value))
+    return ";".join(declarations)
+
+def minify_svg(svg, strip_titles=False):
+    """
+    Given the text of a Graphviz .svg file, return the minified text.
+
+    """
+
+    svg = COMMENT_RE.sub("", svg)
+    svg = DOCTYPE_RE.sub("", svg)
+    if strip_titles:
+        svg = TITLE_RE.sub("", svg)
+
+    # Anything referred to by an url(#...) or href="#..." has to keep its id.
+    referenced_ids = set(ID_REFERENCE_RE.findall(svg))
+
+    # First pass: count how often each combination of presentation attributes
+    # appears, so that only repeated ones are turned into classes.
+    style_counts = {}
+    for match in TAG_RE.finditer(svg):
+        key = style_key(split_attributes(match.group(2)))
+        if key:
+            style_counts[key] = style_counts.get(key, 0) + 1
+
+    # Most common styles get the shortest class names. Ties are broken on the
+    # style itself so that the output is the same from run to run.
+    repeated_styles = sorted([key for key, count in style_counts.items() if count > 1],
+        key=lambda key: (-style_counts[key], key))
+    style_classes = {}
+    for style_index, key in enumerate(repeated_styles):
+        style_classes[key] = "s{}".format(style_index)
+
+    # Second pass: rewrite every start tag.
+    def rewrite_tag(match):
+        tag_name, attributes, self_closing = match.group(1), match.group(2), match.group(3)
+        attribute_list = split_attributes(attributes)
+        key = style_key(attribute_list)
+
+        new_attributes = []
+        classes = []
+        for name, value in attribute_list:
+            if name == "id" and GENERATED_ID_RE.match(value) and value not in referenced_ids:
+                # Nothing points at this id, so we don't need it.
+                continue
+            if key in style_classes and name in STYLE_ATTRIBUTES:
+                # This is covered by the CSS class now.
+                continue
+            if name == "class":
+                classes.append(value)
+                continue
+            if name in NUMERIC_ATTRIBUTES:
+                value = trim_number(value)
+            new_attributes.append((name, value))
+
+        if key in style_classes:
+            classes.append(style_classes[key])
+        if classes:
+            new_attributes.append(("class", " ".join(classes)))
+
+        return "<{}{}{}>".format(tag_name, "".join(" {}=\"{}\"".format(name, value)
+            for name, value in new_attributes), self_closing)
+
+    svg = TAG_RE.sub(rewrite_tag, svg)
+    svg = BETWEEN_TAGS_RE.sub("><", svg.strip())
+
+    # Put the stylesheet right after the opening <svg> tag.
+    if repeated_styles:
+        stylesheet = "<style type=\"text/css\">{}</style>".format("".join(
+            ".{}{{{}}}".format(style_classes[key], style_to_css(key)) for key in repeated_styles))
+        svg_tag = re.search(r'<svg\b[^>]*>', svg)
+        if svg_tag is not None:
+            svg = svg[:svg_tag.end()] + stylesheet + svg[svg_tag.end():]
+
+    return svg + "\n"
+
+def write_svgz(svg, svgz_path):
+    """
+    Write the given svg text gzip-compressed to svgz_path. The timestamp in the
+    gzip header is zeroed so that identical diagrams give identical files.
+
+    """
+
+    with open(svgz_path, "wb") as raw_file:
+        with gzip.GzipFile(filename="", mode="wb", compresslevel=9, fileobj=raw_file, mtime=0) as svgz_file:
+            svgz_file.write(svg.encode("utf-8"))
+
+def report_size(name, original_size, new_size):
+    """
+    Print how much smaller a file got to stderr.
+
+    """
+
+    sys.stderr.write("{}: {} -> {} bytes ({:.1f}% smaller)\n".format(name,
+        original_size, new_size, 100.0 * (original_size - new_size) / max(original_size, 1)))
+
+def main(args):
+    """
+    Parses command line arguments, and does the work of the program.
+    "args" specifies the program arguments, with args[0] being the executable
+    name. The return value should be used as the program's exit code.
+    """
+
+    options = parse_args(args)
+
+    out_path = options.out if options.out is not None else options.svg
+
+    with io.open(options.svg, "r", encoding="utf-8") as svg_file:
+        svg = svg_file.read()
+    original_size = len(svg.encode("utf-8"))
+
+    minified = minify_svg(svg, options.strip_titles)
+
+    with io.open(out_path, "w", encoding="utf-8") as out_file:
+        out_file.write(minified)
+    report_size(out_path, original_size, len(minified.encode("utf-8")))
+
+    if options.svgz:
+        svgz_path = os.path.splitext(out_path)[0] + ".svgz"
+        write_svgz(minified, svgz_path)
+        report_size(svgz_path, original_size, os.path.getsize(svgz_path))
+
+if __name__ == "__main__" :
+    sys.exit(main(sys.argv))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Checks for avpr2uml.py: how field types are resolved, and that --stream and
+--catalog draw the same diagram as the usual in-memory run. Run them with:
+
+python -m unittest discover
+"""
+
+import os, sys, json, shutil, subprocess, tempfile, unittest
+import avpr2uml
+
+# Two small protocols, with a type only named in full, a partially qualified
+# name, a type used before it is defined, ID references, a cycle, and a field
+# type that doesn't exist.
+PROTOCOLS = {
+    "common": {"protocol": "Common", "namespace": "org.ga4gh.models", "types": [
+        {"type": "record", "name": "Position", "fields": [
+            {"name": "referenceName", "type": "string"},
+            {"name": "strand", "type": "Strand"}]},
+        {"type": "enum", "name": "Strand", "symbols": ["NEG", "POS"]},
+        {"type": "record", "name": "Dataset", "fields": [
+            {"name": "id", "type": "string"},
+            {"name": "name", "type": ["null", "string"]}]},
+    ]},
+    "reads": {"protocol": "Reads", "namespace": "org.ga4gh.models", "types": [
+        {"type": "record", "name": "ReadGroup", "fields": [
+            {"name": "id", "type": "string"},
+            {"name": "datasetId", "type": "string"},
+            {"name": "stats", "type": ["null", "models.ReadStats"]},
+            {"name": "alignments", "type": {"type": "array", "items": "ReadAlignment"}},
+            {"name": "missing", "type": ["null", "Nope"]}]},
+        {"type": "record", "name": "ReadStats", "namespace": "org.ga4gh.models", "fields": [
+            {"name": "alignedReadCount", "type": ["null", "long"]}]},
+        {"type": "record", "name": "ReadAlignment", "fields": [
+            {"name": "id", "type": "string"},
+            {"name": "readGroupId", "type": "string"},
+            {"name": "alignment", "type": ["null", "org.ga4gh.models.Position"]},
+            {"name": "group", "type": ["null", "ReadGroup"]}]},
+    ]},
+}
+
+CLUSTERS = "common reads"
+
+class ResolveTypeNameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.symbols = avpr2uml.build_symbol_table_from_names(["org.a.models.Variant", "org.b.models.Variant", "org.a.Call"])
+
+    def test_names(self):
+        self.assertEqual(avpr2uml.resolve_type_name("Call", "org.x", self.symbols), "org.a.Call")
+        self.assertEqual(avpr2uml.resolve_type_name("org.b.models.Variant", None, self.symbols), "org.b.models.Variant")
+        self.assertEqual(avpr2uml.resolve_type_name("b.models.Variant", None, self.symbols), "org.b.models.Variant")
+        # Ambiguous, unless the namespace of the field says which one.
+        self.assertEqual(avpr2uml.resolve_type_name("Variant", None, self.symbols), None)
+        self.assertEqual(avpr2uml.resolve_type_name("Variant", "org.a.models", self.symbols), "org.a.models.Variant")
+        self.assertEqual(avpr2uml.resolve_type_name("Nope", "org.a", self.symbols), None)
+
+    def test_type_to_string(self):
+        self.assertEqual(avpr2uml.type_to_string(["null", {"type": "array", "items": "a.Call"}], "org.a",
+            symbols=self.symbols), "union<null,array<Call>>")
+        # Without the symbol table, the partially qualified name is left as it is.
+        self.assertEqual(avpr2uml.type_to_string({"type": "map", "values": "a.Call"}, "org.a"), "map<a.Call>")
+
+class SameDiagramTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.avpr_dir = os.path.join(self.temp_dir, "schemas_avpr")
+        os.makedirs(self.avpr_dir)
+        for name, protocol in PROTOCOLS.items():
+            with open(os.path.join(self.avpr_dir, name + ".avpr"), "w") as avpr_file:
+                json.dump(protocol, avpr_file)
+        self.urls = os.path.join(self.temp_dir, "schema_urls")
+        with open(self.urls, "w") as url_file:
+            for name in PROTOCOLS:
+                url_file.write("https://github.com/ga4gh/schemas/blob/master/src/main/resources/avro/{}.avdl\n".format(name))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def draw(self, dot_name, *extra_args):
+        """
+        Run avpr2uml.py on the protocols with the given extra arguments, and
+        return the sorted lines of the .dot file it wrote.
+
+        """
+
+        dot_path = os.path.join(self.temp_dir, dot_name)
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "avpr2uml.py"),
+                "--clusters", CLUSTERS, "--avpr_dir", self.avpr_dir, "--urls", self.urls, "--dot", dot_path] + list(extra_args),
+                stderr=devnull)
+        with open(dot_path, "r") as dot_file:
+            return sorted(dot_file.read().splitlines())
+
+    def test_stream(self):
+        self.assertEqual(self.draw("stream.dot", "--stream"), self.draw("memory.dot"))
+
+    def test_catalog(self):
+        memory = self.draw("memory.dot")
+        catalog = os.path.join(self.temp_dir, "catalog.sqlite")
+        self.assertEqual(self.draw("first.dot", "--catalog", catalog), memory)
+        # The second time everything comes from the catalog.
+        self.assertEqual(self.draw("second.dot", "--catalog", catalog), memory)
+
+    def test_diagram_has_the_edges(self):
+        lines = self.draw("memory.dot")
+        for edge in ["org_ga4gh_models_ReadGroup:stats:w -> org_ga4gh_models_ReadStats",
+                "org_ga4gh_models_ReadAlignment:alignment:w -> org_ga4gh_models_Position"]:
+            self.assertTrue(any(line.startswith(edge) for line in lines), edge)
+        self.assertFalse(any("Nope" in line for line in lines))
+
+if __name__ == "__main__" :
+    unittest.main()
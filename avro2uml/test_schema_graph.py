@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Checks for the graph algorithms in schema_graph.py. Run them with:
+
+python -m unittest discover
+"""
+
+import unittest
+import schema_graph
+
+class StronglyConnectedComponentsTest(unittest.TestCase):
+
+    def test_finds_cycles_and_singletons(self):
+        edges = [("a", "b"), ("b", "c"), ("c", "a"), ("c", "d"), ("d", "e"), ("e", "d")]
+        self.assertEqual(schema_graph.strongly_connected_components(["f"], edges),
+            [["a", "b", "c"], ["d", "e"], ["f"]])
+
+    def test_self_loop_is_its_own_component(self):
+        self.assertEqual(schema_graph.strongly_connected_components([], [("a", "a"), ("a", "b")]),
+            [["a"], ["b"]])
+
+    def test_long_chain_does_not_recurse(self):
+        # Far deeper than Python's default recursion limit.
+        names = ["t{:05d}".format(i) for i in range(5000)]
+        edges = list(zip(names, names[1:])) + [(names[-1], names[0])]
+        self.assertEqual(schema_graph.strongly_connected_components(names, edges), [names])
+
+class BackEdgesTest(unittest.TestCase):
+
+    def assert_acyclic(self, nodes, edges):
+        for component in schema_graph.strongly_connected_components(nodes, edges):
+            self.assertEqual(len(component), 1)
+
+    def test_removing_back_edges_leaves_no_cycles(self):
+        edges = [("a", "b"), ("b", "c"), ("c", "a"), ("b", "d"), ("d", "b"), ("d", "e")]
+        found = schema_graph.back_edges([], edges)
+        self.assertEqual(found, set([("c", "a"), ("d", "b")]))
+        self.assert_acyclic([], [edge for edge in edges if edge not in found])
+
+    def test_no_back_edges_without_cycles(self):
+        self.assertEqual(schema_graph.back_edges(["x"], [("a", "b"), ("a", "c"), ("b", "c")]), set())
+
+    def test_self_loops_are_left_alone(self):
+        self.assertEqual(schema_graph.back_edges([], [("a", "a")]), set())
+
+class PlanCyclesTest(unittest.TestCase):
+
+    edges = [("x.A", "x.B"), ("x.B", "x.A"), ("y.C", "z.D"), ("z.D", "y.C"), ("x.A", "y.C"), ("x.E", "x.E")]
+    clusters = {"x.avdl": ["x.A", "x.B", "x.E"], "y.avdl": ["y.C"], "z.avdl": ["z.D"]}
+    nodes = ["x.A", "x.B", "y.C", "z.D", "x.E"]
+
+    def test_break(self):
+        plan = schema_graph.plan_cycles(self.nodes, self.edges, self.clusters, "break")
+        self.assertEqual(plan.components, [["x.A", "x.B"], ["x.E"], ["y.C", "z.D"]])
+        self.assertEqual(plan.loose_edges, set([("x.B", "x.A"), ("z.D", "y.C")]))
+        self.assertEqual(plan.groups, {})
+
+    def test_collapse_groups_cycles_within_one_cluster(self):
+        plan = schema_graph.plan_cycles(self.nodes, self.edges, self.clusters, "collapse")
+        # Only the cycle inside x.avdl can be drawn as a box, but every edge
+        # inside a cycle is left out of ranking.
+        self.assertEqual(plan.groups, {"x.avdl": [(0, ["x.A", "x.B"])]})
+        self.assertEqual(plan.loose_edges, set([("x.A", "x.B"), ("x.B", "x.A"), ("y.C", "z.D"), ("z.D", "y.C")]))
+
+    def test_collapse_without_clusters(self):
+        plan = schema_graph.plan_cycles(self.nodes, self.edges, {}, "collapse")
+        self.assertEqual(plan.groups, {None: [(0, ["x.A", "x.B"]), (2, ["y.C", "z.D"])]})
+
+    def test_part_plan_only_keeps_the_parts_own_groups(self):
+        plan = schema_graph.plan_cycles(self.nodes, self.edges, {}, "collapse")
+        part_plan = schema_graph.part_cycle_plan(plan, set(["y.C", "z.D"]))
+        self.assertEqual(part_plan.groups, {None: [(2, ["y.C", "z.D"])]})
+        self.assertEqual(part_plan.loose_edges, plan.loose_edges)
+        self.assertEqual(schema_graph.part_cycle_plan(plan, set(["x.E"])).groups, {})
+        self.assertIsNone(schema_graph.part_cycle_plan(None, set(["x.E"])))
+
+class ConnectedComponentsTest(unittest.TestCase):
+
+    def test_groups_hold_nodes_together(self):
+        self.assertEqual(schema_graph.connected_components(["a", "b", "c", "d"], [("a", "b")], [["c", "d"]]),
+            [["a", "b"], ["c", "d"]])
+
+    def test_biggest_first(self):
+        self.assertEqual(schema_graph.connected_components(["z"], [("a", "b"), ("b", "c")]),
+            [["a", "b", "c"], ["z"]])
+
+if __name__ == "__main__" :
+    unittest.main()
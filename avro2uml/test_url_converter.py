@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Checks for the url rules in url_converter.py. Run them with:
+
+python -m unittest discover
+"""
+
+import os, shutil, tempfile, unittest
+import url_converter
+
+RAW = "https://raw.githubusercontent.com/ga4gh/schemas/master/src/main/resources/avro/reads.avdl"
+COOKED = "https://github.com/ga4gh/schemas/blob/master/src/main/resources/avro/reads.avdl"
+MIRROR_RULE = "mirror\thttps://git.example.org/{user}/{repo}/raw/{revision}/{path}\thttps://git.example.org/{user}/{repo}/src/{revision}/{path}\n"
+
+class UrlRewriterTest(unittest.TestCase):
+
+    def make_rewriter(self, rule_lines=()):
+        return url_converter.UrlRewriter(url_converter.read_rules(rule_lines) +
+            [url_converter.make_rule(*rule) for rule in url_converter.DEFAULT_RULES])
+
+    def test_github_both_ways(self):
+        rewriter = self.make_rewriter()
+        for url in [RAW, COOKED]:
+            self.assertEqual(rewriter.raw_url(url), RAW)
+            self.assertEqual(rewriter.cooked_url(url), COOKED)
+        self.assertEqual(rewriter.revision_and_path(COOKED), ("master", "src/main/resources/avro/reads.avdl"))
+
+    def test_unknown_and_file_urls_pass_through(self):
+        rewriter = self.make_rewriter()
+        for url in ["https://example.org/schemas/reads.avdl", "file:///srv/mirror/reads.avdl"]:
+            self.assertEqual(rewriter.raw_url(url), url)
+            self.assertEqual(rewriter.cooked_url(url), url)
+        self.assertRaises(ValueError, rewriter.revision_and_path, "https://example.org/schemas/reads.avdl")
+
+    def test_rules_from_a_file(self):
+        rewriter = self.make_rewriter(["# a comment\n", "\n", MIRROR_RULE])
+        self.assertEqual(rewriter.raw_url("https://git.example.org/ga4gh/schemas/src/v0.6/avro/reads.avdl"),
+            "https://git.example.org/ga4gh/schemas/raw/v0.6/avro/reads.avdl")
+        self.assertEqual(rewriter.revision_and_path("https://git.example.org/ga4gh/schemas/raw/v0.6/avro/reads.avdl"),
+            ("v0.6", "avro/reads.avdl"))
+        # The built-in rules still apply after the file's.
+        self.assertEqual(rewriter.raw_url(COOKED), RAW)
+
+    def test_bad_rules(self):
+        self.assertRaises(ValueError, url_converter.read_rules, ["mirror\thttps://a/{path}\n"])
+        self.assertRaises(ValueError, url_converter.compile_form, "https://a/{branch}/{path}")
+        self.assertRaises(ValueError, url_converter.make_rule, "mirror", "https://a/{user}/{path}", "https://b/{path}")
+
+    def test_compiled_forms_escape_the_url(self):
+        form = url_converter.compile_form("https://a.example/{user}?x={path}")
+        self.assertIsNotNone(form.match("https://a.example/me?x=reads.avdl"))
+        self.assertIsNone(form.match("https://aXexample/me?x=reads.avdl"))
+
+    def test_cluster_urls_by_file(self):
+        rewriter = self.make_rewriter()
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, "schema_urls")
+            with open(path, "w") as url_file:
+                url_file.write(RAW + "\n\n")
+            with open(path, "r") as url_file:
+                first = rewriter.cluster_urls(url_file)
+            with open(path, "r") as url_file:
+                self.assertTrue(rewriter.cluster_urls(url_file) is first)
+            self.assertEqual(first, {"reads.avdl": COOKED})
+
+            with open(path, "a") as url_file:
+                url_file.write("file:///srv/common.avdl\n")
+            with open(path, "r") as url_file:
+                self.assertEqual(rewriter.cluster_urls(url_file),
+                    {"reads.avdl": COOKED, "common.avdl": "file:///srv/common.avdl"})
+        finally:
+            shutil.rmtree(temp_dir)
+
+if __name__ == "__main__" :
+    unittest.main()
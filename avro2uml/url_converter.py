@@ -1,5 +1,5 @@
 #!/usr/bin/env python2.7
-import argparse, sys, os, re
+import argparse, sys, os, re, collections
 
 """
 Author: Malisa Smith
@@ -11,8 +11,46 @@ https://raw.githubusercontent.com/ga4gh/schemas/master/src/main/resources/avro/r
 
 Not-raw url:
 https://github.com/ga4gh/schemas/blob/master/src/main/resources/avro/reads.avdl
+
+Other hosts, like a local mirror of the schema repository, can be added with a
+tab-delimited rules file (--rules, or the SCHEMA_URL_RULES environment variable
+for the other scripts), with a name, the raw form and the not-raw form on each
+line, e.g.:
+
+mirror	https://git.example.org/{user}/{repo}/raw/{revision}/{path}	https://git.example.org/{user}/{repo}/src/{revision}/{path}
+
+Rules in the file are tried before the built-in github and file:// rules. A url
+that no rule matches, e.g. a plain https:// or file:// path, is both its own raw
+and not-raw form.
 """
 
+# The built-in rules, as (name, raw form, not-raw form). {path} matches the rest of the url, and the other fields match
+# one part of it, up to the next slash.
+DEFAULT_RULES = [
+    ("github", "https://raw.githubusercontent.com/{user}/{repo}/{revision}/{path}",
+        "https://github.com/{user}/{repo}/blob/{revision}/{path}"),
+    ("file", "file://{path}", "file://{path}"),
+]
+
+# The fields rules can use, and what each of them matches.
+RULE_FIELDS = {
+    "user": "[a-zA-Z0-9_.\\-]+",
+    "repo": "[a-zA-Z0-9_.\\-]+",
+    "revision": "[^/]+",
+    "path": ".*",
+}
+
+# Matches a field in a rule, e.g. {user}
+RULE_FIELD_RE = re.compile(r"\{(\w+)\}")
+
+# One rule, with the raw and not-raw forms compiled into regular expressions once, when it is made.
+UrlRule = collections.namedtuple("UrlRule", ["name", "raw", "cooked", "raw_re", "cooked_re"])
+
+# How many converted urls, and how many urls files' cluster indexes, a UrlRewriter keeps at most. When one of them is
+# full, it is emptied and filled again from then on.
+MAX_MEMO_URLS = 100000
+MAX_MEMO_INDEXES = 64
+
 def parse_args(args):
     """
     Note: This function heavily borrows from Adam Novak's code: https://github.com/adamnovak/schemas/blob/autouml/contrib/avpr2uml.py
@@ -39,30 +77,176 @@ def parse_args(args):
         help="Convert a list of urls in a file into their raw form")
     parser.add_argument("--getcookedfromfile", type=argparse.FileType("r"),
         help="Convert a list of urls in a file into their non-raw/cooked form")
+    parser.add_argument("--rules", type=argparse.FileType("r"), default=None,
+        help="tab-delimited file of url rules for other hosts, e.g. a local mirror (default: $SCHEMA_URL_RULES, if set)")
 
     return parser.parse_args(args)
 
+# Compiles one form of a rule, e.g. https://github.com/{user}/{repo}/blob/{revision}/{path}, into a regular expression
+# with a group for each field. Raises ValueError for a field that isn't in RULE_FIELDS.
+def compile_form(form):
+    pattern = []
+    position = 0
+    for field in RULE_FIELD_RE.finditer(form):
+        if field.group(1) not in RULE_FIELDS:
+            raise ValueError("Unknown field {} in url rule {}".format(field.group(0), form))
+        pattern.append(re.escape(form[position:field.start()]))
+        pattern.append("(?P<{}>{})".format(field.group(1), RULE_FIELDS[field.group(1)]))
+        position = field.end()
+    pattern.append(re.escape(form[position:]))
+    return re.compile("^" + "".join(pattern) + "$")
+
+# Makes a UrlRule. Raises ValueError if the two forms don't have the same fields, since each is filled in from the other.
+def make_rule(name, raw, cooked):
+    if sorted(RULE_FIELD_RE.findall(raw)) != sorted(RULE_FIELD_RE.findall(cooked)):
+        raise ValueError("The raw and not-raw forms of url rule {} need the same fields".format(name))
+    return UrlRule(name, raw, cooked, compile_form(raw), compile_form(cooked))
+
+# Reads UrlRules from a tab-delimited file object of name, raw form, and not-raw form lines. Blank lines and lines starting
+# with # are skipped. Raises ValueError for a line that isn't a rule.
+def read_rules(rules_file):
+    rules = []
+    for line_number, line in enumerate(rules_file, 1):
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        parts = line.split("\t")
+        if len(parts) != 3:
+            raise ValueError("Line {} of {} should be a name, a raw url and a not-raw url, separated by tabs: {!r}".format(
+                line_number, getattr(rules_file, "name", "the url rules file"), line))
+        rules.append(make_rule(*[part.strip() for part in parts]))
+    return rules
+
+# Returns a key that changes whenever the file url_lines was opened from changes (its path, size and modification
+# time), or None if url_lines isn't an open file.
+def file_key(url_lines):
+    try:
+        stat = os.fstat(url_lines.fileno())
+    except (AttributeError, ValueError, IOError, OSError):
+        return None
+    return (os.path.abspath(getattr(url_lines, "name", "")), stat.st_ino, stat.st_size, stat.st_mtime)
+
+# Converts urls with a list of UrlRules, trying them in order. Each url is only converted once, however many times it
+# is asked for, and so is the cluster index of each urls file, up to MAX_MEMO_URLS urls and MAX_MEMO_INDEXES files.
+class UrlRewriter(object):
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.raw = {}
+        self.cooked = {}
+        self.indexes = {}
+
+    # Returns (rule, fields) for the first rule whose raw or not-raw form matches url, or (None, None) if none does.
+    def match(self, url):
+        for rule in self.rules:
+            url_parts = rule.raw_re.match(url) or rule.cooked_re.match(url)
+            if url_parts is not None:
+                return rule, url_parts.groupdict()
+        return None, None
+
+    # Returns the raw form of url, or url itself if no rule matches it.
+    def raw_url(self, url):
+        if url not in self.raw:
+            if len(self.raw) >= MAX_MEMO_URLS:
+                self.raw.clear()
+            rule, fields = self.match(url)
+            self.raw[url] = url if rule is None else rule.raw.format(**fields)
+        return self.raw[url]
+
+    # Returns the not-raw (cooked) form of url, or url itself if no rule matches it.
+    def cooked_url(self, url):
+        if url not in self.cooked:
+            if len(self.cooked) >= MAX_MEMO_URLS:
+                self.cooked.clear()
+            rule, fields = self.match(url)
+            self.cooked[url] = url if rule is None else rule.cooked.format(**fields)
+        return self.cooked[url]
+
+    # Returns (revision, path in the repository) for url. Raises ValueError if no rule with a {revision} matches it.
+    def revision_and_path(self, url):
+        rule, fields = self.match(url)
+        if rule is None or "revision" not in fields:
+            raise ValueError("Can't tell the revision and path of {}".format(url))
+        return fields["revision"], fields["path"]
+
+    # Returns a dict from cluster key (the file name at the end of the url, e.g. reads.avdl) to the not-raw form of each
+    # url in url_lines (e.g. a schema_urls file). Blank lines are skipped. If url_lines is an open file that hasn't
+    # changed since it was last indexed, the same dict is returned without reading it.
+    def cluster_urls(self, url_lines):
+        key = file_key(url_lines)
+        if key is not None and key in self.indexes:
+            return self.indexes[key]
+        urls = {}
+        for url in url_lines:
+            url = url.strip()
+            if url != "":
+                cooked_url = self.cooked_url(url)
+                urls[cooked_url.split("/")[-1]] = cooked_url
+        if key is not None:
+            if len(self.indexes) >= MAX_MEMO_INDEXES:
+                self.indexes.clear()
+            self.indexes[key] = urls
+        return urls
+
+# The UrlRewriter the functions below use, made the first time it is needed from the rules in $SCHEMA_URL_RULES (if set)
+# and then DEFAULT_RULES.
+rewriter = None
+
+def url_rewriter():
+    global rewriter
+    if rewriter is None:
+        rules = []
+        if os.environ.get("SCHEMA_URL_RULES"):
+            with open(os.environ["SCHEMA_URL_RULES"], "r") as rules_file:
+                rules = read_rules(rules_file)
+        set_rules(rules)
+    return rewriter
+
+# Use the given UrlRules, before DEFAULT_RULES, from now on.
+def set_rules(rules):
+    global rewriter
+    rewriter = UrlRewriter(list(rules) + [make_rule(*rule) for rule in DEFAULT_RULES])
+
 def get_raw_url(url):
-    if re.match("^https://raw\.githubusercontent\.com/", url): #the url is already raw
-        return url
-    else: #convert into raw format
-        url_parts = re.match("^https://github\.com/(?P<user>[a-zA-Z0-9_\-]+)/(?P<repo>[a-zA-Z0-9_\-]+)/blob/(?P<url_end>.*$)", url)
-        return "https://raw.githubusercontent.com/" + url_parts.group('user') + "/" + url_parts.group('repo') + "/" + url_parts.group('url_end')
+    return url_rewriter().raw_url(url)
 
 def get_cooked_url(url):
-    if re.match("^https://github\.com/", url): #the url is already "cooked"
-        return url
-    else: #convert into "cooked" format
-        url_parts = re.match("^https://raw\.githubusercontent\.com/(?P<user>[a-zA-Z0-9_\-]+)/(?P<repo>[a-zA-Z0-9_\-]+)/(?P<url_end>.*$)", url)
-        return "https://github.com/" + url_parts.group('user') + "/" + url_parts.group('repo') + "/blob/" + url_parts.group('url_end')
+    return url_rewriter().cooked_url(url)
+
+# Split a github (or mirror) url, raw or not, into the revision (branch, tag or commit) and the path of the file in the repository, e.g.
+# ("master", "src/main/resources/avro/reads.avdl"). A branch name with a slash in it can't be told apart from a directory,
+# so the revision is everything up to the first slash.
+def get_revision_and_path(url):
+    return url_rewriter().revision_and_path(url)
+
+# Yield the raw form of each url in url_lines (e.g. an open schema_urls file), one at a time, skipping blank lines.
+def get_raw_urls(url_lines):
+    converter = url_rewriter()
+    for url in url_lines:
+        url = url.strip()
+        if url != "":
+            yield converter.raw_url(url)
+
+# Like get_raw_urls(), but yields the not-raw form of each url.
+def get_cooked_urls(url_lines):
+    converter = url_rewriter()
+    for url in url_lines:
+        url = url.strip()
+        if url != "":
+            yield converter.cooked_url(url)
+
+# Returns a dict from cluster key (e.g. reads.avdl) to the not-raw url of each url in url_lines, the same dict for the same
+# unchanged urls file, so the diagram writers don't have to work it out again.
+def cluster_urls(url_lines):
+    return url_rewriter().cluster_urls(url_lines)
 
 def get_raw_from_file(my_file):
-    for url in my_file:
-        print(get_raw_url(url.strip()))
+    for raw_url in get_raw_urls(my_file):
+        sys.stdout.write(raw_url + "\n")
 
 def get_cooked_from_file(my_file):
-    for url in my_file:
-        print(get_cooked_url(url.strip()))
+    for cooked_url in get_cooked_urls(my_file):
+        sys.stdout.write(cooked_url + "\n")
 
 def main(args):
     """
@@ -73,6 +257,13 @@ def main(args):
 
     options = parse_args(args)
 
+    if options.rules is not None:
+        try:
+            set_rules(read_rules(options.rules))
+        except ValueError as error:
+            sys.stderr.write("{}\n".format(error))
+            return 1
+
     if options.getraw is not None:
         print(get_raw_url(options.getraw))
     elif options.getcooked is not None:
@@ -0,0 +1,270 @@
+#!/usr/bin/env python2.7
+"""
+watch_uml.py: redraw the UML diagram every time an .avdl file in schemas_avdl
+is saved, e.g. while designing a schema. make_uml.sh --watch runs this after
+the first full build.
+
+Only the .avdl files that changed, and the files that import them (since
+avro-tools copies the imported types into each .avpr), are converted with
+avro-tools and loaded again. Every other protocol stays loaded in memory
+between rebuilds. Then uml.dot is written again and drawn to uml.svg (through
+render_uml.py's cache, so going back to an earlier version of the schema is
+instant), with the same --detail, --cycles and --parts options as the full
+build. Bursts of saves are collected into one rebuild.
+
+If a file can't be converted (e.g. it is half-way through being edited), the
+error is printed and the diagram is left as it was until the next save.
+Press Ctrl-C to stop.
+"""
+
+import argparse, sys, os, io, json, time, subprocess
+from multiprocessing.pool import ThreadPool
+import avpr2uml, batch_uml, render_uml, svg_minify, schema_watch, schema_graph, detail_levels
+
+def parse_args(args):
+    """
+    Takes in the command-line arguments list (args), and returns a nice argparse
+    result with fields for all the options.
+    """
+
+    # The command line arguments start with the program name, which we don't
+    # want to treat as an argument for argparse. So we remove it.
+    args = args[1:]
+
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--avdl_dir", type=str, default="schemas_avdl",
+        help="directory of .avdl files to watch")
+    parser.add_argument("--avpr_dir", type=str, default="schemas_avpr",
+        help="directory to convert the .avdl files into")
+    parser.add_argument("--avro_tools", type=str, default="avro-tools.jar",
+        help="path to avro-tools.jar (make_uml.sh downloads it)")
+    parser.add_argument("--dot", type=str, default="uml.dot",
+        help="GraphViz file to write the UML diagram to")
+    parser.add_argument("--svg", type=str, default="uml.svg",
+        help="where to draw the UML diagram")
+    parser.add_argument("--urls", type=str, default=None,
+        help="File with schema url's")
+    parser.add_argument("--type_comments", type=str, default=None,
+        help="tab-delimited file with type names and type header comments")
+    parser.add_argument("--minify", action="store_true",
+        help="run the .svg through svg_minify.py and also write a .svgz")
+    parser.add_argument("--debounce", type=float, default=0.3,
+        help="seconds to wait after a save for more saves before rebuilding")
+    parser.add_argument("--jobs", type=int, default=4,
+        help="how many avro-tools conversions may run at once")
+    parser.add_argument("--poll", action="store_true",
+        help="check for changes every half second instead of using inotify")
+    parser.add_argument("--profile", type=str, default=None, choices=sorted(render_uml.LAYOUT_PROFILES),
+        help="render_uml.py layout profile to draw with (e.g. draft, for quick redraws), with the types written in layout hint order")
+    parser.add_argument("--detail", type=str, default="full", choices=detail_levels.DETAIL_LEVELS,
+        help="draw types as full tables, with only the fields that have edges, or as just a header (see avpr2uml.py)")
+    parser.add_argument("--cycles", type=str, default=None, choices=schema_graph.CYCLE_MODES,
+        help="break or group cycles of types, like avpr2uml.py --cycles")
+    parser.add_argument("--parts", type=str, default=None,
+        help="directory to write each unconnected part of the diagram to, and draw the diagram from, like make_uml.sh does")
+
+    return parser.parse_args(args)
+
+def convert(options, name):
+    """
+    Convert <avdl_dir>/<name>.avdl to <avpr_dir>/<name>.avpr with avro-tools,
+    and return the loaded protocol. Raises an exception if it didn't work.
+
+    """
+
+    avpr_path = os.path.join(options.avpr_dir, name + ".avpr")
+    process = subprocess.Popen(["java", "-jar", options.avro_tools, "idl",
+        os.path.join(options.avdl_dir, name + ".avdl"), avpr_path],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        raise RuntimeError("avro-tools could not convert {}.avdl:\n{}".format(name, output.decode("utf-8", "replace")))
+    with open(avpr_path, "r") as avpr_file:
+        return json.load(avpr_file)
+
+def load_or_convert(options, name):
+    """
+    Return the loaded protocol for <name>.avdl, converting it first unless its
+    .avpr file is already newer than it.
+
+    """
+
+    avdl_path = os.path.join(options.avdl_dir, name + ".avdl")
+    avpr_path = os.path.join(options.avpr_dir, name + ".avpr")
+    if os.path.exists(avpr_path) and os.path.getmtime(avpr_path) >= os.path.getmtime(avdl_path):
+        with open(avpr_path, "r") as avpr_file:
+            return json.load(avpr_file)
+    return convert(options, name)
+
+def read_optional(path):
+    """
+    Open a file for reading, or return None if path is None.
+
+    """
+
+    return open(path, "r") if path is not None else None
+
+class LabelsInUse(object):
+    """
+    A label cache for one rebuild, which takes labels from the labels of the
+    last rebuild. Afterwards, used holds just the labels this rebuild used, so
+    labels of types that changed since are dropped instead of piling up.
+
+    """
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.used = {}
+
+    def __contains__(self, key):
+        return key in self.used or key in self.labels
+
+    def __getitem__(self, key):
+        if key not in self.used:
+            self.used[key] = self.labels[key]
+        return self.used[key]
+
+    def __setitem__(self, key, label):
+        self.used[key] = label
+
+def rebuild(options, protocols, label_cache, render_cache):
+    """
+    Write the .dot file for the given dict from .avdl name to loaded protocol,
+    and draw it. label_cache is a dict of the labels used last time, and is
+    left holding the ones used this time. Returns (seconds spent writing,
+    seconds spent drawing).
+
+    """
+
+    start_time = time.time()
+
+    # Clusters are in import order, just like make_uml.sh does it.
+    cluster_order = batch_uml.avdl_import_order(options.avdl_dir).split()
+    ordered_protocols = [(name + ".avdl", protocols[name]) for name in cluster_order if name in protocols]
+
+    url_file = read_optional(options.urls)
+    comments_file = read_optional(options.type_comments)
+    try:
+        fields, containments, references, clusters, urls, type_comments = avpr2uml.parse_protocols(
+            ordered_protocols, url_file, comments_file)
+    finally:
+        for opened in [url_file, comments_file]:
+            if opened is not None:
+                opened.close()
+
+    layout_hints = None
+    if options.profile is not None:
+        layout_hints = schema_graph.layout_hints(fields, clusters,
+            [(containment[0], containment[1]) for containment in containments],
+            [name + ".avdl" for name in cluster_order])
+
+    detail = None
+    if options.detail != "full":
+        detail = detail_levels.type_detail_levels(fields, clusters, options.detail, None,
+            dict((type_name, avpr2uml.type_to_display(type_name)) for type_name in fields))
+
+    cycle_plan = None
+    if options.cycles is not None:
+        # The same edges as avpr2uml.py ranks by.
+        ranked_edges = [(containment[0], containment[1]) for containment in containments]
+        if layout_hints is None:
+            ranked_edges += [(reference[0], reference[1]) for reference in references]
+        cycle_plan = schema_graph.plan_cycles(fields, ranked_edges, clusters, options.cycles)
+
+    labels = LabelsInUse(label_cache)
+
+    # Write a new file and move it into place, so nobody sees half a diagram.
+    with open(options.dot + ".tmp", "w") as dot_file:
+        avpr2uml.write_graph_with_clusters(dot_file, fields, containments, references, clusters, urls,
+            type_comments, labels, layout_hints, detail, cycle_plan)
+    os.rename(options.dot + ".tmp", options.dot)
+    part_paths = None
+    if options.parts is not None:
+        part_paths = avpr2uml.write_graph_parts(options.parts, fields, containments, references, clusters, urls,
+            type_comments, labels, layout_hints, detail, cycle_plan)
+    label_cache.clear()
+    label_cache.update(labels.used)
+    written_time = time.time()
+
+    graphviz_args = render_uml.profile_args(options.profile)
+    if part_paths is not None:
+        render_uml.render_parts(part_paths, render_uml.output_list([options.svg]), graphviz_args, render_cache)
+    else:
+        render_uml.render(options.dot, options.svg, graphviz_args=graphviz_args, cache=render_cache)
+    if options.minify:
+        with io.open(options.svg, "r", encoding="utf-8") as svg_file:
+            minified = svg_minify.minify_svg(svg_file.read())
+        with io.open(options.svg, "w", encoding="utf-8") as svg_file:
+            svg_file.write(minified)
+        svg_minify.write_svgz(minified, os.path.splitext(options.svg)[0] + ".svgz")
+
+    return written_time - start_time, time.time() - written_time
+
+def main(args):
+    """
+    Parses command line arguments, and does the work of the program.
+    "args" specifies the program arguments, with args[0] being the executable
+    name. The return value should be used as the program's exit code.
+    """
+
+    options = parse_args(args)
+
+    if not os.path.isdir(options.avpr_dir):
+        os.makedirs(options.avpr_dir)
+
+    pool = ThreadPool(options.jobs)
+    render_cache = render_uml.RenderCache(render_uml.default_cache_dir(), 200 * 1024 * 1024)
+    # Table labels of types which didn't change are re-used between rebuilds.
+    label_cache = {}
+
+    # Start watching first, so that saves during the first build aren't missed.
+    watcher = schema_watch.make_watcher([options.avdl_dir], [".avdl"], options.poll)
+
+    # Load everything once. This is the in-memory model which gets updated as
+    # files change: a dict from .avdl name to loaded protocol.
+    names = sorted(batch_uml.read_avdl_imports(options.avdl_dir))
+    protocols = dict(zip(names, pool.map(lambda name: load_or_convert(options, name), names)))
+    rebuild(options, protocols, label_cache, render_cache)
+    sys.stderr.write("Drew {} files. Watching {} for changes...\n".format(len(protocols), options.avdl_dir))
+
+    try:
+        while True:
+            changed_paths = schema_watch.wait_for_changes(watcher, options.debounce)
+            start_time = time.time()
+
+            changed = set(os.path.basename(path)[:-5] for path in changed_paths)
+            imports = batch_uml.read_avdl_imports(options.avdl_dir)
+            # Files that import a changed file have its types copied in, so
+            # they have to be converted again too.
+            affected = sorted(name for name in schema_watch.with_importers(changed, imports) if name in imports)
+
+            for name in changed:
+                if name not in imports and name in protocols:
+                    # It was deleted.
+                    del protocols[name]
+                    if os.path.exists(os.path.join(options.avpr_dir, name + ".avpr")):
+                        os.remove(os.path.join(options.avpr_dir, name + ".avpr"))
+
+            try:
+                protocols.update(zip(affected, pool.map(lambda name: convert(options, name), affected)))
+                convert_seconds = time.time() - start_time
+
+                write_seconds, draw_seconds = rebuild(options, protocols, label_cache, render_cache)
+            except Exception as error:
+                sys.stderr.write("{}\nKeeping the old diagram.\n".format(error))
+                continue
+            sys.stderr.write("Rebuilt after changes to {}: converted {} files in {:.2f}s, wrote {} in {:.2f}s, drew {} in {:.2f}s\n".format(
+                ", ".join(sorted(changed)), len(affected), convert_seconds, options.dot, write_seconds,
+                options.svg, draw_seconds))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        pool.close()
+
+    return 0
+
+if __name__ == "__main__" :
+    sys.exit(main(sys.argv))
@@ -0,0 +1,314 @@
+#! /usr/bin/python
+"""
+batch_uml.py: draw many UML diagrams (e.g. one per release, and one per
+sub-area like g2p, rna or metadata) in one run, instead of one make_uml.sh run
+per diagram.
+
+The manifest is a tab-delimited file with one line per diagram:
+
+name    schema_urls file    type_header_comments file (or -)    output .svg
+
+e.g.
+
+ga4gh	ga4gh/schema_urls	ga4gh/type_header_comments	out/ga4gh.svg
+bmeg	bmeg/schema_urls	-	out/bmeg.svg
+
+Paths are relative to the manifest. Blank lines and lines starting with # are
+skipped. The .dot file is written next to each .svg.
+
+All diagrams are drawn in the same run, so each url is downloaded only once, no
+matter how many diagrams use it. Diagrams are drawn in parallel, with separate
+limits for the number of dot processes (--dot_jobs) and for protoc conversions
+and parsing (--parse_jobs). Parsing and writing the .dot files is done by
+--parse_jobs worker processes, so it isn't held back by python's global
+interpreter lock, and each worker only parses each .proto file in the
+FileDescriptorSets and builds each table label once, for all the diagrams it
+gets.
+Drawings are kept in a render cache (see render_uml.py), so diagrams which
+have not changed since the last run are not laid out again.
+
+With --git_repo, the files are read from a local clone of the schema
+repository instead of being downloaded, at the revision in each url (see
+git_source.py). So a manifest with one schema_urls file per release draws every
+release with no network access and nothing checked out.
+"""
+
+import argparse, sys, os, io, errno, shutil, subprocess, threading, time, multiprocessing
+from multiprocessing.pool import ThreadPool
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+import url_converter, git_source, descriptor2uml, svg_minify, render_uml
+
+def parse_args(args):
+    """
+    Takes in the command-line arguments list (args), and returns a nice argparse
+    result with fields for all the options.
+    """
+
+    # The command line arguments start with the program name, which we don't
+    # want to treat as an argument for argparse. So we remove it.
+    args = args[1:]
+
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--manifest", type=argparse.FileType("r"), required=True,
+        help="tab-delimited file listing the diagrams to draw")
+    parser.add_argument("--work_dir", type=str, default="batch_work",
+        help="directory for the downloaded .proto files and FileDescriptorSet of each diagram")
+    parser.add_argument("--dot_jobs", type=int, default=2,
+        help="how many dot processes may run at once")
+    parser.add_argument("--parse_jobs", type=int, default=2,
+        help="how many diagrams may be converted and parsed at once, and how many worker processes parse them")
+    parser.add_argument("--render_cache_dir", type=str, default=render_uml.default_cache_dir(),
+        help="directory to keep drawings in, so that diagrams which haven't changed don't have to be laid out again")
+    parser.add_argument("--render_cache_size", type=float, default=200,
+        help="how many megabytes of drawings to keep")
+    parser.add_argument("--no_render_cache", action="store_true",
+        help="always run dot, and don't keep the drawings")
+    parser.add_argument("--git_repo", type=str, default=None,
+        help="local clone of the schema repository to read the files at the urls from, instead of downloading them")
+    parser.add_argument("--minify", action="store_true",
+        help="run each .svg through svg_minify.py and also write a .svgz")
+    parser.add_argument("--also", type=str, nargs="+", default=[],
+        help="also write each diagram in these formats (e.g. png pdf), next to the .svg and from the same layout")
+
+    return parser.parse_args(args)
+
+class SharedCache(object):
+    """
+    A dict of values which are each computed only once, even when many threads
+    ask for the same key at the same time.
+
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.key_locks = {}
+        self.lock = threading.Lock()
+        # How many times a value was asked for, and how many times it had to be
+        # computed.
+        self.requests = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """
+        Return the value for key, calling compute() to make it if nobody has yet.
+
+        """
+
+        with self.lock:
+            self.requests += 1
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self.values:
+                self.values[key] = compute()
+                with self.lock:
+                    self.misses += 1
+            return self.values[key]
+
+def read_manifest(manifest_file):
+    """
+    Read the manifest, and return a list of (name, schema_urls path,
+    type_header_comments path or None, output .svg path) tuples. Paths are made
+    relative to the directory the manifest is in. Every diagram needs its own
+    name and output, since each name gets its own work folder.
+
+    """
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_file.name))
+
+    def resolve(path):
+        return os.path.normpath(os.path.join(base_dir, path))
+
+    diagrams = []
+    names = set()
+    svg_paths = set()
+    for line in manifest_file:
+        if line.strip() == "" or line.startswith("#"):
+            continue
+        columns = line.rstrip("\r\n").split("\t")
+        if len(columns) != 4:
+            raise RuntimeError("Manifest line should have 4 tab-separated columns: {}".format(line.strip()))
+        name, urls_path, comments_path, svg_path = columns
+        if comments_path in ["", "-"]:
+            comments_path = None
+        else:
+            comments_path = resolve(comments_path)
+        svg_path = resolve(svg_path)
+        if name in names:
+            raise RuntimeError("Manifest has more than one diagram named {}".format(name))
+        if svg_path in svg_paths:
+            raise RuntimeError("Manifest has more than one diagram writing {}".format(svg_path))
+        names.add(name)
+        svg_paths.add(svg_path)
+        diagrams.append((name, resolve(urls_path), comments_path, svg_path))
+
+    return diagrams
+
+def download(raw_url):
+    """
+    Return the contents of the file at the given url, as bytes.
+
+    """
+
+    response = urlopen(raw_url)
+    try:
+        return response.read()
+    finally:
+        response.close()
+
+# The parsed .proto files and table labels kept by a parse worker process, for
+# all the diagrams it parses.
+worker_cluster_cache = {}
+worker_label_cache = {}
+
+def parse_diagram(descriptor_path, urls_path, comments_path, dot_path):
+    """
+    Parse the FileDescriptorSet at descriptor_path, and write the diagram to
+    dot_path. This is run in a parse worker process. Returns the worker's
+    process ID, and how many parsed .proto files and labels it has kept.
+
+    """
+
+    with open(descriptor_path, "rb") as descriptor_file:
+        (fields, containments, nests, matched_references, matched_edges, clusters) = descriptor2uml.parse_descriptor(
+            descriptor_file, worker_cluster_cache)
+
+    with open(urls_path, "r") as url_file, open(dot_path, "w") as dot_file:
+        comments_file = open(comments_path, "r") if comments_path is not None else None
+        try:
+            descriptor2uml.write_graph(fields, containments, nests, matched_references, matched_edges, clusters,
+                comments_file, url_file, dot_file, worker_label_cache)
+        finally:
+            if comments_file is not None:
+                comments_file.close()
+
+    return os.getpid(), len(worker_cluster_cache), len(worker_label_cache)
+
+def draw_diagram(diagram, options, downloads, parse_pool, convert_slots, dot_slots, render_cache, git_reader=None):
+    """
+    Download, convert, parse and draw one diagram from the manifest. The parsing
+    is done in parse_pool, a multiprocessing.Pool. Returns the number of seconds
+    it took, whether the drawing came from the render cache, and what
+    parse_diagram() returned. If git_reader is a git_source.GitBlobReader, the
+    files are read with it instead of being downloaded.
+
+    """
+
+    start_time = time.time()
+    name, urls_path, comments_path, svg_path = diagram
+
+    # Every diagram gets its own folder, since protoc needs the imported .proto
+    # files next to each other.
+    proto_dir = os.path.join(options.work_dir, name, "schemas_proto")
+    # First clean-up old files from previous runs
+    if os.path.isdir(proto_dir):
+        shutil.rmtree(proto_dir)
+    os.makedirs(proto_dir)
+
+    # Download the proto files, or read them from the local clone. Urls shared with other diagrams are only fetched once.
+    with open(urls_path, "r") as url_file:
+        raw_urls = list(url_converter.get_raw_urls(url_file))
+    for raw_url in raw_urls:
+        if git_reader is not None:
+            contents = downloads.get(raw_url, lambda: git_source.read_url(git_reader, raw_url))
+        else:
+            contents = downloads.get(raw_url, lambda: download(raw_url))
+        # Replace user-defined package imports with no path, like make_uml.sh does. This allows proto files to find each other.
+        with open(os.path.join(proto_dir, raw_url.split("/")[-1]), "wb") as proto_file:
+            proto_file.write(contents.replace(b"ga4gh/", b""))
+
+    with convert_slots:
+        # convert .proto files into a serialized FileDescriptorSet for input into descriptor2uml.py
+        subprocess.check_call(["protoc", "--include_source_info", "-o", "MyFileDescriptorSet.pb"] +
+            sorted(os.listdir(proto_dir)), cwd=proto_dir)
+
+    # Write the DOT file next to the svg. Other diagrams may be making the same folder.
+    if os.path.dirname(svg_path) != "":
+        try:
+            os.makedirs(os.path.dirname(svg_path))
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+    dot_path = os.path.splitext(svg_path)[0] + ".dot"
+
+    # Parse the FileDescriptorSet in a worker process.
+    worker_stats = parse_pool.apply(parse_diagram, (os.path.join(proto_dir, "MyFileDescriptorSet.pb"), urls_path,
+        comments_path, dot_path))
+
+    with dot_slots:
+        # Every format is written from one layout.
+        outputs = render_uml.output_list([svg_path] + [os.path.splitext(svg_path)[0] + "." + extra for extra in options.also])
+        cached = render_uml.render_outputs(dot_path, outputs, cache=render_cache) == len(outputs)
+
+    if options.minify:
+        with io.open(svg_path, "r", encoding="utf-8") as svg_file:
+            minified = svg_minify.minify_svg(svg_file.read())
+        with io.open(svg_path, "w", encoding="utf-8") as svg_file:
+            svg_file.write(minified)
+        svg_minify.write_svgz(minified, os.path.splitext(svg_path)[0] + ".svgz")
+
+    return time.time() - start_time, cached, worker_stats
+
+def main(args):
+    """
+    Parses command line arguments, and does the work of the program.
+    "args" specifies the program arguments, with args[0] being the executable
+    name. The return value should be used as the program's exit code.
+    """
+
+    options = parse_args(args)
+
+    diagrams = read_manifest(options.manifest)
+
+    # Start the parse workers first, before there are any threads for them to inherit.
+    parse_pool = multiprocessing.Pool(options.parse_jobs)
+
+    # These are shared by all the diagrams.
+    downloads = SharedCache()
+    convert_slots = threading.BoundedSemaphore(options.parse_jobs)
+    dot_slots = threading.BoundedSemaphore(options.dot_jobs)
+    render_cache = None
+    if not options.no_render_cache:
+        render_cache = render_uml.RenderCache(options.render_cache_dir, int(options.render_cache_size * 1024 * 1024))
+
+    # One git cat-file process reads the files of every revision for every diagram.
+    git_reader = None
+    if options.git_repo is not None:
+        git_reader = git_source.GitBlobReader(options.git_repo)
+
+    # Enough threads that every conversion, parse and dot slot can be busy at once.
+    pool = ThreadPool(options.parse_jobs + options.dot_jobs)
+    results = [(diagram, pool.apply_async(draw_diagram, (diagram, options, downloads,
+        parse_pool, convert_slots, dot_slots, render_cache, git_reader))) for diagram in diagrams]
+    pool.close()
+
+    failures = 0
+    # How many parsed .proto files and labels each parse worker kept, by process ID.
+    worker_kept = {}
+    for diagram, result in results:
+        try:
+            seconds, cached, (worker_id, clusters_kept, labels_kept) = result.get()
+            worker_kept[worker_id] = max(worker_kept.get(worker_id, (0, 0)), (clusters_kept, labels_kept))
+            sys.stderr.write("{}: wrote {} in {:.2f}s{}\n".format(diagram[0], diagram[3], seconds,
+                " (drawing from the render cache)" if cached else ""))
+        except Exception as error:
+            failures += 1
+            sys.stderr.write("{}: FAILED: {}\n".format(diagram[0], error))
+    pool.join()
+    parse_pool.close()
+    parse_pool.join()
+    if git_reader is not None:
+        git_reader.close()
+
+    sys.stderr.write("{} diagrams, {} failed. {} {} files for {} urls. {} parse workers kept {} parsed .proto files and {} labels\n".format(
+        len(diagrams), failures, "Downloaded" if git_reader is None else "Read", downloads.misses, downloads.requests,
+        len(worker_kept), sum(kept[0] for kept in worker_kept.values()), sum(kept[1] for kept in worker_kept.values())))
+
+    return 1 if failures > 0 else 0
+
+if __name__ == "__main__" :
+    sys.exit(main(sys.argv))
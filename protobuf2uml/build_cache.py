@@ -0,0 +1,194 @@
+#! /usr/bin/python
+
+"""
+build_cache.py: compile the .proto files in schemas_proto into the FileDescriptorSet that descriptor2uml.py reads, for
+make_uml.sh. protoc only runs for files that changed:
+
+python build_cache.py --proto_dir schemas_proto --descriptor_set schemas_proto/MyFileDescriptorSet.pb
+
+Each .proto file is compiled on its own, into a FileDescriptorSet holding just that file. A FileDescriptorSet is only
+its list of files, so these are simply joined together (in file name order) to make the set for all of them.
+Each compiled file is kept in a cache directory (by default ~/.cache/schema-uml-build), under a hash of the .proto file,
+of every file it imports (directly or not), and of the protoc version. If the same inputs were compiled before, the
+result is copied from the cache instead of running protoc. The other files are compiled --jobs at a time.
+--descriptor_proto generates python code for one more .proto file, cached the same way (descriptor2uml.py
+no longer needs a generated descriptor_pb2.py).
+
+The cache is kept under --cache_size megabytes by deleting the files that were least recently used, just like
+render_uml.py's cache of drawings.
+"""
+
+import argparse, sys, os, io, re, hashlib, subprocess, tempfile, shutil, multiprocessing
+from multiprocessing.pool import ThreadPool
+import render_uml
+
+# Matches the imports in a .proto file, e.g. import "common.proto";
+PROTO_IMPORT_RE = re.compile(r'^\s*import\s+(?:public\s+|weak\s+)?"([^"]+)"\s*;', re.MULTILINE)
+
+def parse_args(args):
+
+    args = args[1:]
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--proto_dir", type=str, default="schemas_proto",
+        help="directory of .proto files to compile")
+    parser.add_argument("--descriptor_set", type=str, default=None,
+        help="where to write the FileDescriptorSet (default: MyFileDescriptorSet.pb in --proto_dir)")
+    parser.add_argument("--descriptor_proto", type=str, default=None,
+        help="also generate python code for this .proto file (e.g. descriptor.proto) into --python_out")
+    parser.add_argument("--python_out", type=str, default=".",
+        help="directory for the python code generated for --descriptor_proto")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(),
+        help="how many protoc processes may run at once")
+    parser.add_argument("--cache_dir", type=str, default=default_cache_dir(),
+        help="directory to keep compiled files in")
+    parser.add_argument("--cache_size", type=float, default=200,
+        help="how many megabytes of compiled files to keep")
+    parser.add_argument("--no_cache", action="store_true",
+        help="always run protoc, and don't keep the compiled files")
+
+    options = parser.parse_args(args)
+    if options.descriptor_set is None:
+        options.descriptor_set = os.path.join(options.proto_dir, "MyFileDescriptorSet.pb")
+
+    return options
+
+# Returns the directory compiled files are kept in by default, e.g. ~/.cache/schema-uml-build (next to render_uml.py's drawings).
+def default_cache_dir():
+    return os.path.join(os.path.dirname(render_uml.default_cache_dir()), "schema-uml-build")
+
+# Returns the SHA-1 hex digest of the contents of the file at path.
+def file_hash(path):
+    hasher = hashlib.sha1()
+    with open(path, "rb") as hashed_file:
+        for block in iter(lambda: hashed_file.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+# Returns the version line printed by protoc --version, e.g. "libprotoc 3.0.0". A different protoc might compile the same
+# file differently, so it is part of every cache key.
+def protoc_version():
+    process = subprocess.Popen(["protoc", "--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    return output.decode("utf-8", "replace").strip()
+
+# Returns a dict from the name of each .proto file in proto_dir to the list of names of the files it imports.
+def read_proto_imports(proto_dir):
+    imports = {}
+    for proto_name in sorted(os.listdir(proto_dir)):
+        if proto_name.endswith(".proto"):
+            with io.open(os.path.join(proto_dir, proto_name), "r", encoding="utf-8") as proto_file:
+                imports[proto_name] = [os.path.basename(imported) for imported in PROTO_IMPORT_RE.findall(proto_file.read())]
+    return imports
+
+# Returns the set of the given name and every name it imports, directly or not, given a dict from each name to the list of
+# names it imports.
+def import_closure(name, imports):
+    closure = set()
+    to_visit = [name]
+    while to_visit:
+        visiting = to_visit.pop()
+        if visiting not in closure:
+            closure.add(visiting)
+            to_visit.extend(imports.get(visiting, []))
+    return closure
+
+# Returns the cache key for compiling the .proto file with the given name: a hash of the tool_id, and of the name and
+# contents hash of the file and of everything it imports. content_hashes is a dict from name to contents hash, without
+# the names of missing files.
+def compile_key(name, imports, content_hashes, tool_id):
+    hasher = hashlib.sha1(tool_id.encode("utf-8"))
+    for closure_name in sorted(import_closure(name, imports)):
+        hasher.update("\0{}\0{}".format(closure_name, content_hashes.get(closure_name, "missing")).encode("utf-8"))
+    return hasher.hexdigest()
+
+# Compiles every .proto file in proto_dir on its own (with source info, for the comments descriptor2uml.py reads), jobs at
+# a time, and joins them into one FileDescriptorSet at descriptor_set_path. If cache is a render_uml.RenderCache, compiled
+# files are copied from it when their inputs haven't changed, and new ones are kept in it. Files that don't compile have
+# protoc's error printed, and then no FileDescriptorSet is written, just like when protoc compiles them all at once.
+# Returns (number of files, number copied from the cache, list of names that failed).
+def compile_protos(proto_dir, descriptor_set_path, cache=None, jobs=None):
+    imports = read_proto_imports(proto_dir)
+    names = sorted(imports)
+    content_hashes = dict((name, file_hash(os.path.join(proto_dir, name))) for name in names)
+    tool_id = protoc_version()
+
+    work_dir = tempfile.mkdtemp(prefix="uml_protoc_")
+
+    # Compiles one file into work_dir, and returns "cached", "compiled" or "failed".
+    def compile_one(name):
+        compiled_path = os.path.join(work_dir, name + ".pb")
+        key = compile_key(name, imports, content_hashes, tool_id)
+        if cache is not None and cache.fetch(key, "pb", compiled_path):
+            return "cached"
+
+        # Without --include_imports, the set only holds this one file.
+        process = subprocess.Popen(["protoc", "--include_source_info", "-I", proto_dir, "-o", compiled_path,
+            os.path.join(proto_dir, name)], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        if process.returncode != 0:
+            # Print it all at once, so it doesn't get mixed up with the other files.
+            sys.stderr.write("protoc could not compile {}:\n{}\n".format(name, output.decode("utf-8", "replace")))
+            return "failed"
+
+        if cache is not None:
+            cache.store(key, "pb", compiled_path)
+        return "compiled"
+
+    try:
+        pool = ThreadPool(jobs or multiprocessing.cpu_count())
+        try:
+            results = pool.map(compile_one, names)
+        finally:
+            pool.close()
+
+        failed = [name for name, result in zip(names, results) if result == "failed"]
+        if failed:
+            if os.path.exists(descriptor_set_path):
+                os.remove(descriptor_set_path)
+        else:
+            # Write a new file and move it into place, so nobody reads half of it.
+            with open(descriptor_set_path + ".tmp", "wb") as descriptor_set_file:
+                for name in names:
+                    with open(os.path.join(work_dir, name + ".pb"), "rb") as compiled_file:
+                        shutil.copyfileobj(compiled_file, descriptor_set_file)
+            os.rename(descriptor_set_path + ".tmp", descriptor_set_path)
+    finally:
+        shutil.rmtree(work_dir)
+
+    return len(names), results.count("cached"), failed
+
+# Generates the python code for proto_path (e.g. descriptor.proto gives descriptor_pb2.py) into python_out, like
+# protoc --python_out does. Returns True if it was copied from the cache.
+def generate_python(proto_path, python_out, cache=None):
+    proto_dir, proto_name = os.path.split(os.path.abspath(proto_path))
+    out_path = os.path.join(python_out, proto_name[:-len(".proto")] + "_pb2.py")
+
+    key = compile_key(proto_name, {}, {proto_name: file_hash(proto_path)}, protoc_version() + " --python_out")
+    if cache is not None and cache.fetch(key, "py", out_path):
+        return True
+
+    subprocess.check_call(["protoc", "-I", proto_dir, "--python_out", python_out, os.path.join(proto_dir, proto_name)])
+
+    if cache is not None:
+        cache.store(key, "py", out_path)
+    return False
+
+def main(args):
+    options = parse_args(args)
+
+    cache = None
+    if not options.no_cache:
+        cache = render_uml.RenderCache(options.cache_dir, int(options.cache_size * 1024 * 1024))
+
+    if options.descriptor_proto is not None:
+        generate_python(options.descriptor_proto, options.python_out, cache)
+
+    total, cached, failed = compile_protos(options.proto_dir, options.descriptor_set, cache, options.jobs)
+    sys.stderr.write("Compiled {} .proto files ({} from the build cache, {} failed)\n".format(total, cached, len(failed)))
+
+    return 1 if failed else 0
+
+if __name__ == "__main__" :
+    sys.exit(main(sys.argv))
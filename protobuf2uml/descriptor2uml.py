@@ -10,9 +10,18 @@ FileDescriptorSet as input. A FileDescriptorSet is itself a protobuf-serialized
 https://github.com/google/protobuf/blob/master/src/google/protobuf/descriptor.proto). See README for how to generate the FileDescriptorSet.
 """
 
-import argparse, sys, os, itertools, re, textwrap
-from descriptor_pb2 import FileDescriptorSet #note: uses proto2!!
-import url_converter
+import argparse, sys, collections
+import schema_graph, detail_levels, schema_inputs
+# Everything else, including protobuf itself, is imported by the functions that need it, since this runs thousands of
+# times in CI and most runs (e.g. --help, or without --catalog or --stream) never use most of it.
+# The FileDescriptorSet and FileDescriptorProto classes come from the descriptor.proto built into the protobuf runtime
+# (note: it uses proto2), so descriptor_pb2.py doesn't have to be generated first.
+
+# The dot attributes of --summary edges of each kind, like the containment and reference edges they stand for, but thinner.
+SUMMARY_EDGE_STYLES = {
+    "containment": "arrowtail=odiamond, arrowhead=none, style=solid, color=\"#C55A11\"",
+    "reference": "arrowtail=none, arrowhead=vee, style=dashed, color=\"darkgreen\"",
+}
 
 def parse_args(args):
 
@@ -20,17 +29,56 @@ def parse_args(args):
     parser = argparse.ArgumentParser(description=__doc__,
         formatter_class=argparse.RawDescriptionHelpFormatter)
 
-    parser.add_argument("--descriptor", type=argparse.FileType("rb"),
-        help="File with FileDescriptorSet of original schema")
+    parser.add_argument("--descriptor", type=schema_inputs.input_path,
+        help="File with FileDescriptorSet of original schema, which can be compressed (.gz, .bz2, .xz), or an archive (.tar.gz, .zip, ...) of FileDescriptorSets to read as one")
+    parser.add_argument("--members", type=str, nargs="+", default=["*.pb"],
+        help="only read the files in a --descriptor archive whose names match one of these patterns")
     parser.add_argument("--dot", type=argparse.FileType("w"),
         help="GraphViz file to write a UML diagram to")
     parser.add_argument("--type_comments", type=argparse.FileType("r"),
         help="tab-delimited file with type names and type header comments")
     parser.add_argument("--urls", type=argparse.FileType("r"),
         help="file with links to original schema files")
-
-
-    return parser.parse_args(args)
+    parser.add_argument("--stream", action="store_true",
+        help="write each node as soon as it is parsed, and keep edges and clusters in a temporary SQLite file instead of in memory")
+    parser.add_argument("--store_dir", type=str, default=None,
+        help="directory for the temporary SQLite file used by --stream")
+    parser.add_argument("--catalog", type=str, default=None,
+        help="SQLite file to keep parsed schemas in between runs, so that only new or changed files are parsed again")
+    parser.add_argument("--parts", type=str, default=None,
+        help="directory to also write each unconnected part of the diagram to, as its own .dot file for render_uml.py --parts")
+    parser.add_argument("--layout_hints", action="store_true",
+        help="write files after the files they use and types from containers down to what they contain, so dot has less to rearrange (for render_uml.py --profile)")
+    parser.add_argument("--detail", type=str, default="full", choices=detail_levels.DETAIL_LEVELS,
+        help="draw types as full tables, with only the fields that have edges, or as just a header")
+    parser.add_argument("--detail_file", type=argparse.FileType("r"),
+        help="tab-delimited file with .proto file or type names and the --detail level for them")
+    parser.add_argument("--cycles", type=str, default=None, choices=schema_graph.CYCLE_MODES,
+        help="find types that contain or reference each other in a cycle, report them, and either break each cycle at one edge or draw it as a group, so dot doesn't have to untangle it")
+    parser.add_argument("--summary", type=int, default=None, metavar="K",
+        help="draw an overview with only the K most central types, and an \"N more types\" box per .proto file for the rest")
+    parser.add_argument("--summary_per_cluster", action="store_true",
+        help="with --summary, keep the K most central types of each .proto file instead of overall")
+    parser.add_argument("--centrality", type=str, default="degree", choices=schema_graph.CENTRALITY_MEASURES,
+        help="how --summary picks the most central types: by their number of edges, or by PageRank over containments and references")
+
+    options = parser.parse_args(args)
+    if options.stream and options.catalog is not None:
+        parser.error("--stream and --catalog can't be used together")
+    if options.stream and options.parts is not None:
+        parser.error("--stream and --parts can't be used together")
+    if options.stream and options.layout_hints:
+        parser.error("--stream and --layout_hints can't be used together")
+    if options.stream and (options.detail != "full" or options.detail_file is not None):
+        parser.error("--stream can only draw types in full")
+    if options.stream and options.cycles is not None:
+        parser.error("--stream and --cycles can't be used together")
+    if options.summary is not None and (options.stream or options.parts is not None):
+        parser.error("--summary can't be used with --stream or --parts")
+    if options.summary is not None and options.summary < 1:
+        parser.error("--summary has to keep at least 1 type")
+
+    return options
 
 #check the "message" to see if it is a trivial map.
 def is_trivial_map(nested_type):
@@ -40,30 +88,141 @@ def is_trivial_map(nested_type):
     else:
         return False    
 
-#parse a message. Pass in all the dictionaries to be updated, as well as the relevant message
-# For now just parse the name, field, nested_type, and enum_type fields in DescriptorProto: https://github.com/google/protobuf/blob/master/src/google/protobuf/descriptor.proto#L92
-# Might later also want to parse oneof_decl, but assume for now I won't be dealing with that.
-def parse_message(cluster, fields, containments, nests, id_targets, id_references, clusters, message, message_index=None, edges_from=None):
-    #track all the fields in the message
-    fields[message.name] = []
-
-#    for field in message.field:
-    for field_index in range(0, len(message.field)):
-        field = message.field[field_index]
-        fields[message.name].append((field.name, field.type))
-        #deal with containments, id_targets, and id_references, if applicable.
+# Kinds of events walk_file() yields.
+# A top-level message, or a nested message which isn't a trivial map. node is the DescriptorProto.
+MESSAGE = "message"
+NESTED = "nested"
+# A field of the message in parent. node is the FieldDescriptorProto.
+FIELD = "field"
+# A top-level or nested enum. node is the EnumDescriptorProto.
+ENUM = "enum"
+# A nested message which is a trivial map, and so isn't walked into. node is the DescriptorProto.
+MAP_ENTRY = "map_entry"
+# Comes after everything inside a message (its fields, nested messages and enums). node is the message.
+MESSAGE_END = "message_end"
+# A source_code_info location with leading comments. node is the Location.
+COMMENT = "comment"
+
+# One thing found by walk_file(). file_name is the name of the .proto file, and path is the source_code_info path of node
+# in it, e.g. (4, 13, 2, 6) for field 6 of message 13. parent is the message that node is in, or None at the top level.
+WalkEvent = collections.namedtuple("WalkEvent", ["kind", "file_name", "path", "node", "parent"])
+
+# Walks one FileDescriptorProto and yields a WalkEvent for everything in it:
+# first the top-level enums, then each top-level message (with its fields, then its nested messages, each walked all the
+# way down, then its nested enums, then a MESSAGE_END), then the comments.
+# For now just walk the name, field, nested_type, and enum_type fields in DescriptorProto: https://github.com/google/protobuf/blob/master/src/google/protobuf/descriptor.proto#L92
+# Might later also want to walk oneof_decl, but assume for now I won't be dealing with that.
+# Nested messages are kept on an explicit stack instead of recursing, so deeply nested generated protos can't hit the recursion limit.
+def walk_file(cluster):
+    file_name = cluster.name
+
+    #the enum-types in the cluster. Path 5 is FileDescriptorProto.enum_type
+    for enum_index, enum in enumerate(cluster.enum_type):
+        yield WalkEvent(ENUM, file_name, (5, enum_index), enum, None)
+
+    #the message-types in the cluster. Path 4 is FileDescriptorProto.message_type
+    # Each stack entry is (kind, path, node, parent), where kind is MESSAGE, NESTED, MESSAGE_END or ENUM.
+    # Entries are pushed in reverse, so that they come off the stack in the order they are in the file.
+    stack = [(MESSAGE, (4, message_index), message, None) for message_index, message in enumerate(cluster.message_type)]
+    stack.reverse()
+    while stack:
+        kind, path, node, parent = stack.pop()
+        if kind == ENUM or kind == MESSAGE_END:
+            yield WalkEvent(kind, file_name, path, node, parent)
+            continue
+
+        # Note: according to https://developers.google.com/protocol-buffers/docs/proto#backwards-compatibility
+        # maps are sent as messages (not map-types) "on the wire". We don't want to draw nodes for nested types that are trivial maps of string to string.
+        # So, check if we want to walk into the nested_type:
+        if kind == NESTED and is_trivial_map(node):
+            yield WalkEvent(MAP_ENTRY, file_name, path, node, parent)
+            continue
+
+        yield WalkEvent(kind, file_name, path, node, parent)
+        #Path 2 is DescriptorProto.field
+        for field_index, field in enumerate(node.field):
+            yield WalkEvent(FIELD, file_name, path + (2, field_index), field, node)
+
+        # These come off the stack after all the nested messages.
+        stack.append((MESSAGE_END, path, node, parent))
+        #Path 4 is DescriptorProto.enum_type
+        for enum_index in reversed(range(len(node.enum_type))):
+            stack.append((ENUM, path + (4, enum_index), node.enum_type[enum_index], node))
+        #Path 3 is DescriptorProto.nested_type
+        #Note: it seems you can define a nested message without actually using it in a field in the outer message. So, a nested_type is not necessarily used in a field.
+        for nested_index in reversed(range(len(node.nested_type))):
+            stack.append((NESTED, path + (3, nested_index), node.nested_type[nested_index], node))
+
+    for location in cluster.source_code_info.location:
+        if location.leading_comments:
+            yield WalkEvent(COMMENT, file_name, tuple(location.path), location, None)
+
+# Walks every file in a FileDescriptorSet (or any other iterable of FileDescriptorProtos, e.g. iter_file_descriptors()), one after the other.
+def walk_files(file_descriptors):
+    for cluster in file_descriptors:
+        for event in walk_file(cluster):
+            yield event
+
+# Consumers of walk_file() events. Each one has an on_<kind> method for the kinds of events it cares about,
+# and fills in some of the dictionaries and sets that parse_cluster() returns.
+
+# Fills in fields (the fields of each message and the values of each enum) and clusters (the types in each file, in order).
+class TypeConsumer(object):
+    def __init__(self, fields, clusters):
+        self.fields = fields
+        self.clusters = clusters
+
+    def on_message(self, event):
+        #track all the fields in the message
+        self.fields[event.node.name] = []
+
+    on_nested = on_message
+
+    def on_field(self, event):
+        self.fields[event.parent.name].append((event.node.name, event.node.type))
+
+    def on_enum(self, event):
+        #Track all the enum "fields". An Enum field is a string. field types in DescriptorProto uses 9 for TYPE_STRING
+        #A nested enum is defined as a top-level type too, so it also has a fields entry.
+        self.fields[event.node.name] = [(value.name, 9) for value in event.node.value]
+        #Record the name of the enum as a type in the current cluster
+        self.clusters.setdefault(event.file_name, []).append(event.node.name)
+
+    def on_message_end(self, event):
+        #Add the name of the message as a type in the current cluster, after the types nested in it
+        self.clusters.setdefault(event.file_name, []).append(event.node.name)
+
+# Fills in containments.
+class ContainmentConsumer(object):
+    def __init__(self, containments, nests):
+        self.containments = containments
+        self.nests = nests
+
+    def on_field(self, event):
+        field = event.node
         #Containments will be signified by a field.type of 11 (for TYPE_MESSAGE) or 14 (for TYPE_ENUM). I can determine the type of containment by looking at field.type_name
         #Note: maps will also come up as type 11 and will have a field.type_name of something like .bmeg.Feature.AttributesEntry where the actual field name is attributes
         if field.type == 11 or field.type == 14:
-            # We are likely adding containments of trivial maps, e.g. ('VariantCallEffect', 'InfoEntry', 'info'). 
-            # The edge is only drawn if the map/message itself is processed fully using parse_message(), however. And, it will only be processed
-            # if it is not a trivial map. (see how nested_types are dealt with further down). When drawing containment edges, the program checks if the
+            # We are likely adding containments of trivial maps, e.g. ('VariantCallEffect', 'InfoEntry', 'info').
+            # The edge is only drawn if the map/message itself is walked into, however. And, it will only be walked into
+            # if it is not a trivial map (see walk_file()). When drawing containment edges, the program checks if the
             # field type_name is a key in the fields dictionary.
-            containments.add((message.name, field.type_name.split(".")[-1], field.name))
+            self.containments.add((event.parent.name, field.type_name.split(".")[-1], field.name))
+
+    #the nested_type is nested within the message. This is where it would be kept track of in nests,
+    #but for now actually don't bother drawing edges for nests.
+
+# Fills in id_targets and id_references.
+class IdConsumer(object):
+    def __init__(self, id_targets, id_references):
+        self.id_targets = id_targets
+        self.id_references = id_references
+
+    def on_field(self, event):
+        message, field = event.parent, event.node
         #id_targets are simply fields where field.name is "id"
         if field.name.lower() == "id":
-            id_targets[message.name.lower()] = (message.name, field.name.lower().split(".")[-1])
-            #id_targets[field.name.lower().split(".")[-1]] = message.name#field.name
+            self.id_targets[message.name.lower()] = (message.name, field.name.lower().split(".")[-1])
         #id_references are fields which end in id or ids
         elif field.name.lower().endswith("id") or field.name.lower().endswith("ids"):
             if field.name.lower().endswith("id"):
@@ -71,91 +230,112 @@ def parse_message(cluster, fields, containments, nests, id_targets, id_reference
             elif field.name.lower().endswith("ids"):
                 destination = field.name.lower()[0:-3]
             destination = destination.replace("_", "")
-            id_references.add((message.name, destination, field.name))
-        if field.name.endswith("Edges"):
-            edges_from[(cluster.name, 4, message_index, 2, field_index)] = [message.name, field.name]
+            self.id_references.add((message.name, destination, field.name))
 
-    for nested_type in message.nested_type:
-        #Note: it seems you can define a nested message without actually using it in a field in the outer message. So, a nested_type is not necessarily used in a field.
-        #fields[message.name].append((nested_type.name, 11)) #a nested_type is a message. field types in DescriptorProto uses 11 for TYPE_MESSAGE
-        
-        # Note: according to https://developers.google.com/protocol-buffers/docs/proto#backwards-compatibility 
-        # maps are sent as messages (not map-types) "on the wire". We don't want to draw nodes for nested types that are trivial maps of string to string.
-        # So, check if we want to process the nested_type further:
-        if not is_trivial_map(nested_type):
-            #the nested_type is nested within the message. So keep track of this edge in the nests variable
-            #nests.add((message.name, nested_type.name)) #for now actually don't bother drawing edges for nests.
-
-            #nested_type is itself a message, so recursively call this function.
-            parse_message(cluster, fields, containments, nests, id_targets, id_references, clusters, nested_type)
-
-    for enum_type in message.enum_type: #a nested Enum
-        #we can consider the enum a nesting too
-        #nests.add((message.name, enum_type.name)) #For now don't bother with drawing edges for xnests
-        #And define it as a top-level type. So it has a fields entry.
-        fields[enum_type.name] = []
-        for field in enum_type.value:
-            fields[enum_type.name].append((field.name, 9))
-        #Finally, add it to the cluster
-        clusters[cluster.name].append(enum_type.name)
-
-    #Add the name of the message as a type in the current cluster
-    clusters[cluster.name].append(message.name)
+# Fills in edges_from (fields ending in "Edges") and edges_targets (the types listed in a " Target:" comment line).
+# Both are keyed by (file name,) + source_code_info path, e.g. ('samples.proto', 4, 13, 2, 6), so they can be matched up.
+class EdgeConsumer(object):
+    def __init__(self, edges_from, edges_targets):
+        self.edges_from = edges_from
+        self.edges_targets = edges_targets
 
-def parse_cluster(cluster, fields, containments, nests, id_targets, id_references, edges_from, edges_targets, clusters):
-    
-    clusters[cluster.name] = []
+    def on_field(self, event):
+        if event.node.name.endswith("Edges"):
+            self.edges_from[(event.file_name,) + event.path] = [event.parent.name, event.node.name]
 
-    #process all the enum-types in the cluster
-    for enum in cluster.enum_type:
-        #Track all the enum "fields"
-        fields[enum.name] = []
-        for field in enum.value:
-            fields[enum.name].append((field.name, 9)) #an Enum field is a string. field types in DescriptorProto uses 9 for TYPE_STRING
-        #Record the name of the enum as a type in the current cluster
-        clusters[cluster.name].append(enum.name)
-
-    #track all the message-types in the cluster
-    #for message in cluster.message_type:
-    for message_index in range(0, len(cluster.message_type)):
-        message = cluster.message_type[message_index]
-        #recursively parse each message
-        parse_message(cluster, fields, containments, nests, id_targets, id_references, clusters, message, message_index, edges_from)
-        #Note: the message will add itself to the cluster
-
-    # Parse source_code_info for edge targets.
-    for source_location_index in range(0, len(cluster.source_code_info.location)):
-        location = cluster.source_code_info.location[source_location_index]
-        path = tuple(location.path)
+    def on_comment(self, event):
         # Example when split: [' Target: VariantCall Biosample Individual Feature', '']
-        comments = location.leading_comments.split('\n') 
+        comments = event.node.leading_comments.split('\n')
         if len(comments) > 1 and comments[-2].startswith(" Target:"):
-            targets = comments[-2].split(" ")[2:]
-            edges_targets_key = (cluster.name,) + path # e.g. (samples.proto, 4, 13, 2, 6)
-            edges_targets[edges_targets_key] = targets
-
-def write_graph(fields, containments, nests, matched_references, matched_edges, clusters, type_comments_file, urls_file, dot_file):
-
-    # Parse type_comments_file if applicable
+            self.edges_targets[(event.file_name,) + event.path] = comments[-2].split(" ")[2:]
+
+# Sends each event to the on_<kind> method of every consumer that has one.
+def consume_events(events, consumers):
+    handlers = {}
+    for event in events:
+        if event.kind not in handlers:
+            handlers[event.kind] = [getattr(consumer, "on_" + event.kind) for consumer in consumers
+                if hasattr(consumer, "on_" + event.kind)]
+        for handler in handlers[event.kind]:
+            handler(event)
+
+# Parses one file of a FileDescriptorSet into the given dictionaries and sets, in a single walk over it.
+def parse_cluster(cluster, fields, containments, nests, id_targets, id_references, edges_from, edges_targets, clusters):
+    # Every file gets a cluster, even if it has no types.
+    clusters[cluster.name] = []
+    consume_events(walk_file(cluster), [TypeConsumer(fields, clusters), ContainmentConsumer(containments, nests),
+        IdConsumer(id_targets, id_references), EdgeConsumer(edges_from, edges_targets)])
+
+# Breaks up a comment string so no more than ~57 characters are on each line
+def break_up_comment(comment):
+    import textwrap
+    wrapper = textwrap.TextWrapper(break_long_words = False, width = 57)
+    return "<BR/>".join(wrapper.wrap(comment))
+
+# Returns the dot statement which draws one node/type/record as a table, with one port per field.
+# If label_cache is a dict, finished labels are kept in it so a type which looks the same in many diagrams is only built once.
+def type_to_label(type_name, field_list, type_comments, label_cache=None):
+    comment = type_comments.get(type_name, None)
+
+    if label_cache is not None:
+        cache_key = (type_name, tuple(field_list), comment)
+        if cache_key in label_cache:
+            return label_cache[cache_key]
+
+    lines = []
+    lines.append("{} [label=<\n".format(type_name))#type_to_display(type_name)))
+    lines.append("<TABLE BORDER='0' CELLBORDER='1' CELLSPACING='0' CELLPADDING='4' bgcolor='#002060' color='#002060'>\n")
+    lines.append("\t<TR>\n")
+    lines.append("\t\t<TD COLSPAN='2' bgcolor='#79A6FF' border='3'><FONT POINT-SIZE='20' color='white'>{}</FONT>".format(type_name))
+
+    # Add option to specify description for header:
+    if comment is not None:
+        lines.append("<BR/><FONT POINT-SIZE='15' color='white'>{}</FONT>".format(break_up_comment(comment)))
+
+    lines.append("</TD>\n")
+    lines.append("\t</TR>\n")
+
+
+    # Now draw the rows of fields for the type. A field_list of [a, b, c, d, e, f, g] will have [a, e] in row 1, [b, f] in row 2, [c, g] in row 3, and just [d] in row 4
+    num_fields = len(field_list)
+    for i in range(0, num_fields//2 + num_fields%2):
+        # Draw one row.
+        lines.append("\t<TR>\n")
+        # Port number and displayed text will be the i'th field's name
+        lines.append("\t\t<TD align='left' port='{}'><FONT color='white'>- {}</FONT></TD>\n".format(field_list[i][0], field_list[i][0]))
+        if (num_fields%2) == 1 and (i == num_fields//2 + num_fields%2 - 1):
+            # Don't draw the second cell in the row if you have an odd number of fields and it is the last row
+            pass
+        else:
+            lines.append("\t\t<TD align='left' port='{}'><FONT color='white'>- {}</FONT></TD>\n".format(field_list[num_fields//2 + num_fields%2 + i][0], field_list[num_fields//2 + num_fields%2 + i][0]))
+        lines.append("\t</TR>\n")
+
+    # Finish the table
+    lines.append("</TABLE>>];\n\n")
+
+    label = "".join(lines)
+    if label_cache is not None:
+        label_cache[cache_key] = label
+    return label
+
+# Parse type_comments_file if applicable. Returns a dict from type name to header comment.
+def read_type_comments(type_comments_file):
     type_comments = {}
     if type_comments_file is not None:
         for type_comment in type_comments_file:
             type_comment_split = type_comment.split("\t")
             type_comments[type_comment_split[0]] = type_comment_split[1].strip()
+    return type_comments
 
-    # Breaks up a comment string so no more than ~57 characters are on each line
-    def break_up_comment(comment):
-        wrapper = textwrap.TextWrapper(break_long_words = False, width = 57)
-        return "<BR/>".join(wrapper.wrap(comment))
-
-    # Fill in the urls dictionary.
-    urls = {}
-    if urls_file is not None:
-        for url in urls_file:
-            cooked_url = url_converter.get_cooked_url(url.strip())
-            url_key = cooked_url.split("/")[-1]
-            urls[url_key] = cooked_url
+# Fill in the urls dictionary. Returns a dict from cluster/file name (e.g. reads.proto) to its url. The same unchanged urls
+# file gives the same dict (see url_converter.cluster_urls()), which shouldn't be changed.
+def read_urls(urls_file):
+    if urls_file is None:
+        return {}
+    import url_converter
+    return url_converter.cluster_urls(urls_file)
 
+def write_graph_start(dot_file):
     # Start a digraph
     dot_file.write("digraph UML {\n")
 
@@ -164,56 +344,81 @@ def write_graph(fields, containments, nests, matched_references, matched_edges,
     dot_file.write("\tshape=plaintext\n")
     dot_file.write("]\n\n")
 
-    # Draw each node/type/record as a table
-    for type_name, field_list in fields.items(): #python 2.x uses dict.iteritems() but python 3.x uses dict.items()
-
-        dot_file.write("{} [label=<\n".format(type_name))#type_to_display(type_name)))
-        dot_file.write("<TABLE BORDER='0' CELLBORDER='1' CELLSPACING='0' CELLPADDING='4' bgcolor='#002060' color='#002060'>\n")
-        dot_file.write("\t<TR>\n")
-        dot_file.write("\t\t<TD COLSPAN='2' bgcolor='#79A6FF' border='3'><FONT POINT-SIZE='20' color='white'>{}</FONT>".format(type_name))
-
-        # Add option to specify description for header:
-        if type_name in type_comments:
-            dot_file.write("<BR/><FONT POINT-SIZE='15' color='white'>{}</FONT>".format(break_up_comment(type_comments[type_name])))
-
-        dot_file.write("</TD>\n")
-        dot_file.write("\t</TR>\n")
-
-
-        # Now draw the rows of fields for the type. A field_list of [a, b, c, d, e, f, g] will have [a, e] in row 1, [b, f] in row 2, [c, g] in row 3, and just [d] in row 4
-        num_fields = len(field_list)
-        for i in range(0, num_fields//2 + num_fields%2):
-            # Draw one row.
-            dot_file.write("\t<TR>\n")
-			# Port number and displayed text will be the i'th field's name
-            dot_file.write("\t\t<TD align='left' port='{}'><FONT color='white'>- {}</FONT></TD>\n".format(field_list[i][0], field_list[i][0])) 
-            if (num_fields%2) == 1 and (i == num_fields//2 + num_fields%2 - 1):
-                # Don't draw the second cell in the row if you have an odd number of fields and it is the last row
-                pass
-            else:
-                dot_file.write("\t\t<TD align='left' port='{}'><FONT color='white'>- {}</FONT></TD>\n".format(field_list[num_fields//2 + num_fields%2 + i][0], field_list[num_fields//2 + num_fields%2 + i][0]))
-            dot_file.write("\t</TR>\n")
-
-        # Finish the table
-        dot_file.write("</TABLE>>];\n\n")
-
-    # Now define the clusters/subgraphs
-    for cluster_name, cluster_types in clusters.items(): #python 2.x uses dict.iteritems() but python 3.x uses dict.items()
-        dot_file.write("subgraph cluster_{} {{\n".format(cluster_name.replace(".", "_")))
-        dot_file.write("\tstyle=\"rounded, filled\";\n")
-        dot_file.write("\tcolor=lightgrey;\n")
-        dot_file.write("\tnode [style=filled,color=white];\n")
-        dot_file.write("\tlabel = \"{}\";\n".format(cluster_name.replace(".", "_")))
-
-        if cluster_name in urls:
-            dot_file.write("\tURL=\"{}\";\n".format(urls[cluster_name]))
-
-        #After all the cluster formatting, define the cluster types
-        for cluster_type in cluster_types:
-            dot_file.write("\t{};\n".format(cluster_type)) #cluster_type should match up with a type_name from fields
-        dot_file.write("}\n\n")
-
+# Write one cluster/subgraph holding the given types, linking to its schema file if it is in urls.
+# groups is a list of (cycle number, types) pairs from a schema_graph.CyclePlan, for cycles to draw as a box of their own
+# inside the cluster. If hidden_count isn't 0, the cluster also holds a placeholder for that many types left out of a summary.
+def write_cluster(dot_file, cluster_name, cluster_types, urls, groups=(), hidden_count=0):
+    dot_file.write("subgraph cluster_{} {{\n".format(cluster_name.replace(".", "_")))
+    dot_file.write("\tstyle=\"rounded, filled\";\n")
+    dot_file.write("\tcolor=lightgrey;\n")
+    dot_file.write("\tnode [style=filled,color=white];\n")
+    dot_file.write("\tlabel = \"{}\";\n".format(cluster_name.replace(".", "_")))
+
+    if cluster_name in urls:
+        dot_file.write("\tURL=\"{}\";\n".format(urls[cluster_name]))
+
+    #After all the cluster formatting, define the cluster types
+    group_of = dict((type_name, group) for group in groups for type_name in group[1])
+    for cluster_type in cluster_types:
+        if cluster_type in group_of:
+            # The whole cycle goes where its first type would.
+            number, members = group_of[cluster_type]
+            if members[0] == cluster_type:
+                write_cycle_group(dot_file, number, members)
+            continue
+        dot_file.write("\t{};\n".format(cluster_type)) #cluster_type should match up with a type_name from fields
+    if hidden_count > 0:
+        write_placeholder(dot_file, cluster_name, hidden_count)
+    dot_file.write("}\n\n")
+
+# Returns the dot node name of the placeholder for the types of the given cluster (or of no cluster, if it is None) that a
+# summary leaves out. It has spaces in it, so it can't be the same as any type's node.
+def placeholder_node(cluster_name):
+    if cluster_name is None:
+        return "\"more types\""
+    return "\"more types in {}\"".format(cluster_name)
+
+# Write the placeholder node standing for the given number of types of a cluster (or of no cluster) that a summary leaves out.
+def write_placeholder(dot_file, cluster_name, hidden_count):
+    dot_file.write("\t{} [shape=box, style=\"rounded, dashed\", color=grey40, fontcolor=grey40, label=\"{} more type{}\"];\n".format(
+        placeholder_node(cluster_name), hidden_count, "" if hidden_count == 1 else "s"))
+
+# Write the edges of a schema_graph.Summary: one edge for all the edges of one kind between the same two ends, where at
+# least one end is a placeholder, labelled with how many edges it stands for if that is more than one.
+def write_summary_edges(dot_file, summary):
+    dot_file.write("\n// Define summary edges, to and from the types that aren't drawn\n")
+    dot_file.write("\nedge [\n")
+    dot_file.write("\tdir=both\n")
+    dot_file.write("\tpenwidth=1\n")
+    dot_file.write("\tconstraint=true\n")
+    dot_file.write("]\n\n")
 
+    def end_node(end):
+        if end[0] == "more":
+            return placeholder_node(summary.hidden[end[1]][0])
+        return end[1]
+
+    for from_end, to_end, kind, count in summary.edges:
+        attributes = [SUMMARY_EDGE_STYLES[kind]]
+        if count > 1:
+            attributes.append("label=\"{}\"".format(count))
+        dot_file.write("{} -> {} [{}]\n".format(end_node(from_end), end_node(to_end), ", ".join(attributes)))
+
+# Write a box around the given types, which contain or reference each other in a cycle, inside the cluster being written.
+def write_cycle_group(dot_file, number, members):
+    dot_file.write("\tsubgraph cluster_cycle_{} {{\n".format(number))
+    dot_file.write("\t\tstyle=\"rounded, dashed\";\n")
+    dot_file.write("\t\tcolor=\"#C55A11\";\n")
+    dot_file.write("\t\tlabel = \"cycle {}\";\n".format(number))
+    for member in members:
+        dot_file.write("\t\t{};\n".format(member))
+    dot_file.write("\t}\n")
+
+# Write the containment edge style, then one edge per (container, containee, container field name) tuple.
+# The caller has to make sure that the containee is drawn. Edges from fields that aren't drawn (see
+# detail_levels.apply_detail() for shown_ports) start at the container itself. Edges between a (container, containee)
+# pair in loose_edges (see schema_graph.CyclePlan) aren't used for ranking.
+def write_containment_edges(dot_file, containments, shown_ports={}, loose_edges=frozenset()):
     dot_file.write("\n// Define containment edges\n")
     # Define edge properties for containments
     dot_file.write("edge [\n")
@@ -226,11 +431,15 @@ def write_graph(fields, containments, nests, matched_references, matched_edges,
 
     for container, containee, container_field_name in containments:
         # Now do the containment edges
-        # Only write the edge if the containee is a top-level field in fields.
-        if containee in fields:
-            dot_file.write("{}:{}:w -> {}\n".format(container,
-                                                    container_field_name, containee))
-
+        dot_file.write("{} -> {}{}\n".format(detail_levels.edge_end(container, container_field_name, shown_ports.get(container)),
+            containee, " [constraint=false]" if (container, containee) in loose_edges else ""))
+
+# Write the reference edge style, then one edge per (referencer, referencer field, referencee) tuple,
+# and one per target of each [[message name, field name], [targets]] edge found in comments.
+# If constraint is False, dot doesn't use these edges to decide which types go above which.
+# Ends at fields that aren't drawn (see shown_ports in write_containment_edges()) go to the type itself, and loose_edges
+# works like it does there.
+def write_reference_edges(dot_file, matched_references, matched_edges, constraint=True, shown_ports={}, loose_edges=frozenset()):
     dot_file.write("\n// Define references edges\n")
     # Define edge properties for references
     dot_file.write("\nedge [\n")
@@ -240,29 +449,281 @@ def write_graph(fields, containments, nests, matched_references, matched_edges,
     dot_file.write("\tstyle=dashed\n")
     dot_file.write("\tcolor=\"darkgreen\"\n")
     dot_file.write("\tpenwidth=2\n")
+    if not constraint:
+        dot_file.write("\tconstraint=false\n")
     dot_file.write("]\n\n")
 
     for referencer, referencer_field, referencee in matched_references:
         # Now do the reference edges
-        dot_file.write("{}:{}:w -> {}:id:w\n".format(referencer, referencer_field,
-            referencee))
+        dot_file.write("{} -> {}{}\n".format(detail_levels.edge_end(referencer, referencer_field, shown_ports.get(referencer)),
+            detail_levels.edge_end(referencee, "id", shown_ports.get(referencee)),
+            " [constraint=false]" if (referencer, referencee) in loose_edges else ""))
 
     # Now make the edges which had targets encoded in leading comments
     for outgoing, targets in matched_edges:
         # Format is: [['PhenotypeAssociation', 'hasGenotypeEdges'], ['VariantCall', 'Biosample', 'Individual', 'Feature']]]
         for target in targets:
-            dot_file.write("{}:{}:w -> {}:name:w\n".format(outgoing[0], outgoing[1], target))
-        
+            dot_file.write("{} -> {}{}\n".format(detail_levels.edge_end(outgoing[0], outgoing[1], shown_ports.get(outgoing[0])),
+                detail_levels.edge_end(target, "name", shown_ports.get(target)),
+                " [constraint=false]" if (outgoing[0], target) in loose_edges else ""))
+
+def write_graph(fields, containments, nests, matched_references, matched_edges, clusters, type_comments_file, urls_file, dot_file, label_cache=None,
+    layout_hints=None, detail=None, cycle_plan=None, summary=None):
+
+    # Parse type_comments_file if applicable
+    type_comments = read_type_comments(type_comments_file)
+
+    # Fill in the urls dictionary.
+    urls = read_urls(urls_file)
+
+    write_graph_with_lookups(fields, containments, nests, matched_references, matched_edges, clusters, type_comments, urls, dot_file, label_cache,
+        layout_hints, detail, cycle_plan, summary)
+
+# Like write_graph(), but with the type comments and urls already read into dicts.
+# If layout_hints (a schema_graph.LayoutHints) is given, clusters and types are written in its order instead of by name,
+# and only containments decide which types go above which. If detail (a dict from type name to level of detail, see
+# detail_levels.py) is given, types in it are drawn with fewer fields. If cycle_plan (a schema_graph.CyclePlan) is given,
+# its loose edges aren't used for ranking, and its groups are drawn as boxes. If summary (a schema_graph.Summary, with only
+# its kept types in fields, the edges and clusters) is given, its placeholders and edges are drawn too.
+def write_graph_with_lookups(fields, containments, nests, matched_references, matched_edges, clusters, type_comments, urls, dot_file, label_cache=None,
+    layout_hints=None, detail=None, cycle_plan=None, summary=None):
+    write_graph_start(dot_file)
+
+    # Only the containments of drawn types get edges.
+    containments = [containment for containment in containments if containment[1] in fields]
+
+    shown_ports = {}
+    if detail is not None:
+        # Keep the fields that edges start or end at, for types drawn at the "edges" level.
+        edge_ports = [(container, container_field_name) for container, containee, container_field_name in containments]
+        edge_ports += [(referencer, referencer_field) for referencer, referencer_field, referencee in matched_references]
+        edge_ports += [(referencee, "id") for referencer, referencer_field, referencee in matched_references]
+        edge_ports += [(outgoing[0], outgoing[1]) for outgoing, targets in matched_edges]
+        edge_ports += [(target, "name") for outgoing, targets in matched_edges for target in targets]
+        fields, shown_ports = detail_levels.apply_detail(fields, detail, edge_ports)
+
+    # Everything is written in sorted order (or in the order of the layout hints, which are worked out the same way every
+    # time), so the same schema always gives exactly the same file (and render_uml.py can find it in its cache).
+    # Sets, and dicts before python 3.7, have no fixed order.
+    if layout_hints is None:
+        type_names = sorted(fields)
+        cluster_names = sorted(clusters)
+    else:
+        type_names = schema_graph.hinted_order(layout_hints.type_order, fields)
+        cluster_names = schema_graph.hinted_order(layout_hints.cluster_order, clusters)
+
+    loose_edges = frozenset()
+    groups = {}
+    if cycle_plan is not None:
+        loose_edges = cycle_plan.loose_edges
+        groups = cycle_plan.groups
+
+    # Draw each node/type/record as a table
+    for type_name in type_names:
+        dot_file.write(type_to_label(type_name, fields[type_name], type_comments, label_cache))
+
+    hidden_counts = {}
+    if summary is not None:
+        hidden_counts = dict((cluster_name, len(hidden_types)) for cluster_name, hidden_types in summary.hidden)
+        if None in hidden_counts:
+            write_placeholder(dot_file, None, hidden_counts[None])
+
+    # Now define the clusters/subgraphs
+    for cluster_name in cluster_names:
+        cluster_types = clusters[cluster_name]
+        if layout_hints is not None:
+            cluster_types = schema_graph.hinted_order(layout_hints.type_order, cluster_types)
+        write_cluster(dot_file, cluster_name, cluster_types, urls, groups.get(cluster_name, ()), hidden_counts.get(cluster_name, 0))
+
+    # Only write the containment edges where the containee is a top-level field in fields.
+    write_containment_edges(dot_file, sorted(containments), shown_ports, loose_edges)
+
+    write_reference_edges(dot_file, sorted(matched_references), sorted(matched_edges), constraint=(layout_hints is None),
+        shown_ports=shown_ports, loose_edges=loose_edges)
+
+    if summary is not None:
+        write_summary_edges(dot_file, summary)
 
     # Close the digraph off.
     dot_file.write("}\n")
 
+# Splits the diagram into the parts that aren't connected by edges or clusters, and writes each part to its own .dot file
+# in parts_dir, the same way write_graph_with_lookups() would write the whole diagram, with the same layout_hints,
+# detail and cycle_plan. Returns the list of paths written.
+def write_graph_parts(parts_dir, fields, containments, nests, matched_references, matched_edges, clusters, type_comments, urls, label_cache=None,
+    layout_hints=None, detail=None, cycle_plan=None):
+    # Containments of types that aren't drawn (e.g. trivial maps) don't connect anything.
+    containments = [containment for containment in containments if containment[1] in fields]
+    edges = [(container, containee) for container, containee, container_field_name in containments]
+    edges += [(referencer, referencee) for referencer, referencer_field, referencee in matched_references]
+    edges += [(outgoing[0], target) for outgoing, targets in matched_edges for target in targets]
+    components = schema_graph.connected_components(fields, edges, clusters.values())
+
+    # Sort everything into its part once, instead of looking through everything for each part.
+    part_of = {}
+    for index, component in enumerate(components):
+        for type_name in component:
+            part_of[type_name] = index
+    part_fields = [{} for component in components]
+    part_containments = [set() for component in components]
+    part_references = [set() for component in components]
+    part_edges = [[] for component in components]
+    part_clusters = [{} for component in components]
+    for type_name, field_list in fields.items():
+        part_fields[part_of[type_name]][type_name] = field_list
+    for containment in containments:
+        part_containments[part_of[containment[0]]].add(containment)
+    for reference in matched_references:
+        part_references[part_of[reference[0]]].add(reference)
+    for matched_edge in matched_edges:
+        part_edges[part_of[matched_edge[0][0]]].append(matched_edge)
+    for cluster_name, cluster_types in clusters.items():
+        if len(cluster_types) > 0:
+            part_clusters[part_of[cluster_types[0]]][cluster_name] = cluster_types
+
+    def write_part(component, dot_file):
+        index = part_of[component[0]]
+        write_graph_with_lookups(part_fields[index], part_containments[index], nests, part_references[index],
+            part_edges[index], part_clusters[index], type_comments, urls, dot_file, label_cache, layout_hints, detail,
+            schema_graph.part_cycle_plan(cycle_plan, part_fields[index]))
+
+    return schema_graph.write_parts(parts_dir, components, write_part)
+
+# Read a serialized FileDescriptorSet one FileDescriptorProto at a time, instead of parsing the whole set at once.
+# A FileDescriptorSet is just its "file" field (number 1, length-delimited) repeated, so each file is a tag byte,
+# a varint length, and that many bytes of FileDescriptorProto.
+def iter_file_descriptors(descriptor_file):
+    from google.protobuf.descriptor_pb2 import FileDescriptorProto
+    for file_bytes in iter_file_descriptor_bytes(descriptor_file):
+        yield FileDescriptorProto.FromString(file_bytes)
+
+# Like iter_file_descriptors(), but yields each serialized FileDescriptorProto without parsing it.
+def iter_file_descriptor_bytes(descriptor_file):
+    def read_varint():
+        value = 0
+        shift = 0
+        while True:
+            byte = descriptor_file.read(1)
+            if byte == b"":
+                return None
+            value |= (ord(byte) & 0x7f) << shift
+            if not ord(byte) & 0x80:
+                return value
+            shift += 7
+
+    while True:
+        tag = read_varint()
+        if tag is None:
+            return
+        length = read_varint()
+        if tag != (1 << 3 | 2) or length is None:
+            raise RuntimeError("{} is not a FileDescriptorSet".format(getattr(descriptor_file, "name", "input")))
+        yield descriptor_file.read(length)
+
+# Like parse_descriptor() followed by write_graph(), but with about the same memory use however many types there are.
+# Only one file from the FileDescriptorSet is in memory at a time, and its nodes are written as soon as it is parsed.
+# Cluster membership and the edges which can only be resolved once every file has been seen go into a temporary
+# SQLite file (in store_dir, or the system temporary directory), and are resolved and written at the end.
+def stream_descriptor(descriptor_file, type_comments_file, urls_file, dot_file, store_dir=None):
+    import edge_store
+
+    # These are small, hand-made files, so we keep them in memory.
+    type_comments = read_type_comments(type_comments_file)
+    urls = read_urls(urls_file)
+
+    store = edge_store.EdgeStore(store_dir)
+    try:
+        write_graph_start(dot_file)
+
+        for cluster in iter_file_descriptors(descriptor_file):
+            # Parse just this file.
+            (cluster_fields, cluster_containments, cluster_nests, cluster_id_targets, cluster_id_references,
+                cluster_edges_from, cluster_edges_targets, cluster_clusters) = parse_one_cluster(cluster)
+
+            # Draw its nodes right away.
+            for type_name, field_list in sorted(cluster_fields.items()):
+                store.add_type(type_name)
+                dot_file.write(type_to_label(type_name, field_list, type_comments))
+
+            # And spill everything else to the store.
+            for cluster_name, cluster_types in cluster_clusters.items():
+                for cluster_type in cluster_types:
+                    store.add_member(cluster_name, cluster_type)
+            for container, containee, container_field_name in cluster_containments:
+                store.execute("INSERT INTO containments (container, field, used) VALUES (?, ?, ?)",
+                    (container, container_field_name, containee))
+            for target, (type_name, id_field) in cluster_id_targets.items():
+                # Later files win, like in parse_descriptor().
+                store.execute("INSERT OR REPLACE INTO id_targets (target, type_name) VALUES (?, ?)", (target, type_name))
+            for referencer, destination, referencer_field in cluster_id_references:
+                store.execute("INSERT INTO id_references (referencer, destination, field) VALUES (?, ?, ?)",
+                    (referencer, destination, referencer_field))
+            for path, (type_name, field_name) in cluster_edges_from.items():
+                store.execute("INSERT OR REPLACE INTO edge_sources (path, type_name, field) VALUES (?, ?, ?)",
+                    (repr(path), type_name, field_name))
+            for path, targets in cluster_edges_targets.items():
+                store.execute("INSERT OR REPLACE INTO edge_targets (path, targets) VALUES (?, ?)",
+                    (repr(path), " ".join(targets)))
+
+        # Now define the clusters/subgraphs
+        for cluster_name, cluster_types in store.clusters():
+            write_cluster(dot_file, cluster_name, cluster_types, urls)
+
+        # Only write the containment edges where the containee is a top-level field in fields.
+        write_containment_edges(dot_file, store.query(
+            "SELECT DISTINCT container, used, field FROM containments WHERE used IN (SELECT name FROM types) ORDER BY container, used, field"))
+
+        matched_references = store.query("SELECT DISTINCT id_references.referencer, id_references.field, id_targets.type_name "
+            "FROM id_references JOIN id_targets ON id_references.destination = id_targets.target ORDER BY 1, 2, 3")
+        def matched_edges():
+            for type_name, field_name, targets in store.query("SELECT edge_sources.type_name, edge_sources.field, edge_targets.targets "
+                "FROM edge_sources JOIN edge_targets ON edge_sources.path = edge_targets.path ORDER BY 1, 2, 3"):
+                existing_targets = []
+                for target in targets.split(" "):
+                    if store.has_type(target):
+                        existing_targets.append(target)
+                    else:
+                        sys.stderr.write("WARNING: {}.{} has Target {}, which does not exist\n".format(type_name, field_name, target))
+                yield [type_name, field_name], existing_targets
+        write_reference_edges(dot_file, matched_references, matched_edges())
+
+        # Close the digraph off.
+        dot_file.write("}\n")
+    finally:
+        store.close()
 
 #for now, returns fields, containments, and references (and clusters?), although in the future might want to also return type_comments and urls and clusters, etc...
-def parse_descriptor(descriptor_file):
+#If cluster_cache is a dict, the results of parsing each file in the FileDescriptorSet are kept in it and re-used when the same file shows up again.
+def parse_descriptor(descriptor_file, cluster_cache=None):
+    import hashlib
+    from google.protobuf.descriptor_pb2 import FileDescriptorSet
+
     descriptor = FileDescriptorSet()
     descriptor.MergeFromString(descriptor_file.read())
 
+    parsed_clusters = []
+    for cluster in descriptor.file:
+        if cluster_cache is None:
+            parsed_clusters.append(parse_one_cluster(cluster))
+        else:
+            # Parse each file on its own, keyed by its serialized contents, so that a file shared by many descriptor sets is only parsed once.
+            cache_key = hashlib.sha1(cluster.SerializeToString()).hexdigest()
+            if cache_key not in cluster_cache:
+                cluster_cache[cache_key] = parse_one_cluster(cluster)
+            parsed_clusters.append(cluster_cache[cache_key])
+
+    return combine_parsed_clusters(parsed_clusters)
+
+# Runs parse_cluster() on one file of a FileDescriptorSet, into new containers. Returns the tuple
+# (fields, containments, nests, id_targets, id_references, edges_from, edges_targets, clusters) for just that file.
+def parse_one_cluster(cluster):
+    parsed_cluster = ({}, set(), set(), {}, set(), {}, {}, {})
+    parse_cluster(cluster, *parsed_cluster)
+    return parsed_cluster
+
+# Merges a list of parse_one_cluster() results, in the order the files are in the FileDescriptorSet, and matches up the edges.
+# Returns the same things as parse_descriptor().
+def combine_parsed_clusters(parsed_clusters):
     # Holds the fields for each type, as lists of tuples of (name, type),
     # indexed by type. All types are fully qualified.
     fields = {}
@@ -293,9 +754,17 @@ def parse_descriptor(descriptor_file):
     # Key: cluster/file name     Value: tuple of field names
     clusters = {}
 
-    for cluster in descriptor.file:
-        #Note: you can pass a dictionary into a function and modify the original since it still refers to the same location in memory I think? (you don't need to pass it back)
-        parse_cluster(cluster, fields, containments, nests, id_targets, id_references, edges_from, edges_targets, clusters)
+    for (cluster_fields, cluster_containments, cluster_nests, cluster_id_targets, cluster_id_references,
+        cluster_edges_from, cluster_edges_targets, cluster_clusters) in parsed_clusters:
+        # Later files win, just like when parse_cluster() fills in the same dictionaries for every file.
+        fields.update(cluster_fields)
+        containments.update(cluster_containments)
+        nests.update(cluster_nests)
+        id_targets.update(cluster_id_targets)
+        id_references.update(cluster_id_references)
+        edges_from.update(cluster_edges_from)
+        edges_targets.update(cluster_edges_targets)
+        clusters.update(cluster_clusters)
 
     # Now match the id references to targets.
     matched_references = set() #will contain tuples of strings, i.e. (referencer, referencer_field, referencee)
@@ -308,7 +777,14 @@ def parse_descriptor(descriptor_file):
     matched_edges = []
     for key, value in edges_from.items():
         if key in edges_targets:
-            matched_edges.append([value, edges_targets[key]])
+            # Only keep targets which are types we actually draw, so dot doesn't have to make up nodes for the rest.
+            targets = []
+            for target in edges_targets[key]:
+                if target in fields:
+                    targets.append(target)
+                else:
+                    sys.stderr.write("WARNING: {}.{} has Target {}, which does not exist\n".format(value[0], value[1], target))
+            matched_edges.append([value, targets])
 
     return (fields, containments, nests, matched_references, matched_edges, clusters)
 """
@@ -338,14 +814,189 @@ def parse_descriptor(descriptor_file):
     print(matched_edges)
 """
     
+# Returns what parse_cluster() finds in one file of the FileDescriptorSet, as a dict from schema_catalog table name to a list of rows.
+def cluster_to_rows(cluster):
+    (cluster_fields, cluster_containments, cluster_nests, cluster_id_targets, cluster_id_references,
+        cluster_edges_from, cluster_edges_targets, cluster_clusters) = parse_one_cluster(cluster)
+
+    rows = {}
+    # Types are kept in cluster order. Fields are numbered in their type.
+    rows["types"] = [(seq, type_name, None) for seq, type_name in enumerate(cluster_clusters[cluster.name])]
+    rows["fields"] = [(type_name, seq, field_name, field_type) for type_name, field_list in cluster_fields.items()
+        for seq, (field_name, field_type) in enumerate(field_list)]
+    rows["containments"] = [(container, container_field_name, containee, None)
+        for container, containee, container_field_name in sorted(cluster_containments)]
+    rows["id_targets"] = [(target, type_name) for target, (type_name, id_field) in cluster_id_targets.items()]
+    rows["id_references"] = sorted(cluster_id_references)
+    # Source code info paths are kept as text, e.g. ('reads.proto', 4, 2, 2, 5)
+    rows["edge_sources"] = [(repr(path), type_name, field_name) for path, (type_name, field_name) in cluster_edges_from.items()]
+    rows["edge_targets"] = [(repr(path), " ".join(targets)) for path, targets in cluster_edges_targets.items()]
+    return rows
+
+# Bring a schema_catalog.SchemaCatalog up to date with the files in a FileDescriptorSet, and with the type comments and urls files.
+# Each file in the set is keyed by the hash of its serialized FileDescriptorProto, and only parsed if that isn't in the catalog yet.
+def catalog_descriptor(catalog, descriptor_file, type_comments_file, urls_file):
+    import schema_catalog
+    from google.protobuf.descriptor_pb2 import FileDescriptorProto
+
+    sources = []
+    for file_bytes in iter_file_descriptor_bytes(descriptor_file):
+        file_hash = schema_catalog.content_hash(file_bytes)
+        cluster = FileDescriptorProto.FromString(file_bytes)
+        if not catalog.has_contents(file_hash):
+            catalog.add_contents(file_hash, cluster_to_rows(cluster))
+        sources.append((cluster.name, file_hash, cluster.name))
+
+    catalog.set_sources(sources)
+    catalog.remove_unused_contents()
+
+    catalog.set_side_file("type_comments", type_comments_file.read() if type_comments_file is not None else None,
+        lambda data: read_type_comments(data.splitlines()).items())
+    catalog.set_side_file("urls", urls_file.read() if urls_file is not None else None,
+        lambda data: read_urls(data.splitlines()).items())
+
+    catalog.commit()
+
+# Returns the same things as parse_descriptor(), plus the type comments and urls dicts, worked out from a schema_catalog.SchemaCatalog.
+# Like in parse_descriptor(), when more than one file defines something, the last one wins.
+def query_catalog(catalog):
+    type_comments = catalog.side_values("type_comments")
+    urls = catalog.side_values("urls")
+
+    fields = {}
+    clusters = {}
+    # The file hash each type's fields come from.
+    owners = {}
+    for file_hash, cluster_name, type_name, namespace in catalog.types():
+        fields[type_name] = []
+        owners[type_name] = file_hash
+        clusters.setdefault(cluster_name, []).append(type_name)
+
+    for file_hash, type_name, field_name, field_type in catalog.rows("fields", ["type_name", "field_name", "field_type"]):
+        if owners[type_name] == file_hash:
+            fields[type_name].append((field_name, field_type))
+
+    containments = set((container, containee, container_field_name) for file_hash, container, container_field_name, containee
+        in catalog.rows("containments", ["container", "field", "used"]))
+
+    id_targets = dict((target, type_name) for file_hash, target, type_name in catalog.rows("id_targets", ["target", "type_name"]))
+
+    # Now match the id references to targets.
+    matched_references = set()
+    for file_hash, referencer, destination, referencer_field in catalog.rows("id_references", ["referencer", "destination", "field"]):
+        if destination in id_targets:
+            matched_references.add((referencer, referencer_field, id_targets[destination]))
+
+    # Now match outgoing edge fields to their targets found in comments, like parse_descriptor() does.
+    edges_from = dict((path, [type_name, field_name]) for file_hash, path, type_name, field_name
+        in catalog.rows("edge_sources", ["path", "type_name", "field"]))
+    edges_targets = dict((path, targets.split(" ")) for file_hash, path, targets in catalog.rows("edge_targets", ["path", "targets"]))
+    matched_edges = []
+    for key, value in edges_from.items():
+        if key in edges_targets:
+            targets = []
+            for target in edges_targets[key]:
+                if target in fields:
+                    targets.append(target)
+                else:
+                    sys.stderr.write("WARNING: {}.{} has Target {}, which does not exist\n".format(value[0], value[1], target))
+            matched_edges.append([value, targets])
+
+    return (fields, containments, set(), matched_references, matched_edges, clusters, type_comments, urls)
+
 def main(args):
     options = parse_args(args) # This holds the nicely-parsed options object
 
-    (fields, containments, nests, matched_references, matched_edges, clusters) = parse_descriptor(options.descriptor)
+    descriptor_file = None
+    if options.descriptor is not None:
+        # Decompressed (and read out of an archive) as it is parsed.
+        descriptor_file = schema_inputs.open_input(options.descriptor, options.members)
+
+    if options.stream:
+        # Parse and write at the same time, with about constant memory use.
+        if options.dot is not None:
+            stream_descriptor(descriptor_file, options.type_comments, options.urls, options.dot, options.store_dir)
+        return
+
+    if options.catalog is not None:
+        # Only parse the files that changed since the last run, and get the rest from the catalog.
+        import schema_catalog
+        catalog = schema_catalog.SchemaCatalog(options.catalog)
+        try:
+            catalog_descriptor(catalog, descriptor_file, options.type_comments, options.urls)
+            (fields, containments, nests, matched_references, matched_edges, clusters, type_comments, urls) = query_catalog(catalog)
+        finally:
+            catalog.close()
+        sys.stderr.write(catalog.report() + "\n")
+    else:
+        (fields, containments, nests, matched_references, matched_edges, clusters) = parse_descriptor(descriptor_file)
+        type_comments = read_type_comments(options.type_comments)
+        urls = read_urls(options.urls)
+
+    summary = None
+    if options.summary is not None:
+        # Only keep the most central types, and stand in for the rest with a placeholder per file. Containments of types
+        # that aren't drawn (e.g. trivial maps) don't count.
+        containments = [containment for containment in containments if containment[1] in fields]
+        summary = schema_graph.summarize(fields,
+            [(container, containee, "containment") for container, containee, container_field_name in containments] +
+            [(referencer, referencee, "reference") for referencer, referencer_field, referencee in matched_references] +
+            [(outgoing[0], target, "reference") for outgoing, targets in matched_edges for target in targets],
+            clusters, options.summary, options.centrality, options.summary_per_cluster)
+        fields = dict((type_name, field_list) for type_name, field_list in fields.items() if type_name in summary.kept)
+        containments = [containment for containment in containments
+            if containment[0] in summary.kept and containment[1] in summary.kept]
+        matched_references = [reference for reference in matched_references
+            if reference[0] in summary.kept and reference[2] in summary.kept]
+        matched_edges = [[outgoing, [target for target in targets if target in summary.kept]]
+            for outgoing, targets in matched_edges if outgoing[0] in summary.kept]
+        clusters = dict((cluster_name, [type_name for type_name in cluster_types if type_name in summary.kept])
+            for cluster_name, cluster_types in clusters.items())
+        sys.stderr.write("Summary: drew the {} most central types by {}, with placeholders for the other {}\n".format(
+            len(summary.kept), options.centrality, sum(len(hidden_types) for cluster_name, hidden_types in summary.hidden)))
+
+    # Table labels are built once, even when they are written to both the whole diagram and its parts.
+    label_cache = {}
+
+    layout_hints = None
+    if options.layout_hints:
+        # Start dot off with each file after the files whose types it contains, and the containers above what they
+        # contain. Containees that aren't drawn (e.g. trivial maps) don't count.
+        layout_hints = schema_graph.layout_hints(fields, clusters,
+            [(container, containee) for container, containee, container_field_name in containments if containee in fields])
+
+    detail = None
+    if options.detail != "full" or options.detail_file is not None:
+        # Work out how much of each type to draw, by type name or .proto file.
+        try:
+            levels = detail_levels.read_detail_file(options.detail_file)
+        except ValueError as error:
+            sys.stderr.write("{}\n".format(error))
+            return 1
+        detail = detail_levels.type_detail_levels(fields, clusters, options.detail, levels)
+
+    cycle_plan = None
+    if options.cycles is not None:
+        # Find the cycles among the edges dot ranks by (with layout hints, that is only the containments), and say what
+        # they are.
+        ranked_edges = [(container, containee) for container, containee, container_field_name in containments if containee in fields]
+        if layout_hints is None:
+            ranked_edges += [(referencer, referencee) for referencer, referencer_field, referencee in matched_references]
+            ranked_edges += [(outgoing[0], target) for outgoing, targets in matched_edges for target in targets]
+        cycle_plan = schema_graph.plan_cycles(fields, ranked_edges, clusters, options.cycles)
+        for line in schema_graph.describe_cycles(cycle_plan):
+            sys.stderr.write(line + "\n")
 
     if options.dot is not None:
         #Now write the diagram to the dot file!
-        write_graph(fields, containments, nests, matched_references, matched_edges, clusters, options.type_comments, options.urls, options.dot)
+        write_graph_with_lookups(fields, containments, nests, matched_references, matched_edges, clusters, type_comments, urls, options.dot, label_cache,
+            layout_hints, detail, cycle_plan, summary)
+
+    if options.parts is not None:
+        # Also write the unconnected parts separately, so render_uml.py can lay them out at the same time.
+        part_paths = write_graph_parts(options.parts, fields, containments, nests, matched_references, matched_edges, clusters, type_comments, urls, label_cache,
+            layout_hints, detail, cycle_plan)
+        sys.stderr.write("Wrote {} parts to {}\n".format(len(part_paths), options.parts))
 
 if __name__ == "__main__" :
     sys.exit(main(sys.argv))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+A temporary on-disk store for everything a UML generator has to remember until
+it has read all of the schema files: which types exist, which cluster each type
+is in, and the edges that can only be resolved once every type has been seen.
+
+It is used by the --stream option of the generators. Everything they would
+otherwise keep in memory until the end goes here, in SQLite, including the
+fields of types whose field types can only be written once every type is known.
+So memory use stays about the same however large the schema is.
+"""
+
+import os, sqlite3, tempfile
+
+SCHEMA = """
+CREATE TABLE types (name TEXT PRIMARY KEY);
+CREATE TABLE members (seq INTEGER PRIMARY KEY AUTOINCREMENT, cluster TEXT, type_name TEXT);
+CREATE INDEX members_by_cluster ON members (cluster, seq);
+CREATE TABLE symbols (name TEXT PRIMARY KEY, full_name TEXT, exact INTEGER);
+CREATE TABLE fields (seq INTEGER PRIMARY KEY AUTOINCREMENT, type_name TEXT, field TEXT, type TEXT, namespace TEXT);
+CREATE INDEX fields_by_type ON fields (type_name, seq);
+CREATE TABLE containments (container TEXT, field TEXT, used TEXT, namespace TEXT);
+CREATE TABLE id_targets (target TEXT PRIMARY KEY, type_name TEXT);
+CREATE TABLE id_references (referencer TEXT, destination TEXT, field TEXT);
+CREATE TABLE edge_sources (path TEXT PRIMARY KEY, type_name TEXT, field TEXT);
+CREATE TABLE edge_targets (path TEXT PRIMARY KEY, targets TEXT);
+"""
+
+class EdgeStore(object):
+    """
+    A SQLite database in a temporary file, deleted again by close().
+
+    """
+
+    def __init__(self, directory=None):
+        handle, self.path = tempfile.mkstemp(suffix=".sqlite", prefix="uml_edges_", dir=directory)
+        os.close(handle)
+        self.connection = sqlite3.connect(self.path)
+        # Nothing in here has to survive a crash, so don't pay for a journal,
+        # and keep SQLite's page cache small.
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("PRAGMA cache_size = -4096")
+        self.connection.executescript(SCHEMA)
+
+    def execute(self, sql, parameters=()):
+        """
+        Run one statement.
+
+        """
+
+        self.connection.execute(sql, parameters)
+
+    def query(self, sql, parameters=()):
+        """
+        Yield the rows of a query one at a time, without loading them all.
+
+        """
+
+        cursor = self.connection.cursor()
+        cursor.execute(sql, parameters)
+        for row in cursor:
+            yield row
+        cursor.close()
+
+    def query_one(self, sql, parameters=()):
+        """
+        Return the first row of a query, or None if there isn't one.
+
+        """
+
+        return self.connection.execute(sql, parameters).fetchone()
+
+    def add_type(self, name):
+        """
+        Record that a node has been written for the named type. Returns False if
+        it had been recorded already.
+
+        """
+
+        if self.query_one("SELECT 1 FROM types WHERE name = ?", (name,)) is not None:
+            return False
+        self.execute("INSERT INTO types (name) VALUES (?)", (name,))
+        return True
+
+    def types(self):
+        """
+        Yield the name of every recorded type, in the order they were added.
+
+        """
+
+        for (name,) in self.query("SELECT name FROM types ORDER BY rowid"):
+            yield name
+
+    def has_type(self, name):
+        """
+        Return True if a node has been written for the named type.
+
+        """
+
+        return self.query_one("SELECT 1 FROM types WHERE name = ?", (name,)) is not None
+
+    def add_member(self, cluster, type_name):
+        """
+        Add a type to the end of a cluster.
+
+        """
+
+        self.execute("INSERT INTO members (cluster, type_name) VALUES (?, ?)", (cluster, type_name))
+
+    def clusters(self):
+        """
+        Yield (cluster name, list of type names) tuples, sorted by cluster name.
+        The types in each cluster are in the order they were added.
+
+        """
+
+        for (cluster,) in self.query("SELECT DISTINCT cluster FROM members ORDER BY cluster"):
+            yield cluster, [type_name for (type_name,) in self.query(
+                "SELECT type_name FROM members WHERE cluster = ? ORDER BY seq", (cluster,))]
+
+    def add_symbol(self, name, full_name, exact):
+        """
+        Record that name can refer to the type full_name. A name that is exactly
+        the fully qualified name of a type always means that type. Any other name
+        that could mean more than one type means nothing (its full_name is NULL).
+
+        """
+
+        if exact:
+            self.execute("INSERT OR REPLACE INTO symbols (name, full_name, exact) VALUES (?, ?, 1)",
+                (name, full_name))
+        else:
+            self.execute("INSERT OR IGNORE INTO symbols (name, full_name, exact) VALUES (?, ?, 0)",
+                (name, full_name))
+            self.execute("UPDATE symbols SET full_name = NULL WHERE name = ? AND exact = 0 AND full_name IS NOT ?",
+                (name, full_name))
+
+    def table(self, table, key_column, value_column):
+        """
+        Return a read-only dict-like view of two columns of a table, so that code
+        written to look things up in dicts can look them up in here instead.
+
+        """
+
+        return StoreTable(self, table, key_column, value_column)
+
+    def close(self):
+        """
+        Close the database and delete its file.
+
+        """
+
+        self.connection.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class StoreTable(object):
+    """
+    Dict-like view (get, in and items) of a key column and a value column in an
+    EdgeStore table.
+
+    """
+
+    def __init__(self, store, table, key_column, value_column):
+        self.store = store
+        self.lookup_sql = "SELECT {} FROM {} WHERE {} = ?".format(value_column, table, key_column)
+        self.items_sql = "SELECT {}, {} FROM {}".format(key_column, value_column, table)
+
+    def get(self, key, default=None):
+        row = self.store.query_one(self.lookup_sql, (key,))
+        return default if row is None else row[0]
+
+    def __contains__(self, key):
+        return self.store.query_one(self.lookup_sql, (key,)) is not None
+
+    def items(self):
+        return self.store.query(self.items_sql)
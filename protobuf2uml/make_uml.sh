@@ -5,12 +5,23 @@
 # Download all the proto schema files into the schemas_proto folder
 # First clean-up old files from previous runs
 rm -rf schemas_proto/*
-# Obtain the raw github url's if not raw already:
-raw_schema_urls=$(python url_converter.py --getrawfromfile schema_urls)
-for raw_url in ${raw_schema_urls};
-do
-    wget --timestamping --directory-prefix ./schemas_proto ${raw_url};
-done
+if [ -n "${SCHEMA_REPO}" ]
+then
+    # Read the files in schema_urls straight out of a local clone of the schema repository instead of downloading them,
+    # at the revision in each url, or at ${SCHEMA_REVISION} if it is set. Nothing is checked out.
+    python git_source.py --repo "${SCHEMA_REPO}" --urls schema_urls --out_dir schemas_proto ${SCHEMA_REVISION:+--revision "${SCHEMA_REVISION}"} || exit 1
+else
+    # Obtain the raw github url's if not raw already (and those of other hosts in ${SCHEMA_URL_RULES}, if it is set):
+    raw_schema_urls=$(python url_converter.py --getrawfromfile schema_urls)
+    for raw_url in ${raw_schema_urls};
+    do
+        case "${raw_url}" in
+            # wget can't read file:// urls, e.g. from a checked-out mirror (see url_converter.py --rules)
+            file://*) cp "${raw_url#file://}" ./schemas_proto/ ;;
+            *) wget --timestamping --directory-prefix ./schemas_proto ${raw_url} ;;
+        esac
+    done
+fi
 
 # Replace user-defined package imports with no path. This allows proto files to find each other.
 #For example,     import "ga4gh/common.proto";       becomes       import "common.proto";
@@ -22,16 +33,40 @@ done
 # Remove any temporary files in the schemas_proto directory which have have been created as a result of editing, etc:
 #rm -rf schemas_proto/*~
 
-# Generate descriptor_pb2.py with protoc:
-protoc descriptor.proto --python_out=.
-
-# convert .proto files into a serialized FileDescriptorSet for input into descriptor2uml.py
-cd schemas_proto
-protoc --include_source_info -o MyFileDescriptorSet.pb *
-cd ../
+# Convert .proto files into a serialized FileDescriptorSet for input into descriptor2uml.py, which reads it with the
+# descriptor classes built into the protobuf runtime (so descriptor_pb2.py isn't generated any more).
+# build_cache.py only runs protoc for files that changed (or whose imports changed) since they were last compiled,
+# and copies the rest from its cache. Compiles run in parallel.
+python build_cache.py --proto_dir schemas_proto --descriptor_set schemas_proto/MyFileDescriptorSet.pb
 
 # Make the dot file which describes the UML diagram. The type_header_comments file can be empty (or you can remove the option altogether)
-python descriptor2uml.py --descriptor ./schemas_proto/MyFileDescriptorSet.pb --dot uml.dot --urls schema_urls #--type_comments type_header_comments 
+# Each part of the diagram that isn't connected to the rest is also written to its own file in uml_parts.
+# If ${LAYOUT_PROFILE} is set (draft, balanced or publication), the types are written in an order that is easier for dot to lay out.
+# If ${UML_DETAIL} is set (edges or header), types are drawn with fewer fields, which is quicker to lay out.
+# If ${UML_CYCLES} is set (break or collapse), types that contain or reference each other in a cycle are reported and untangled.
+python descriptor2uml.py --descriptor ./schemas_proto/MyFileDescriptorSet.pb --dot uml.dot --urls schema_urls --parts uml_parts ${LAYOUT_PROFILE:+--layout_hints} ${UML_DETAIL:+--detail "${UML_DETAIL}"} ${UML_CYCLES:+--cycles "${UML_CYCLES}"} #--type_comments type_header_comments 
+
+# Finally, draw the UMl diagram. render_uml.py lays out the parts at the same time, with one dot process each, and packs them together.
+# Parts which were drawn before are taken from its cache. ${LAYOUT_PROFILE} trades drawing quality for layout time, e.g. LAYOUT_PROFILE=draft.
+# Files in ${UML_EXTRA_OUTPUTS} (e.g. "uml.png uml.pdf") are written from the same layout, without laying it out again.
+python render_uml.py --parts uml_parts/*.dot --out uml.svg ${UML_EXTRA_OUTPUTS} ${LAYOUT_PROFILE:+--profile "${LAYOUT_PROFILE}"}
+
+# Strip the redundant attributes and comments dot writes, and also write a compressed uml.svgz
+python svg_minify.py --svg uml.svg --svgz
+
+# If ${UML_SUMMARY} is set (e.g. 25), also draw uml_summary.svg: an overview with only that many of the most central types,
+# and a box per file for the rest, which takes about as long to lay out however big the schema is.
+# ${UML_CENTRALITY} (degree or pagerank) says how central types are.
+if [ -n "${UML_SUMMARY}" ]
+then
+    python descriptor2uml.py --descriptor ./schemas_proto/MyFileDescriptorSet.pb --dot uml_summary.dot --urls schema_urls --summary "${UML_SUMMARY}" ${UML_CENTRALITY:+--centrality "${UML_CENTRALITY}"}
+    python render_uml.py --dot uml_summary.dot --out uml_summary.svg ${LAYOUT_PROFILE:+--profile "${LAYOUT_PROFILE}"}
+    python svg_minify.py --svg uml_summary.svg
+fi
 
-# Finally, draw the UMl diagram
-dot uml.dot -T svg -o uml.svg
+# With --watch, keep redrawing the diagram every time a file in schemas_proto is saved (press Ctrl-C to stop)
+# It draws and minifies it the same way as above, with the same ${LAYOUT_PROFILE}, ${UML_DETAIL} and ${UML_CYCLES}.
+if [ "$1" == "--watch" ]
+then
+    python watch_uml.py --urls schema_urls --parts uml_parts --minify ${LAYOUT_PROFILE:+--profile "${LAYOUT_PROFILE}"} ${UML_DETAIL:+--detail "${UML_DETAIL}"} ${UML_CYCLES:+--cycles "${UML_CYCLES}"} #--type_comments type_header_comments
+fi
@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+"""
+Draws a .dot file with Graphviz's dot program, e.g.:
+
+python render_uml.py --dot uml.dot --out uml.svg
+
+Laying out a big schema takes dot a long time, so every drawing is kept in a
+cache directory, under a hash of the .dot file, the output format, the options
+given to dot and the Graphviz version. If exactly the same graph is drawn again,
+the cached drawing is copied instead of running dot. The UML generators always
+write the same .dot file for the same schema, so this works across runs.
+
+The cache is kept under --cache_size megabytes by deleting the drawings that
+were least recently used.
+
+A big diagram can instead be drawn from the parts that aren't connected to each
+other (see schema_graph.py, and --parts in avpr2uml.py and descriptor2uml.py):
+
+python render_uml.py --parts uml_parts/*.dot --out uml.svg
+
+Each part is laid out by its own dot process, --jobs at a time, and only parts
+that changed since the last run have to be laid out again. Then gvpack packs the
+laid-out parts together, and neato draws them without moving anything. Add
+--dot uml.dot --compare to also lay out the whole diagram in one dot process,
+and report how much faster the parts were.
+
+Most of dot's time on a big diagram goes to moving nodes around to make fewer
+edges cross, and to routing curved edges around the nodes. A --profile limits
+that work (see LAYOUT_PROFILES):
+
+python render_uml.py --dot uml.dot --out uml.svg --profile draft
+
+draft draws straight edges, which may pass over other types, and only does a
+little of the crossing reduction, so it is the fastest, but edges cross more.
+balanced draws edges as bent lines, and does some more. publication draws curved
+edges and lets dot try as hard as it likes, which on a big diagram is the
+slowest. Without --profile, dot uses its own defaults. The drawings for each
+profile are cached separately. The generators' --layout_hints option writes the
+types in an order that is already close to what dot would choose, which helps
+most with draft, since it doesn't get to move them much.
+
+Give more than one --out to write several formats from the same layout:
+
+python render_uml.py --dot uml.dot --out uml.svg uml.png uml.pdf
+
+dot lays the diagram out once and writes every format from that layout, so each
+extra format only costs the time to write it. Each format is still cached on its
+own, and only the missing ones are drawn. An --out ending in .dot keeps the
+laid-out graph, with the positions dot chose, which can be drawn again later
+(in any format) without laying it out again:
+
+python render_uml.py --dot uml.layout.dot --positioned --out uml.png
+"""
+
+import argparse, sys, os, shutil, subprocess, hashlib, tempfile, time, multiprocessing
+from multiprocessing.pool import ThreadPool
+
+# Graph attributes for dot for each --profile. mclimit scales how many rounds of
+# crossing reduction dot does, nslimit and nslimit1 how many rounds of network
+# simplex it uses to place the ranks and the nodes on them, and searchsize how
+# hard it looks for an edge to swap in each round. remincross runs the crossing
+# reduction again after the clusters are placed.
+LAYOUT_PROFILES = {
+    "draft": ["-Gsplines=line", "-Gmclimit=0.1", "-Gnslimit=1", "-Gnslimit1=1", "-Gsearchsize=10",
+        "-Gremincross=false"],
+    "balanced": ["-Gsplines=polyline", "-Gmclimit=0.5", "-Gnslimit=5", "-Gnslimit1=5", "-Gremincross=false"],
+    "publication": ["-Gsplines=spline", "-Gmclimit=2", "-Gsearchsize=100", "-Gremincross=true"],
+}
+
+def parse_args(args):
+    """
+    Takes in the command-line arguments list (args), and returns a nice argparse
+    result with fields for all the options.
+    """
+
+    # The command line arguments start with the program name, which we don't
+    # want to treat as an argument for argparse. So we remove it.
+    args = args[1:]
+
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--dot", type=str, default=None,
+        help="the .dot file to draw")
+    parser.add_argument("--parts", type=str, default=None, nargs="+",
+        help="draw these .dot files, each a part of the same diagram, instead of --dot")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(),
+        help="how many dot processes may lay out --parts at once")
+    parser.add_argument("--compare", action="store_true",
+        help="lay out --parts and --dot without the cache, and report the time for each")
+    parser.add_argument("--out", type=str, required=True, nargs="+",
+        help="where to write the drawing, or several drawings of the same layout in different formats")
+    parser.add_argument("--format", type=str, default=None, nargs="+",
+        help="output format for dot -T for each --out (defaults to the extension of each --out, e.g. svg)")
+    parser.add_argument("--positioned", action="store_true",
+        help="--dot already has positions (e.g. it was written by an earlier --out uml.layout.dot), so draw it without laying it out")
+    parser.add_argument("--profile", type=str, default=None, choices=sorted(LAYOUT_PROFILES),
+        help="trade drawing quality for layout time (default: dot's own settings)")
+    parser.add_argument("--cache_dir", type=str, default=default_cache_dir(),
+        help="directory to keep drawings in")
+    parser.add_argument("--cache_size", type=float, default=200,
+        help="how many megabytes of drawings to keep")
+    parser.add_argument("--no_cache", action="store_true",
+        help="always run dot, and don't keep the drawing")
+
+    options = parser.parse_args(args)
+    if options.dot is None and options.parts is None:
+        parser.error("--dot or --parts is required")
+    if options.compare and (options.dot is None or options.parts is None):
+        parser.error("--compare needs both --dot and --parts")
+    if options.format is not None and len(options.format) != len(options.out):
+        parser.error("--format needs one format for each --out")
+    if options.positioned and (options.dot is None or options.parts is not None):
+        parser.error("--positioned only works with --dot")
+
+    return options
+
+def default_cache_dir():
+    """
+    Return the directory drawings are kept in by default, e.g.
+    ~/.cache/schema-uml-render
+
+    """
+
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "schema-uml-render")
+
+# The version line of dot, once graphviz_version() has run it.
+dot_version = None
+
+def graphviz_version():
+    """
+    Return the version line printed by dot -V, e.g. "dot - graphviz version
+    2.38.0 (20140413.2041)". Different versions can lay out the same graph
+    differently, so it is part of the cache key. dot -V is only run the first
+    time, so checking the cache for many outputs doesn't start a dot process
+    for each of them.
+
+    """
+
+    global dot_version
+    if dot_version is None:
+        process = subprocess.Popen(["dot", "-V"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        dot_version = output.decode("utf-8", "replace").strip()
+    return dot_version
+
+def render_key(dot_path, output_format, graphviz_args=()):
+    """
+    Return the cache key for drawing the given .dot file in the given format
+    with the given extra dot arguments.
+
+    """
+
+    hasher = hashlib.sha1()
+    with open(dot_path, "rb") as dot_file:
+        for block in iter(lambda: dot_file.read(1 << 20), b""):
+            hasher.update(block)
+    for part in [output_format] + list(graphviz_args) + [graphviz_version()]:
+        hasher.update(b"\0" + part.encode("utf-8"))
+    return hasher.hexdigest()
+
+def packed_key(part_keys, output_format, graphviz_args=()):
+    """
+    Return the cache key for drawing the parts with the given layout cache keys
+    (from render_key(), in -T dot format) packed together in the given format.
+
+    """
+
+    hasher = hashlib.sha1(b"packed")
+    for part in list(part_keys) + [output_format] + list(graphviz_args):
+        hasher.update(b"\0" + part.encode("utf-8"))
+    return hasher.hexdigest()
+
+class RenderCache(object):
+    """
+    A directory of drawings named by cache key, at most max_bytes big. Every
+    time a drawing is used, its modification time is set to now, so the oldest
+    modification time belongs to the least recently used drawing.
+
+    Many processes can use the same directory at once, since drawings are only
+    ever moved into place whole.
+
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Someone else made it first.
+                if not os.path.isdir(directory):
+                    raise
+
+    def entry_path(self, key, output_format):
+        return os.path.join(self.directory, "{}.{}".format(key, output_format))
+
+    def fetch(self, key, output_format, out_path):
+        """
+        Copy the cached drawing to out_path and return True, or return False if
+        there isn't one.
+
+        """
+
+        entry = self.entry_path(key, output_format)
+        try:
+            shutil.copyfile(entry, out_path)
+        except (IOError, OSError):
+            return False
+        try:
+            # Mark it as recently used.
+            os.utime(entry, None)
+        except OSError:
+            # It was evicted in the meantime, which is fine.
+            pass
+        return True
+
+    def store(self, key, output_format, drawing_path):
+        """
+        Keep a copy of the drawing at drawing_path, and evict old drawings to
+        make room.
+
+        """
+
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".incoming_")
+        os.close(handle)
+        shutil.copyfile(drawing_path, temp_path)
+        try:
+            os.rename(temp_path, self.entry_path(key, output_format))
+        except OSError:
+            # Windows won't rename over an existing file, but then someone else
+            # already stored this drawing.
+            os.remove(temp_path)
+        self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used drawings until the cache is small enough.
+
+        """
+
+        entries = []
+        total_bytes = 0
+        for name in os.listdir(self.directory):
+            if name.startswith("."):
+                # Still being written.
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_bytes += stat.st_size
+
+        for mtime, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_bytes -= size
+
+def profile_args(profile):
+    """
+    Return the list of extra arguments for dot for the named layout profile
+    (one of LAYOUT_PROFILES), or an empty list if profile is None.
+
+    """
+
+    if profile is None:
+        return []
+    return list(LAYOUT_PROFILES[profile])
+
+def output_list(out_paths, output_formats=None):
+    """
+    Return a list of (out path, format) pairs for the given output paths, with
+    the given formats, or the extension of each path (e.g. svg).
+
+    """
+
+    if output_formats is None:
+        output_formats = [None] * len(out_paths)
+    return [(out_path, output_format or os.path.splitext(out_path)[1][1:] or "svg")
+        for out_path, output_format in zip(out_paths, output_formats)]
+
+def output_args(outputs):
+    """
+    Return the Graphviz arguments for writing every (out path, format) pair in
+    outputs, e.g. -T svg -o uml.svg -T png -o uml.png. Graphviz lays the graph
+    out once and then writes each of them.
+
+    """
+
+    args = []
+    for out_path, output_format in outputs:
+        args += ["-T", output_format, "-o", out_path]
+    return args
+
+def render_outputs(dot_path, outputs, graphviz_args=(), cache=None, positioned=False):
+    """
+    Draw dot_path with dot to every (out path, format) pair in outputs, passing
+    it the extra graphviz_args. Formats that aren't in the cache (if cache is a
+    RenderCache) are all written by one dot process, from one layout, and kept
+    in the cache. If positioned is True, dot_path already has positions, and is
+    drawn with neato -n2 without laying it out again. Returns how many of the
+    outputs came from the cache.
+
+    """
+
+    key_args = list(graphviz_args)
+    if positioned:
+        key_args = ["neato", "-n2"] + key_args
+
+    to_draw = []
+    keys = {}
+    for out_path, output_format in outputs:
+        if cache is not None:
+            keys[out_path] = render_key(dot_path, output_format, key_args)
+            if cache.fetch(keys[out_path], output_format, out_path):
+                continue
+        to_draw.append((out_path, output_format))
+
+    if to_draw:
+        program = ["neato", "-n2"] if positioned else ["dot"]
+        subprocess.check_call(program + [dot_path] + output_args(to_draw) + list(graphviz_args))
+
+        if cache is not None:
+            for out_path, output_format in to_draw:
+                cache.store(keys[out_path], output_format, out_path)
+
+    return len(outputs) - len(to_draw)
+
+def render(dot_path, out_path, output_format=None, graphviz_args=(), cache=None):
+    """
+    Draw dot_path to out_path with dot, in the given format (by default, the
+    extension of out_path), passing it the extra graphviz_args. If cache is a
+    RenderCache, use the cached drawing if there is one, and keep the new one
+    otherwise. Returns True if the drawing came from the cache.
+
+    """
+
+    return render_outputs(dot_path, output_list([out_path], [output_format]), graphviz_args, cache) == 1
+
+def render_parts(part_paths, outputs, graphviz_args=(), cache=None, jobs=None):
+    """
+    Draw a diagram made of the .dot files in part_paths (which must not share
+    any nodes) to every (out path, format) pair in outputs. Each part is laid
+    out with dot on its own, jobs at a time (by default, one per CPU), through
+    the cache if there is one. Then the laid-out parts are packed together with
+    gvpack and drawn with neato -n2, which keeps the positions dot chose, and
+    writes all the formats at once. The packed drawings are kept in the cache
+    too, under the layouts of all the parts, so nothing is drawn again if no
+    part changed. Returns how many of the parts came from the cache.
+
+    """
+
+    if len(part_paths) == 1:
+        # Nothing to pack.
+        return 1 if render_outputs(part_paths[0], outputs, graphviz_args, cache) == len(outputs) else 0
+
+    keys = {}
+    if cache is not None:
+        part_keys = [render_key(part_path, "dot", graphviz_args) for part_path in part_paths]
+        to_draw = []
+        for out_path, output_format in outputs:
+            keys[out_path] = packed_key(part_keys, output_format, graphviz_args)
+            if not cache.fetch(keys[out_path], output_format, out_path):
+                to_draw.append((out_path, output_format))
+        if not to_draw:
+            # Every part is the same as when these were drawn.
+            return len(part_paths)
+        outputs = to_draw
+
+    layout_dir = tempfile.mkdtemp(prefix="uml_layout_")
+    try:
+        # dot -Tdot writes the graph back out with the positions it chose.
+        layout_paths = [os.path.join(layout_dir, "part_{}.dot".format(index)) for index in range(len(part_paths))]
+        pool = ThreadPool(jobs or multiprocessing.cpu_count())
+        try:
+            cached = pool.map(lambda paths: render(paths[0], paths[1], "dot", graphviz_args, cache),
+                list(zip(part_paths, layout_paths)))
+        finally:
+            pool.close()
+
+        # Each part is packed as a unit (-g), so its clusters and their links
+        # stay as they are.
+        packer = subprocess.Popen(["gvpack", "-g"] + layout_paths, stdout=subprocess.PIPE)
+        drawer = subprocess.Popen(["neato", "-n2"] + output_args(outputs) + list(graphviz_args),
+            stdin=packer.stdout)
+        # Only neato should have the pipe open, so gvpack notices if it exits.
+        packer.stdout.close()
+        drawer.wait()
+        packer.wait()
+        if packer.returncode != 0:
+            raise subprocess.CalledProcessError(packer.returncode, "gvpack")
+        if drawer.returncode != 0:
+            raise subprocess.CalledProcessError(drawer.returncode, "neato")
+    finally:
+        shutil.rmtree(layout_dir)
+
+    if cache is not None:
+        for out_path, output_format in outputs:
+            cache.store(keys[out_path], output_format, out_path)
+
+    return sum(1 for part_cached in cached if part_cached)
+
+def main(args):
+    """
+    Parses command line arguments, and does the work of the program.
+    "args" specifies the program arguments, with args[0] being the executable
+    name. The return value should be used as the program's exit code.
+    """
+
+    options = parse_args(args)
+
+    cache = None
+    if not options.no_cache:
+        cache = RenderCache(options.cache_dir, int(options.cache_size * 1024 * 1024))
+
+    graphviz_args = profile_args(options.profile)
+    outputs = output_list(options.out, options.format)
+    out_names = ", ".join(options.out)
+
+    if options.parts is None:
+        start_time = time.time()
+        cached = render_outputs(options.dot, outputs, graphviz_args, cache, options.positioned)
+        if cached == len(outputs):
+            sys.stderr.write("{}: copied from the render cache\n".format(out_names))
+        elif len(outputs) > 1:
+            sys.stderr.write("{}: drew from one layout in {:.2f}s ({} of {} formats from the render cache)\n".format(
+                out_names, time.time() - start_time, cached, len(outputs)))
+        return 0
+
+    if options.compare:
+        # Time the actual layouts, not copies from the cache.
+        cache = None
+
+    start_time = time.time()
+    cached = render_parts(options.parts, outputs, graphviz_args, cache, options.jobs)
+    parts_seconds = time.time() - start_time
+    sys.stderr.write("{}: laid out {} parts with up to {} dot processes in {:.2f}s ({} from the render cache)\n".format(
+        out_names, len(options.parts), options.jobs, parts_seconds, cached))
+
+    if options.compare:
+        # Draw the whole diagram in one dot process too, next to the real outputs.
+        single_outputs = []
+        for out_path, output_format in outputs:
+            handle, single_path = tempfile.mkstemp(suffix=os.path.splitext(out_path)[1],
+                dir=os.path.dirname(os.path.abspath(out_path)))
+            os.close(handle)
+            single_outputs.append((single_path, output_format))
+        try:
+            start_time = time.time()
+            render_outputs(options.dot, single_outputs, graphviz_args)
+            single_seconds = time.time() - start_time
+        finally:
+            for single_path, output_format in single_outputs:
+                os.remove(single_path)
+        sys.stderr.write("{}: one dot process took {:.2f}s for the whole diagram, so the parts were {:.1f}x as fast\n".format(
+            options.dot, single_seconds, single_seconds / max(parts_seconds, 0.001)))
+
+    return 0
+
+if __name__ == "__main__" :
+    sys.exit(main(sys.argv))
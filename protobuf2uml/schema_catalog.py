@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+"""
+A SQLite file which keeps what the UML generators found in each schema file,
+so that running them again only has to parse the files that changed.
+
+Everything found in a file (its types, their fields, and the containments, ID
+targets and ID references that come from them) is stored under the SHA-1 hash
+of the file's contents. A separate table says which files, by path and in which
+order, make up the diagram, and which cluster each one is drawn in. When a file
+changes, its new contents are parsed and stored under the new hash, and the
+rows for the old hash are deleted once no file uses them any more. Rows for
+unchanged files are never touched.
+
+Some things depend on more than one file, like which type a field type name
+refers to. A generator can store these "resolved" rows for each file's contents
+along with a key for what they depend on, e.g. a hash of the names of all the
+types. They are only worked out again when that key changes. The rest, like
+whether an ID target is ambiguous, is worked out from the stored rows each time
+a diagram is drawn.
+
+The schema urls and type header comments files are stored the same way, as
+name and value pairs, and only re-read when their hash changes.
+"""
+
+import sqlite3, hashlib
+
+# Bump this when the tables change. A catalog made with a different version has
+# to be deleted and built again.
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, hash TEXT, cluster TEXT, position INTEGER);
+CREATE INDEX IF NOT EXISTS sources_by_hash ON sources (hash);
+CREATE INDEX IF NOT EXISTS sources_by_position ON sources (position);
+CREATE TABLE IF NOT EXISTS contents (hash TEXT PRIMARY KEY, resolved_with TEXT);
+CREATE TABLE IF NOT EXISTS types (hash TEXT, seq INTEGER, type_name TEXT, namespace TEXT);
+CREATE INDEX IF NOT EXISTS types_by_hash ON types (hash, seq);
+CREATE INDEX IF NOT EXISTS types_by_name ON types (type_name);
+CREATE TABLE IF NOT EXISTS fields (hash TEXT, type_name TEXT, seq INTEGER, field_name TEXT, field_type TEXT);
+CREATE INDEX IF NOT EXISTS fields_by_type ON fields (hash, type_name, seq);
+CREATE TABLE IF NOT EXISTS containments (hash TEXT, container TEXT, field TEXT, used TEXT, namespace TEXT);
+CREATE INDEX IF NOT EXISTS containments_by_hash ON containments (hash);
+CREATE TABLE IF NOT EXISTS id_targets (hash TEXT, target TEXT, type_name TEXT);
+CREATE INDEX IF NOT EXISTS id_targets_by_hash ON id_targets (hash);
+CREATE TABLE IF NOT EXISTS id_references (hash TEXT, referencer TEXT, destination TEXT, field TEXT);
+CREATE INDEX IF NOT EXISTS id_references_by_hash ON id_references (hash);
+CREATE TABLE IF NOT EXISTS edge_sources (hash TEXT, path TEXT, type_name TEXT, field TEXT);
+CREATE INDEX IF NOT EXISTS edge_sources_by_hash ON edge_sources (hash);
+CREATE TABLE IF NOT EXISTS edge_targets (hash TEXT, path TEXT, targets TEXT);
+CREATE INDEX IF NOT EXISTS edge_targets_by_hash ON edge_targets (hash);
+CREATE TABLE IF NOT EXISTS resolved_fields (hash TEXT, type_name TEXT, seq INTEGER, field_name TEXT, field_type TEXT);
+CREATE INDEX IF NOT EXISTS resolved_fields_by_hash ON resolved_fields (hash);
+CREATE TABLE IF NOT EXISTS resolved_containments (hash TEXT, container TEXT, field TEXT, used_as_written TEXT, used TEXT);
+CREATE INDEX IF NOT EXISTS resolved_containments_by_hash ON resolved_containments (hash);
+CREATE TABLE IF NOT EXISTS side_files (kind TEXT PRIMARY KEY, hash TEXT);
+CREATE TABLE IF NOT EXISTS side_values (kind TEXT, name TEXT, value TEXT);
+CREATE INDEX IF NOT EXISTS side_values_by_kind ON side_values (kind);
+"""
+
+# The tables holding what was found in a file, each with a hash column saying
+# which file contents it came from.
+CONTENT_TABLES = ["types", "fields", "containments", "id_targets",
+    "id_references", "edge_sources", "edge_targets"]
+
+# The tables holding rows worked out from a file together with other files.
+RESOLVED_TABLES = ["resolved_fields", "resolved_containments"]
+
+def content_hash(data):
+    """
+    Return the hex SHA-1 hash of a file's contents (bytes or text).
+
+    """
+
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+class SchemaCatalog(object):
+    """
+    A catalog of parsed schema files in a SQLite file, which is created if it
+    doesn't exist yet. Changes are saved by commit().
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        has_tables = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table'").fetchone() is not None
+        if has_tables and version != SCHEMA_VERSION:
+            self.connection.close()
+            raise RuntimeError("{} was made by a different version of this program. Delete it and run again.".format(path))
+
+        self.connection.executescript(SCHEMA)
+        self.connection.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+
+        # How many source files had to be parsed, how many were already in
+        # here, how many old file contents were deleted, and how many files had
+        # their resolved rows worked out again.
+        self.parsed = 0
+        self.reused = 0
+        self.removed = 0
+        self.resolved = 0
+
+    def query(self, sql, parameters=()):
+        """
+        Yield the rows of a query one at a time.
+
+        """
+
+        cursor = self.connection.cursor()
+        cursor.execute(sql, parameters)
+        for row in cursor:
+            yield row
+        cursor.close()
+
+    def set_sources(self, sources):
+        """
+        Make the diagram out of the given list of (path, hash, cluster) tuples,
+        in that order. Only rows for paths which are new, gone, moved or changed
+        are written.
+
+        """
+
+        known = {}
+        for path, file_hash, cluster, position in self.query(
+            "SELECT path, hash, cluster, position FROM sources"):
+            known[path] = (file_hash, cluster, position)
+
+        wanted = set()
+        for position, (path, file_hash, cluster) in enumerate(sources):
+            wanted.add(path)
+            if known.get(path, None) != (file_hash, cluster, position):
+                self.connection.execute("INSERT OR REPLACE INTO sources (path, hash, cluster, position) VALUES (?, ?, ?, ?)",
+                    (path, file_hash, cluster, position))
+
+        for path in known:
+            if path not in wanted:
+                self.connection.execute("DELETE FROM sources WHERE path = ?", (path,))
+
+    def has_contents(self, file_hash):
+        """
+        Return True if the file contents with the given hash have been parsed
+        and stored already. Counts the file as parsed or reused.
+
+        """
+
+        found = self.connection.execute("SELECT 1 FROM contents WHERE hash = ?",
+            (file_hash,)).fetchone() is not None
+        if found:
+            self.reused += 1
+        else:
+            self.parsed += 1
+        return found
+
+    def add_contents(self, file_hash, table_rows):
+        """
+        Store what was found in the file contents with the given hash. Takes a
+        dict from content table name to a list of row tuples, leaving out the
+        hash column.
+
+        """
+
+        self.insert_rows(file_hash, table_rows, CONTENT_TABLES)
+        self.connection.execute("INSERT OR IGNORE INTO contents (hash) VALUES (?)", (file_hash,))
+
+    def insert_rows(self, file_hash, table_rows, allowed_tables):
+        """
+        Insert a dict from table name to a list of row tuples (without the hash
+        column) under the given hash.
+
+        """
+
+        for table, rows in table_rows.items():
+            if table not in allowed_tables:
+                raise RuntimeError("Unknown catalog table {}".format(table))
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info({})".format(table))]
+            self.connection.executemany("INSERT INTO {} ({}) VALUES ({})".format(table, ", ".join(columns),
+                ", ".join(["?"] * len(columns))), [(file_hash,) + tuple(row) for row in rows])
+
+    def used_contents(self):
+        """
+        Return the hashes of the file contents used by the sources, in source
+        order.
+
+        """
+
+        return [file_hash for (file_hash,) in self.query(
+            "SELECT hash FROM sources GROUP BY hash ORDER BY MIN(position)")]
+
+    def resolved_with(self, file_hash):
+        """
+        Return the key the resolved rows for the given file contents were worked
+        out with, or None if they haven't been.
+
+        """
+
+        row = self.connection.execute("SELECT resolved_with FROM contents WHERE hash = ?", (file_hash,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_resolved(self, file_hash, key, table_rows):
+        """
+        Replace the resolved rows for the given file contents with a dict from
+        resolved table name to a list of row tuples (without the hash column),
+        worked out with the given key.
+
+        """
+
+        for table in RESOLVED_TABLES:
+            self.connection.execute("DELETE FROM {} WHERE hash = ?".format(table), (file_hash,))
+        self.insert_rows(file_hash, table_rows, RESOLVED_TABLES)
+        self.connection.execute("UPDATE contents SET resolved_with = ? WHERE hash = ?", (key, file_hash))
+        self.resolved += 1
+
+    def remove_unused_contents(self):
+        """
+        Delete everything stored for file contents which no source uses any
+        more.
+
+        """
+
+        unused = [file_hash for (file_hash,) in self.connection.execute(
+            "SELECT hash FROM contents WHERE hash NOT IN (SELECT hash FROM sources)").fetchall()]
+        for file_hash in unused:
+            for table in CONTENT_TABLES + RESOLVED_TABLES:
+                self.connection.execute("DELETE FROM {} WHERE hash = ?".format(table), (file_hash,))
+            self.connection.execute("DELETE FROM contents WHERE hash = ?", (file_hash,))
+        self.removed += len(unused)
+
+    def set_side_file(self, kind, data, read_values):
+        """
+        Keep the (name, value) pairs of a side file, like the schema urls or the
+        type header comments, under the given kind. data is the file's contents,
+        or None if there isn't one. read_values(data) is only called to get the
+        pairs when the contents changed.
+
+        """
+
+        file_hash = content_hash(data) if data is not None else None
+        row = self.connection.execute("SELECT hash FROM side_files WHERE kind = ?", (kind,)).fetchone()
+        if row is not None and row[0] == file_hash:
+            return
+
+        self.connection.execute("DELETE FROM side_values WHERE kind = ?", (kind,))
+        if data is not None:
+            self.connection.executemany("INSERT INTO side_values (kind, name, value) VALUES (?, ?, ?)",
+                [(kind, name, value) for name, value in read_values(data)])
+        self.connection.execute("INSERT OR REPLACE INTO side_files (kind, hash) VALUES (?, ?)", (kind, file_hash))
+
+    def side_values(self, kind):
+        """
+        Return the (name, value) pairs of a side file as a dict.
+
+        """
+
+        return dict(self.query("SELECT name, value FROM side_values WHERE kind = ?", (kind,)))
+
+    def types(self):
+        """
+        Yield (hash, cluster, type name, namespace) for every type in every
+        source, in source order and then in the order they were found.
+
+        """
+
+        return self.query("SELECT types.hash, sources.cluster, types.type_name, types.namespace "
+            "FROM sources JOIN types ON types.hash = sources.hash ORDER BY sources.position, types.seq")
+
+    def rows_for(self, file_hash, table, columns):
+        """
+        Yield the given columns of the rows of a table for one file's contents,
+        in the order they were added.
+
+        """
+
+        return self.query("SELECT {} FROM {} WHERE hash = ? ORDER BY rowid".format(
+            ", ".join(columns), table), (file_hash,))
+
+    def rows(self, table, columns):
+        """
+        Yield (hash, columns...) for every row of a content table that belongs
+        to a source, in source order. Contents used by more than one source only
+        come up once.
+
+        """
+
+        return self.query("SELECT {0}.hash, {1} FROM {0} JOIN (SELECT hash, MIN(position) AS position "
+            "FROM sources GROUP BY hash) AS used ON {0}.hash = used.hash ORDER BY used.position, {0}.rowid".format(
+            table, ", ".join("{}.{}".format(table, column) for column in columns)))
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def report(self):
+        """
+        Return a one-line summary of how much parsing the catalog saved.
+
+        """
+
+        summary = "catalog {}: parsed {} files, reused {}, removed {} old versions".format(
+            self.path, self.parsed, self.reused, self.removed)
+        if self.resolved > 0:
+            summary += ", resolved type names in {}".format(self.resolved)
+        return summary
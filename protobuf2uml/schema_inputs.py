@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+"""
+Opens the schema files the UML generators read, whether they are plain files,
+compressed files (.gz, .bz2, or .xz on Python 3), or members of .tar, .tar.gz,
+.tgz, .tar.bz2, .tar.xz or .zip archives, e.g. a schema bundle from an artifact
+store:
+
+python avpr2uml.py --avprs schemas.tar.gz --members "*.avpr" --dot uml.dot
+
+Everything is decompressed as it is read, straight into the parser. Nothing is
+extracted to disk. Archive members are picked by shell-style patterns (see
+--members), matched against both the path in the archive and the file name.
+A member is known by the archive's path, a "!", and its path in the archive,
+e.g. schemas.tar.gz!avro/reads.avpr.
+
+The compression and archive modules are only imported once a file needs them,
+so plain inputs don't pay for loading them.
+"""
+
+import argparse, os, io, fnmatch
+
+# Suffixes of archives, which hold many files.
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".zip")
+
+# Suffixes of single compressed files.
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz")
+
+def input_path(path):
+    """
+    argparse type for schema inputs: makes sure the file exists, and returns
+    its path to be opened later with iter_inputs() or open_input().
+
+    """
+
+    if not os.path.isfile(path):
+        raise argparse.ArgumentTypeError("can't open '{}': no such file".format(path))
+    return path
+
+def is_archive(path):
+    """
+    Return True if the file at path is an archive (by its name).
+
+    """
+
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+def strip_compression(name):
+    """
+    Return the given file name without a compression suffix, e.g. reads.avpr
+    for reads.avpr.gz.
+
+    """
+
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def base_name(name):
+    """
+    Return the file name part of a path, or of an archive member name like
+    schemas.tar.gz!avro/reads.avpr (reads.avpr).
+
+    """
+
+    return name.replace("!", "/").split("/")[-1]
+
+def open_compressed(path):
+    """
+    Open the file at path for reading bytes, decompressing it as it is read if
+    its name ends in .gz, .bz2 or .xz.
+
+    """
+
+    lowered = path.lower()
+    if lowered.endswith(".gz"):
+        import gzip
+        return gzip.open(path, "rb")
+    if lowered.endswith(".bz2"):
+        import bz2
+        return bz2.BZ2File(path, "rb")
+    if lowered.endswith(".xz"):
+        try:
+            import lzma
+        except ImportError:
+            # Python 2 has no lzma, so .xz files can't be read there.
+            raise IOError("Reading {} needs Python 3, for lzma".format(path))
+        return lzma.open(path, "rb")
+    return io.open(path, "rb")
+
+def member_matches(member_name, patterns):
+    """
+    Return True if the path of an archive member, or its file name, matches any
+    of the given shell-style patterns.
+
+    """
+
+    member_base = base_name(member_name)
+    return any(fnmatch.fnmatch(member_name, pattern) or fnmatch.fnmatch(member_base, pattern)
+        for pattern in patterns)
+
+class SchemaInput(object):
+    """
+    A schema file being read, from wherever it came from, with the name it is
+    known by (as .name, like a real file object). Reads return bytes.
+
+    """
+
+    def __init__(self, stream, name):
+        self.stream = stream
+        self.name = name
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.stream.read()
+        return self.stream.read(size)
+
+    def close(self):
+        self.stream.close()
+
+def iter_archive(path, patterns):
+    """
+    Yield a SchemaInput for each file in the archive at path that matches one of
+    the given patterns, in the order they are stored in. A tar archive is read
+    in one pass as a stream, so each SchemaInput has to be read before the next
+    one is asked for.
+
+    """
+
+    if path.lower().endswith(".zip"):
+        import zipfile
+        archive = zipfile.ZipFile(path)
+        try:
+            for info in archive.infolist():
+                if not info.filename.endswith("/") and member_matches(info.filename, patterns):
+                    yield SchemaInput(archive.open(info), "{}!{}".format(path, info.filename))
+        finally:
+            archive.close()
+        return
+
+    # "r|*" reads the (maybe compressed) tar file front to back, without
+    # seeking, so each member is only decompressed once.
+    import tarfile
+    archive = tarfile.open(path, "r|*")
+    try:
+        for member in archive:
+            if member.isfile() and member_matches(member.name, patterns):
+                yield SchemaInput(archive.extractfile(member), "{}!{}".format(path, member.name))
+    finally:
+        archive.close()
+
+def iter_inputs(paths, patterns):
+    """
+    Yield a SchemaInput for each of the given paths, or for each matching file
+    in it if it is an archive. Files are only opened when it is their turn.
+
+    """
+
+    for path in paths:
+        if is_archive(path):
+            for schema_input in iter_archive(path, patterns):
+                yield schema_input
+        else:
+            yield SchemaInput(open_compressed(path), path)
+
+class ChainedInput(object):
+    """
+    Reads a series of SchemaInputs as if they were one file, e.g. serialized
+    FileDescriptorSets, which can be joined together to make one set.
+
+    """
+
+    def __init__(self, inputs, name):
+        self.inputs = iter(inputs)
+        self.current = None
+        self.name = name
+
+    def read(self, size=-1):
+        chunks = []
+        wanted = size
+        while size is None or size < 0 or wanted > 0:
+            if self.current is None:
+                self.current = next(self.inputs, None)
+                if self.current is None:
+                    break
+            chunk = self.current.read() if size is None or size < 0 else self.current.read(wanted)
+            if size is None or size < 0 or len(chunk) < wanted:
+                # This one is finished, so go on to the next.
+                self.current = None
+            if size is not None and size >= 0:
+                wanted -= len(chunk)
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+
+def open_input(path, patterns):
+    """
+    Open one schema input at path for reading bytes. If it is an archive, the
+    files in it that match the patterns are read one after the other, as one
+    stream.
+
+    """
+
+    if is_archive(path):
+        return ChainedInput(iter_archive(path, patterns), path)
+    return SchemaInput(open_compressed(path), path)
+
+class SchemaSource(object):
+    """
+    Opens schema files by name from a directory or an archive, e.g. the .avpr
+    file for each of avpr2uml.py's --clusters. In a directory, a compressed
+    copy (e.g. reads.avpr.gz) is used if there is no plain one.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # For archives: a dict from file name to member, filled in on the first
+        # open().
+        self.members = None
+        self.archive = None
+
+    def open(self, file_name):
+        """
+        Return a SchemaInput for the file with the given name. Raises IOError
+        if there is no such file.
+
+        """
+
+        if not is_archive(self.path):
+            for suffix in ("",) + COMPRESSED_SUFFIXES:
+                path = os.path.join(self.path, file_name + suffix)
+                if os.path.isfile(path):
+                    return SchemaInput(open_compressed(path), path)
+            raise IOError("No file {} in {}".format(file_name, self.path))
+
+        if self.members is None:
+            self.index_archive()
+        if file_name not in self.members:
+            raise IOError("No file {} in {}".format(file_name, self.path))
+        member_name, contents = self.members[file_name]
+        if contents is None:
+            contents = self.archive.open(member_name)
+        else:
+            contents = io.BytesIO(contents)
+        return SchemaInput(contents, "{}!{}".format(self.path, member_name))
+
+    def index_archive(self):
+        """
+        Find every file in the archive by name. Zip archives can open any file
+        at any time. A compressed tar archive can only be read front to back
+        without decompressing it again for every file, so its files are read
+        into memory in that one pass (they would all be parsed into memory
+        anyway).
+
+        """
+
+        self.members = {}
+        if self.path.lower().endswith(".zip"):
+            import zipfile
+            self.archive = zipfile.ZipFile(self.path)
+            for info in self.archive.infolist():
+                if not info.filename.endswith("/"):
+                    self.members.setdefault(base_name(info.filename), (info.filename, None))
+        else:
+            import tarfile
+            archive = tarfile.open(self.path, "r|*")
+            try:
+                for member in archive:
+                    if member.isfile() and base_name(member.name) not in self.members:
+                        self.members[base_name(member.name)] = (member.name, archive.extractfile(member).read())
+            finally:
+                archive.close()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+Waits for schema files to change, for the --watch mode of make_uml.sh.
+
+On Linux, the kernel's inotify interface is used (through ctypes, so nothing
+has to be installed), and a change is noticed as soon as the file is saved.
+Everywhere else, or if inotify can't be used, the directories are checked for
+changed modification times and sizes every half second instead.
+
+Editors often save a file in several steps (e.g. write a temporary file and
+rename it over the old one), and people often save several files in a row. So
+once something changed, wait_for_changes() keeps collecting changes until
+nothing has happened for a short while, and then returns them all at once.
+"""
+
+import sys, os, time, struct, select, errno, ctypes, ctypes.util
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+# Saving a file in place ends with IN_CLOSE_WRITE. Saving it by renaming a new
+# file over it gives IN_MOVED_TO, and deleting or renaming it away gives
+# IN_DELETE or IN_MOVED_FROM.
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+# Each event is an int watch descriptor, a uint32 mask, a uint32 cookie and a
+# uint32 name length, followed by the (zero-padded) name.
+EVENT_HEADER = struct.Struct("iIII")
+
+class InotifyWatcher(object):
+    """
+    Watches directories with inotify. Raises OSError if inotify can't be used.
+
+    """
+
+    def __init__(self, directories, suffixes):
+        self.suffixes = tuple(suffixes)
+
+        library_name = ctypes.util.find_library("c") or "libc.so.6"
+        libc = ctypes.CDLL(library_name, use_errno=True)
+        if not hasattr(libc, "inotify_init"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+
+        # Which directory each watch descriptor is for.
+        self.directories = {}
+        for directory in directories:
+            watch = libc.inotify_add_watch(self.fd, os.path.abspath(directory).encode(sys.getfilesystemencoding()),
+                WATCH_MASK)
+            if watch < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, "Can't watch {}".format(directory))
+            self.directories[watch] = directory
+
+    def read_changes(self, timeout=None):
+        """
+        Wait up to timeout seconds (or forever if None) for files to change, and
+        return the set of paths of the changed files. Returns an empty set if
+        nothing changed in time.
+
+        """
+
+        readable = select.select([self.fd], [], [], timeout)[0]
+        if not readable:
+            return set()
+
+        data = os.read(self.fd, 65536)
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            watch, mask, cookie, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+
+            if mask & IN_Q_OVERFLOW:
+                # Too many events to keep track of, so anything could have
+                # changed.
+                for directory in self.directories.values():
+                    changed.update(list_files(directory, self.suffixes))
+                continue
+
+            if not isinstance(name, str):
+                name = name.decode(sys.getfilesystemencoding())
+            if watch in self.directories and name.endswith(self.suffixes):
+                changed.add(os.path.join(self.directories[watch], name))
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher(object):
+    """
+    Watches directories by looking at them every interval seconds.
+
+    """
+
+    def __init__(self, directories, suffixes, interval=0.5):
+        self.directories = list(directories)
+        self.suffixes = tuple(suffixes)
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        """
+        Return a dict from path to (modification time, size) for every watched
+        file.
+
+        """
+
+        snapshot = {}
+        for directory in self.directories:
+            for path in list_files(directory, self.suffixes):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # It went away while we were looking.
+                    continue
+                snapshot[path] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def read_changes(self, timeout=None):
+        """
+        Like InotifyWatcher.read_changes().
+
+        """
+
+        waited = 0.0
+        while True:
+            time.sleep(self.interval if timeout is None else min(self.interval, timeout))
+            waited += self.interval
+            new_snapshot = self.take_snapshot()
+            changed = set(path for path in set(self.snapshot) | set(new_snapshot)
+                if self.snapshot.get(path, None) != new_snapshot.get(path, None))
+            self.snapshot = new_snapshot
+            if changed or (timeout is not None and waited >= timeout):
+                return changed
+
+    def close(self):
+        pass
+
+def list_files(directory, suffixes):
+    """
+    Return the paths of the files in directory whose names end with one of the
+    given suffixes, in sorted order.
+
+    """
+
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+        if name.endswith(tuple(suffixes))]
+
+def make_watcher(directories, suffixes, polling=False):
+    """
+    Return an InotifyWatcher for the given directories, watching files with the
+    given suffixes, or a PollingWatcher if inotify can't be used or polling is
+    True.
+
+    """
+
+    if not polling:
+        try:
+            return InotifyWatcher(directories, suffixes)
+        except (OSError, AttributeError) as error:
+            sys.stderr.write("Can't use inotify ({}), checking for changes every half second instead\n".format(error))
+    return PollingWatcher(directories, suffixes)
+
+def wait_for_changes(watcher, debounce=0.3):
+    """
+    Wait until files change, and then until nothing else has changed for
+    debounce seconds. Returns the set of paths of all the files that changed.
+
+    """
+
+    changed = set()
+    while not changed:
+        changed.update(watcher.read_changes(None))
+
+    while True:
+        more = watcher.read_changes(debounce)
+        if not more:
+            return changed
+        changed.update(more)
+
+def with_importers(changed, imports):
+    """
+    Given a set of changed schema names and a dict from each schema name to the
+    names it imports, return the changed names together with every name that
+    imports one of them, directly or not.
+
+    """
+
+    affected = set(changed)
+    grew = True
+    while grew:
+        grew = False
+        for name, imported in imports.items():
+            if name not in affected and affected.intersection(imported):
+                affected.add(name)
+                grew = True
+    return affected
@@ -0,0 +1,107 @@
+#! /usr/bin/python
+
+"""
+startup_benchmark.py: time how long descriptor2uml.py takes from a cold start, the way CI runs it thousands of times,
+each time in a new python process:
+
+python startup_benchmark.py --runs 20
+
+Three things are timed, --runs times each: python starting and doing nothing (what no change to descriptor2uml.py can
+make faster), descriptor2uml.py --help, and descriptor2uml.py drawing a small FileDescriptorSet (by default one .proto
+file with one message, written for the benchmark, or --descriptor). The fastest and the median run of each are printed
+in milliseconds, along with the protobuf version and the backend it uses to parse messages (upb or cpp are much faster
+than python).
+
+With PYTHONDONTWRITEBYTECODE set, python compiles every module again on every run, which is slower. Run
+python -m compileall . first to time starts the way they are once the compiled files exist (CI can keep them too).
+"""
+
+import argparse, sys, os, subprocess, tempfile, time
+
+def parse_args(args):
+
+    args = args[1:]
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--runs", type=int, default=20,
+        help="how many times to start each command")
+    parser.add_argument("--descriptor", type=str, default=None,
+        help="FileDescriptorSet to draw (default: a small one written for the benchmark)")
+    parser.add_argument("--script", type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "descriptor2uml.py"),
+        help="descriptor2uml.py to time")
+    parser.add_argument("--python", type=str, default=sys.executable,
+        help="python to run it with")
+
+    options = parser.parse_args(args)
+    if options.runs < 1:
+        parser.error("--runs has to be at least 1")
+
+    return options
+
+# Writes a FileDescriptorSet holding one .proto file with one message with one field to path.
+def write_small_descriptor(path):
+    from google.protobuf.descriptor_pb2 import FileDescriptorSet, FieldDescriptorProto
+
+    descriptor = FileDescriptorSet()
+    cluster = descriptor.file.add()
+    cluster.name = "small.proto"
+    cluster.package = "small"
+    message = cluster.message_type.add()
+    message.name = "Small"
+    field = message.field.add()
+    field.name = "id"
+    field.number = 1
+    field.label = FieldDescriptorProto.LABEL_OPTIONAL
+    field.type = FieldDescriptorProto.TYPE_STRING
+    with open(path, "wb") as descriptor_file:
+        descriptor_file.write(descriptor.SerializeToString())
+
+# Returns the protobuf version and backend that descriptor2uml.py gets, e.g. "3.20.3 (upb)".
+def protobuf_backend(python):
+    output = subprocess.check_output([python, "-c", "import google.protobuf\n"
+        "from google.protobuf.internal import api_implementation\n"
+        "print('{} ({})'.format(google.protobuf.__version__, api_implementation.Type()))"])
+    return output.decode("utf-8").strip()
+
+# Runs command runs times, and returns the list of how many seconds each run took. Raises an exception if it fails.
+def time_command(command, runs):
+    seconds = []
+    with open(os.devnull, "wb") as devnull:
+        for run in range(runs):
+            start_time = time.time()
+            subprocess.check_call(command, stdout=devnull, stderr=devnull)
+            seconds.append(time.time() - start_time)
+    return seconds
+
+def main(args):
+    options = parse_args(args)
+
+    temp_dir = tempfile.mkdtemp(prefix="startup_benchmark")
+    try:
+        descriptor_path = options.descriptor
+        if descriptor_path is None:
+            descriptor_path = os.path.join(temp_dir, "small.pb")
+            write_small_descriptor(descriptor_path)
+
+        commands = [
+            ("python", [options.python, "-c", "pass"]),
+            ("--help", [options.python, options.script, "--help"]),
+            (os.path.basename(descriptor_path), [options.python, options.script, "--descriptor", descriptor_path,
+                "--dot", os.path.join(temp_dir, "small.dot")]),
+        ]
+
+        sys.stdout.write("protobuf {}\n".format(protobuf_backend(options.python)))
+        if os.environ.get("PYTHONDONTWRITEBYTECODE"):
+            sys.stdout.write("PYTHONDONTWRITEBYTECODE is set, so modules that weren't compiled before are compiled again on every run\n")
+        for name, command in commands:
+            seconds = sorted(time_command(command, options.runs))
+            sys.stdout.write("{}: fastest {:.1f}ms, median {:.1f}ms over {} runs\n".format(name, seconds[0] * 1000,
+                seconds[len(seconds) // 2] * 1000, options.runs))
+    finally:
+        for file_name in os.listdir(temp_dir):
+            os.remove(os.path.join(temp_dir, file_name))
+        os.rmdir(temp_dir)
+
+if __name__ == "__main__" :
+    sys.exit(main(sys.argv))
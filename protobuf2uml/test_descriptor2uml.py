@@ -0,0 +1,107 @@
+#! /usr/bin/python
+
+"""
+Checks that descriptor2uml.py --stream and --catalog draw the same diagram as the usual in-memory run, on a small
+FileDescriptorSet made here. Run them with:
+
+python -m unittest discover
+"""
+
+import os, sys, shutil, subprocess, tempfile, unittest
+
+# Adds a field to message, of a message or enum type_name if given, or a string otherwise.
+def add_field(message, name, number, type_name=None, repeated=False, enum=False):
+    from google.protobuf.descriptor_pb2 import FieldDescriptorProto
+
+    field = message.field.add()
+    field.name = name
+    field.number = number
+    field.label = FieldDescriptorProto.LABEL_REPEATED if repeated else FieldDescriptorProto.LABEL_OPTIONAL
+    if type_name is None:
+        field.type = FieldDescriptorProto.TYPE_STRING
+    else:
+        field.type = FieldDescriptorProto.TYPE_ENUM if enum else FieldDescriptorProto.TYPE_MESSAGE
+        field.type_name = type_name
+
+# Returns a serialized FileDescriptorSet of two files, with a nested message, a reference to a type in the other file,
+# an enum, ID references and a cycle.
+def small_descriptor():
+    from google.protobuf.descriptor_pb2 import FileDescriptorSet
+
+    descriptor = FileDescriptorSet()
+    common = descriptor.file.add()
+    common.name = "common.proto"
+    common.package = "ga4gh"
+    position = common.message_type.add()
+    position.name = "Position"
+    add_field(position, "reference_name", 1)
+    add_field(position, "strand", 2, ".ga4gh.Strand", enum=True)
+    strand = common.enum_type.add()
+    strand.name = "Strand"
+    strand.value.add(name="POS_STRAND", number=0)
+    dataset = common.message_type.add()
+    dataset.name = "Dataset"
+    add_field(dataset, "id", 1)
+
+    reads = descriptor.file.add()
+    reads.name = "reads.proto"
+    reads.package = "ga4gh"
+    reads.dependency.append("common.proto")
+    read_group = reads.message_type.add()
+    read_group.name = "ReadGroup"
+    add_field(read_group, "id", 1)
+    add_field(read_group, "dataset_id", 2)
+    add_field(read_group, "stats", 3, ".ga4gh.ReadGroup.Stats")
+    add_field(read_group, "alignments", 4, ".ga4gh.ReadAlignment", repeated=True)
+    stats = read_group.nested_type.add()
+    stats.name = "Stats"
+    add_field(stats, "aligned_read_count", 1)
+    alignment = reads.message_type.add()
+    alignment.name = "ReadAlignment"
+    add_field(alignment, "id", 1)
+    add_field(alignment, "read_group_id", 2)
+    add_field(alignment, "alignment", 3, ".ga4gh.Position")
+    add_field(alignment, "group", 4, ".ga4gh.ReadGroup")
+    return descriptor.SerializeToString()
+
+class SameDiagramTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.descriptor = os.path.join(self.temp_dir, "MyFileDescriptorSet.pb")
+        with open(self.descriptor, "wb") as descriptor_file:
+            descriptor_file.write(small_descriptor())
+        self.urls = os.path.join(self.temp_dir, "schema_urls")
+        with open(self.urls, "w") as url_file:
+            for name in ["common.proto", "reads.proto"]:
+                url_file.write("https://github.com/ga4gh/schemas/blob/master/src/main/proto/ga4gh/{}\n".format(name))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    # Runs descriptor2uml.py with the given extra arguments, and returns the sorted lines of the .dot file it wrote.
+    def draw(self, dot_name, *extra_args):
+        dot_path = os.path.join(self.temp_dir, dot_name)
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "descriptor2uml.py"),
+                "--descriptor", self.descriptor, "--urls", self.urls, "--dot", dot_path] + list(extra_args), stderr=devnull)
+        with open(dot_path, "r") as dot_file:
+            return sorted(dot_file.read().splitlines())
+
+    def test_stream(self):
+        self.assertEqual(self.draw("stream.dot", "--stream"), self.draw("memory.dot"))
+
+    def test_catalog(self):
+        memory = self.draw("memory.dot")
+        catalog = os.path.join(self.temp_dir, "catalog.sqlite")
+        self.assertEqual(self.draw("first.dot", "--catalog", catalog), memory)
+        # The second time everything comes from the catalog.
+        self.assertEqual(self.draw("second.dot", "--catalog", catalog), memory)
+
+    def test_diagram_has_the_types(self):
+        text = "\n".join(self.draw("memory.dot"))
+        for type_name in ["Position", "Strand", "ReadGroup", "Stats", "ReadAlignment"]:
+            self.assertIn(">{}<".format(type_name), text)
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,216 @@
+#! /usr/bin/python
+
+"""
+watch_uml.py: redraw the UML diagram every time a .proto file in schemas_proto is saved, e.g. while designing a schema.
+make_uml.sh --watch runs this after the first full build.
+
+Only the .proto files that changed, and the files that import them, are compiled again with protoc (each one into its
+own FileDescriptorSet) and parsed again. What was parsed from every other file stays in memory between rebuilds.
+Then uml.dot is written again and drawn to uml.svg (through render_uml.py's cache, so going back to an earlier version
+of the schema is instant), with the same --detail, --cycles and --parts options as the full build. Bursts of saves are
+collected into one rebuild.
+
+If a file can't be compiled (e.g. it is half-way through being edited), protoc's error is printed and the diagram is
+left as it was until the next save. Press Ctrl-C to stop.
+
+"""
+
+import argparse, sys, os, io, time, subprocess, tempfile
+import descriptor2uml, render_uml, svg_minify, schema_watch, build_cache, schema_graph, detail_levels
+
+def parse_args(args):
+
+    args = args[1:]
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--proto_dir", type=str, default="schemas_proto",
+        help="directory of .proto files to watch")
+    parser.add_argument("--dot", type=str, default="uml.dot",
+        help="GraphViz file to write the UML diagram to")
+    parser.add_argument("--svg", type=str, default="uml.svg",
+        help="where to draw the UML diagram")
+    parser.add_argument("--type_comments", type=str, default=None,
+        help="tab-delimited file with type names and type header comments")
+    parser.add_argument("--urls", type=str, default=None,
+        help="file with links to original schema files")
+    parser.add_argument("--minify", action="store_true",
+        help="run the .svg through svg_minify.py and also write a .svgz")
+    parser.add_argument("--debounce", type=float, default=0.3,
+        help="seconds to wait after a save for more saves before rebuilding")
+    parser.add_argument("--poll", action="store_true",
+        help="check for changes every half second instead of using inotify")
+    parser.add_argument("--profile", type=str, default=None, choices=sorted(render_uml.LAYOUT_PROFILES),
+        help="render_uml.py layout profile to draw with (e.g. draft, for quick redraws), with the types written in layout hint order")
+    parser.add_argument("--detail", type=str, default="full", choices=detail_levels.DETAIL_LEVELS,
+        help="draw types as full tables, with only the fields that have edges, or as just a header (see descriptor2uml.py)")
+    parser.add_argument("--cycles", type=str, default=None, choices=schema_graph.CYCLE_MODES,
+        help="break or group cycles of types, like descriptor2uml.py --cycles")
+    parser.add_argument("--parts", type=str, default=None,
+        help="directory to write each unconnected part of the diagram to, and draw the diagram from, like make_uml.sh does")
+
+    return parser.parse_args(args)
+
+# Compiles one .proto file with protoc and returns what parse_one_cluster() finds in it.
+# Raises an exception with protoc's error if it doesn't compile.
+def compile_and_parse(options, proto_name):
+    handle, descriptor_path = tempfile.mkstemp(suffix=".pb")
+    os.close(handle)
+    try:
+        process = subprocess.Popen(["protoc", "--include_source_info", "-I", options.proto_dir, "-o", descriptor_path,
+            os.path.join(options.proto_dir, proto_name)], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        if process.returncode != 0:
+            raise RuntimeError("protoc could not compile {}:\n{}".format(proto_name, output.decode("utf-8", "replace")))
+        # Without --include_imports, the set only holds this one file.
+        with open(descriptor_path, "rb") as descriptor_file:
+            clusters = list(descriptor2uml.iter_file_descriptors(descriptor_file))
+        return descriptor2uml.parse_one_cluster(clusters[0])
+    finally:
+        os.remove(descriptor_path)
+
+def read_optional(path):
+    return open(path, "r") if path is not None else None
+
+# A label cache for one rebuild, which takes labels from the labels of the last rebuild. Afterwards, used holds just the
+# labels this rebuild used, so labels of types that changed since are dropped instead of piling up.
+class LabelsInUse(object):
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.used = {}
+
+    def __contains__(self, key):
+        return key in self.used or key in self.labels
+
+    def __getitem__(self, key):
+        if key not in self.used:
+            self.used[key] = self.labels[key]
+        return self.used[key]
+
+    def __setitem__(self, key, label):
+        self.used[key] = label
+
+# Writes the .dot file for the given dict from .proto file name to parsed file, and draws it. label_cache is a dict of
+# the labels used last time, and is left holding the ones used this time. Returns (seconds spent writing, seconds spent
+# drawing).
+def rebuild(options, parsed_files, label_cache, render_cache):
+    start_time = time.time()
+
+    # Files are in name order, like protoc gets them from make_uml.sh.
+    (fields, containments, nests, matched_references, matched_edges, clusters) = descriptor2uml.combine_parsed_clusters(
+        [parsed_files[proto_name] for proto_name in sorted(parsed_files)])
+
+    layout_hints = None
+    if options.profile is not None:
+        layout_hints = schema_graph.layout_hints(fields, clusters,
+            [(container, containee) for container, containee, container_field_name in containments if containee in fields])
+
+    detail = None
+    if options.detail != "full":
+        detail = detail_levels.type_detail_levels(fields, clusters, options.detail)
+
+    cycle_plan = None
+    if options.cycles is not None:
+        # The same edges as descriptor2uml.py ranks by.
+        ranked_edges = [(container, containee) for container, containee, container_field_name in containments if containee in fields]
+        if layout_hints is None:
+            ranked_edges += [(referencer, referencee) for referencer, referencer_field, referencee in matched_references]
+            ranked_edges += [(outgoing[0], target) for outgoing, targets in matched_edges for target in targets]
+        cycle_plan = schema_graph.plan_cycles(fields, ranked_edges, clusters, options.cycles)
+
+    comments_file = read_optional(options.type_comments)
+    urls_file = read_optional(options.urls)
+    try:
+        type_comments = descriptor2uml.read_type_comments(comments_file)
+        urls = descriptor2uml.read_urls(urls_file)
+    finally:
+        for opened in [comments_file, urls_file]:
+            if opened is not None:
+                opened.close()
+
+    labels = LabelsInUse(label_cache)
+
+    # Write a new file and move it into place, so nobody sees half a diagram.
+    with open(options.dot + ".tmp", "w") as dot_file:
+        descriptor2uml.write_graph_with_lookups(fields, containments, nests, matched_references, matched_edges, clusters,
+            type_comments, urls, dot_file, labels, layout_hints, detail, cycle_plan)
+    os.rename(options.dot + ".tmp", options.dot)
+    part_paths = None
+    if options.parts is not None:
+        part_paths = descriptor2uml.write_graph_parts(options.parts, fields, containments, nests, matched_references,
+            matched_edges, clusters, type_comments, urls, labels, layout_hints, detail, cycle_plan)
+    label_cache.clear()
+    label_cache.update(labels.used)
+    written_time = time.time()
+
+    graphviz_args = render_uml.profile_args(options.profile)
+    if part_paths is not None:
+        render_uml.render_parts(part_paths, render_uml.output_list([options.svg]), graphviz_args, render_cache)
+    else:
+        render_uml.render(options.dot, options.svg, graphviz_args=graphviz_args, cache=render_cache)
+    if options.minify:
+        with io.open(options.svg, "r", encoding="utf-8") as svg_file:
+            minified = svg_minify.minify_svg(svg_file.read())
+        with io.open(options.svg, "w", encoding="utf-8") as svg_file:
+            svg_file.write(minified)
+        svg_minify.write_svgz(minified, os.path.splitext(options.svg)[0] + ".svgz")
+
+    return written_time - start_time, time.time() - written_time
+
+def main(args):
+    options = parse_args(args)
+
+    render_cache = render_uml.RenderCache(render_uml.default_cache_dir(), 200 * 1024 * 1024)
+    # Table labels of types which didn't change are re-used between rebuilds.
+    label_cache = {}
+
+    # Start watching first, so that saves during the first build aren't missed.
+    watcher = schema_watch.make_watcher([options.proto_dir], [".proto"], options.poll)
+
+    # Parse everything once. This is the in-memory model which gets updated as files change:
+    # a dict from .proto file name to what was parsed from it.
+    parsed_files = {}
+    for proto_name in build_cache.read_proto_imports(options.proto_dir):
+        parsed_files[proto_name] = compile_and_parse(options, proto_name)
+    rebuild(options, parsed_files, label_cache, render_cache)
+    sys.stderr.write("Drew {} files. Watching {} for changes...\n".format(len(parsed_files), options.proto_dir))
+
+    try:
+        while True:
+            changed_paths = schema_watch.wait_for_changes(watcher, options.debounce)
+            start_time = time.time()
+
+            changed = set(os.path.basename(path) for path in changed_paths)
+            imports = build_cache.read_proto_imports(options.proto_dir)
+            # protoc checks every file against the files it imports, so importers are compiled again too.
+            affected = sorted(proto_name for proto_name in schema_watch.with_importers(changed, imports) if proto_name in imports)
+
+            for proto_name in changed:
+                if proto_name not in imports:
+                    # It was deleted.
+                    parsed_files.pop(proto_name, None)
+
+            try:
+                new_files = {}
+                for proto_name in affected:
+                    new_files[proto_name] = compile_and_parse(options, proto_name)
+                parsed_files.update(new_files)
+                compile_seconds = time.time() - start_time
+
+                write_seconds, draw_seconds = rebuild(options, parsed_files, label_cache, render_cache)
+            except Exception as error:
+                sys.stderr.write("{}\nKeeping the old diagram.\n".format(error))
+                continue
+            sys.stderr.write("Rebuilt after changes to {}: compiled {} files in {:.2f}s, wrote {} in {:.2f}s, drew {} in {:.2f}s\n".format(
+                ", ".join(sorted(changed)), len(affected), compile_seconds, options.dot, write_seconds,
+                options.svg, draw_seconds))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+    return 0
+
+if __name__ == "__main__" :
+    sys.exit(main(sys.argv))